@@ -29,7 +29,9 @@ __all__ = [
     "is_app_engine",
     # Lazy imports below
     "CloudTasksBackend",
+    "CloudTasksLocalBackend",
     "create_oidc_auth_handler",
+    "get_oidc_auth_handler",
     "verify_cloud_tasks_oidc",
 ]
 
@@ -40,10 +42,18 @@ def __getattr__(name):
         from .backends import CloudTasksBackend
 
         return CloudTasksBackend
+    if name == "CloudTasksLocalBackend":
+        from .local import CloudTasksLocalBackend
+
+        return CloudTasksLocalBackend
     if name == "create_oidc_auth_handler":
         from .auth import create_oidc_auth_handler
 
         return create_oidc_auth_handler
+    if name == "get_oidc_auth_handler":
+        from .auth import get_oidc_auth_handler
+
+        return get_oidc_auth_handler
     if name == "verify_cloud_tasks_oidc":
         from .auth import verify_cloud_tasks_oidc
 
@@ -7,3 +7,12 @@ class DjangoTasksCloudTasksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "django_tasks_cloud_tasks"
     verbose_name = "Django Tasks Cloud Tasks Backend"
+
+    def ready(self):
+        from django.conf import settings
+
+        # Optionally do the expensive lazy initialization at startup
+        if getattr(settings, "CLOUD_TASKS_WARMUP_ON_READY", False):
+            from .warmup import warmup
+
+            warmup()
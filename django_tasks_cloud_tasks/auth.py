@@ -1,8 +1,19 @@
-"""Cloud Tasks OIDC authentication."""
+"""
+Cloud Tasks request authentication (OIDC tokens, HMAC signatures and App
+Engine task headers).
+"""
 
+import base64
 import functools
+import hashlib
+import hmac
+import json
 import logging
-import sys
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
 
 from django.http import JsonResponse
 
@@ -14,19 +25,287 @@ GOOGLE_ISSUERS = [
     "accounts.google.com",
 ]
 
+# Public certificates used to sign Google OIDC tokens
+GOOGLE_OAUTH2_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+# The same keys as a JSON Web Key Set
+GOOGLE_OAUTH2_JWKS_URL = "https://www.googleapis.com/oauth2/v3/certs"
 
-def create_oidc_auth_handler(audience):
+# Allowed clock skew for exp/iat checks of the JWKS verifier
+JWKS_CLOCK_SKEW = 10  # seconds
+
+# Header carrying the HMAC signature of the request body
+HMAC_SIGNATURE_HEADER = "X-Django-Tasks-Signature"
+# Accepted age of a signature. Must cover the queue's retry period, since
+# Cloud Tasks redelivers the body (and signature) created at enqueue time.
+DEFAULT_HMAC_MAX_AGE = 3600  # seconds
+HMAC_CLOCK_SKEW = 60  # seconds
+
+# Set by Cloud Tasks on App Engine targets; App Engine removes it from
+# requests coming from outside the application
+APP_ENGINE_QUEUE_HEADER = "X-AppEngine-QueueName"
+
+# Used when the certificate response has no Cache-Control max-age
+DEFAULT_CERTS_MAX_AGE = 300  # seconds
+CERTS_FETCH_TIMEOUT = 5  # seconds
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleCertCache:
+    """
+    Process-wide, thread-safe cache of Google's OIDC public certificates.
+
+    Certificates are kept for the Cache-Control max-age of the response and
+    refreshed in a background thread shortly before they expire, so token
+    verification only blocks on the network for the very first fetch, after
+    an expiry that the background refresh failed to prevent, or when a token
+    is signed by a key that is not cached yet.
+    """
+
+    def __init__(
+        self,
+        url=GOOGLE_OAUTH2_CERTS_URL,
+        refresh_margin=60,
+        min_refresh_interval=30,
+    ):
+        self.url = url
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._certs = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+        return self._session
+
+    def _fetch(self):
+        response = self._get_session().get(self.url, timeout=CERTS_FETCH_TIMEOUT)
+        if response.status_code != 200:
+            from google.auth import exceptions
+
+            raise exceptions.TransportError(
+                f"Could not fetch certificates at {self.url}"
+            )
+
+        max_age = DEFAULT_CERTS_MAX_AGE
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+        if match:
+            max_age = int(match.group(1))
+            age = response.headers.get("Age", "")
+            if age.isdigit():
+                max_age = max(max_age - int(age), 0)
+
+        return response.json(), max_age
+
+    def refresh(self):
+        """
+        Fetch the certificates now, replacing the cached ones.
+
+        Returns:
+            dict: Mapping of key ID to PEM certificate
+        """
+        data, max_age = self._fetch()
+        certs = self.parse(data)
+        now = time.monotonic()
+        with self._lock:
+            self._certs = certs
+            self._fetched_at = now
+            self._expires_at = now + max_age
+        return certs
+
+    def parse(self, data):
+        """Convert the fetched JSON document into the cached mapping."""
+        return data
+
+    def _refresh_in_background(self):
+        try:
+            with self._refresh_lock:
+                self.refresh()
+        except Exception as e:
+            logger.warning(f"Background OIDC certificate refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def _start_background_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_blocking(self, force=False):
+        # Only one thread fetches; the others wait and reuse its result
+        with self._refresh_lock:
+            now = time.monotonic()
+            if self._certs is not None:
+                if force and now - self._fetched_at < self.min_refresh_interval:
+                    return self._certs
+                if not force and now < self._expires_at:
+                    return self._certs
+            return self.refresh()
+
+    def get(self, key_id=None):
+        """
+        Return the cached certificates, fetching them if needed.
+
+        Args:
+            key_id: Key ID of the token being verified. If it is not in the
+                    cache (Google rotated its keys), the certificates are
+                    refetched, at most once per min_refresh_interval.
+
+        Returns:
+            dict: Mapping of key ID to PEM certificate
+        """
+        now = time.monotonic()
+        certs = self._certs
+
+        if certs is None or now >= self._expires_at:
+            return self._refresh_blocking()
+
+        if key_id is not None and key_id not in certs:
+            if now - self._fetched_at >= self.min_refresh_interval:
+                return self._refresh_blocking(force=True)
+            return certs
+
+        if now >= self._expires_at - self.refresh_margin:
+            self._start_background_refresh()
+
+        return certs
+
+    def clear(self):
+        """Drop the cached certificates."""
+        with self._lock:
+            self._certs = None
+            self._expires_at = 0.0
+            self._fetched_at = 0.0
+
+    def _after_fork(self):
+        # Pooled connections must not be shared with the parent process, and
+        # locks or refresh threads of the parent do not exist in the child
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._session = None
+
+
+_cert_cache = GoogleCertCache()
+os.register_at_fork(after_in_child=_cert_cache._after_fork)
+
+
+def get_cert_cache():
+    """Return the process-wide GoogleCertCache."""
+    return _cert_cache
+
+
+def prefetch_oidc_certs():
+    """
+    Fetch Google's OIDC public certificates into the process-wide cache.
+
+    Used during warm-up so the first task execution does not block on
+    the network.
+
+    Returns:
+        dict: Mapping of key ID to PEM certificate (or public key when
+              CLOUD_TASKS_OIDC_VERIFIER is "jwks")
+    """
+    from django.conf import settings
+
+    if getattr(settings, "CLOUD_TASKS_OIDC_VERIFIER", "google-auth") == "jwks":
+        return _jwks_cache.refresh()
+    return _cert_cache.refresh()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified token claims.
+
+    Cloud Tasks reuses an OIDC token for many dispatches until it expires, so
+    the signature of a token seen before does not need to be checked again.
+    Entries are keyed by a SHA-256 hash of the token (the token itself is not
+    kept) and are dropped skew seconds before the token's ``exp``.
+    """
+
+    def __init__(self, maxsize=1024, skew=30):
+        self.maxsize = maxsize
+        self.skew = skew
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Return the cached claims of token, or None."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, token, claims):
+        """Cache the verified claims of token until its expiry."""
+        exp = claims.get("exp")
+        if not exp:
+            return
+        expires_at = exp - self.skew
+        if expires_at <= time.time():
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def create_oidc_auth_handler(audience, token_cache_size=1024, token_cache_skew=30):
     """
     Create OIDC authentication handler.
 
+    Certificates are served from the process-wide GoogleCertCache, and the
+    claims of verified tokens are kept in a VerifiedTokenCache, available
+    as the handler's ``token_cache`` attribute.
+
     Args:
         audience: Audience value for token verification
+        token_cache_size: Maximum number of verified tokens to keep
+        token_cache_skew: Seconds before ``exp`` at which a cached token
+                          is verified again
 
     Returns:
         Authentication handler function
     """
-    from google.auth.transport import requests as google_requests
-    from google.oauth2 import id_token
+    from google.auth import jwt
+
+    token_cache = VerifiedTokenCache(token_cache_size, token_cache_skew)
 
     def auth_handler(request):
         """
@@ -42,10 +321,14 @@ def create_oidc_auth_handler(audience):
 
         token = auth_header[7:]
 
+        if token_cache.get(token) is not None:
+            return True, None
+
         try:
-            claims = id_token.verify_oauth2_token(
+            key_id = jwt.decode_header(token).get("kid")
+            claims = jwt.decode(
                 token,
-                google_requests.Request(),
+                certs=_cert_cache.get(key_id),
                 audience=audience,
             )
 
@@ -53,16 +336,388 @@ def create_oidc_auth_handler(audience):
             if claims.get("iss") not in GOOGLE_ISSUERS:
                 return False, f"Invalid issuer: {claims.get('iss')}"
 
+            token_cache.set(token, claims)
             return True, None
 
         except Exception as e:
-            logger.error(f"OIDC token verification failed: {e}")
-            print(f"OIDC token verification failed: {e}", file=sys.stderr)
+            logger.error("OIDC token verification failed: %s", e)
             return False, str(e)
 
+    auth_handler.token_cache = token_cache
     return auth_handler
 
 
+@functools.cache
+def get_oidc_auth_handler(audience):
+    """
+    Return the OIDC authentication handler for audience.
+
+    Handlers are created once per audience and process, so their verified
+    token cache is shared by all requests.
+    """
+    return create_oidc_auth_handler(audience)
+
+
+def _b64url_decode(value):
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _b64url_int(value):
+    return int.from_bytes(_b64url_decode(value), "big")
+
+
+def _require_cryptography():
+    try:
+        import cryptography  # noqa: F401
+    except ImportError as e:
+        from django.core.exceptions import ImproperlyConfigured
+
+        raise ImproperlyConfigured(
+            "The JWKS verifier requires the cryptography package. Install it "
+            "with: pip install django-tasks-cloud-tasks[jwks]"
+        ) from e
+
+
+class GoogleJWKSCache(GoogleCertCache):
+    """
+    GoogleCertCache for Google's JSON Web Key Set.
+
+    Keys are converted to ``cryptography`` RSA public keys once per fetch
+    instead of once per verification.
+    """
+
+    def __init__(self, url=GOOGLE_OAUTH2_JWKS_URL, **kwargs):
+        super().__init__(url=url, **kwargs)
+
+    def parse(self, data):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        keys = {}
+        for jwk in data.get("keys", []):
+            if jwk.get("kty") != "RSA" or jwk.get("use", "sig") != "sig":
+                continue
+            numbers = rsa.RSAPublicNumbers(_b64url_int(jwk["e"]), _b64url_int(jwk["n"]))
+            keys[jwk["kid"]] = numbers.public_key()
+        return keys
+
+
+_jwks_cache = GoogleJWKSCache()
+os.register_at_fork(after_in_child=_jwks_cache._after_fork)
+
+
+def verify_jwks_token(token, keys, audience, allowed_service_accounts=None):
+    """
+    Verify a Google-signed RS256 OIDC token against a set of public keys.
+
+    Args:
+        token: Encoded JWT
+        keys: Mapping of key ID to RSA public key (see GoogleJWKSCache)
+        audience: Expected ``aud`` claim
+        allowed_service_accounts: If given, the ``email`` claim must be one
+                                  of these (verified) addresses
+
+    Returns:
+        dict: Verified claims
+
+    Raises:
+        ValueError: If the token is malformed or fails verification
+    """
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    try:
+        signing_input, signature = token.encode().rsplit(b".", 1)
+        header_segment, payload_segment = signing_input.split(b".")
+        header = json.loads(_b64url_decode(header_segment.decode()))
+        claims = json.loads(_b64url_decode(payload_segment.decode()))
+        signature = _b64url_decode(signature.decode())
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Malformed token: {e}") from e
+
+    if header.get("alg") != "RS256":
+        raise ValueError(f"Unsupported algorithm: {header.get('alg')}")
+
+    key = keys.get(header.get("kid"))
+    if key is None:
+        raise ValueError(f"Certificate for key id {header.get('kid')} not found")
+
+    try:
+        key.verify(signature, signing_input, padding.PKCS1v15(), hashes.SHA256())
+    except InvalidSignature as e:
+        raise ValueError("Could not verify token signature") from e
+
+    now = time.time()
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Invalid issuer: {claims.get('iss')}")
+
+    aud = claims.get("aud")
+    if aud != audience and not (isinstance(aud, list) and audience in aud):
+        raise ValueError(f"Token has wrong audience {aud}, expected {audience}")
+
+    exp = claims.get("exp")
+    if not isinstance(exp, int | float) or exp + JWKS_CLOCK_SKEW < now:
+        raise ValueError(f"Token expired, {exp} < {now}")
+
+    iat = claims.get("iat")
+    if isinstance(iat, int | float) and iat - JWKS_CLOCK_SKEW > now:
+        raise ValueError(f"Token used too early, {iat} > {now}")
+
+    if allowed_service_accounts is not None:
+        email = claims.get("email")
+        if email not in allowed_service_accounts or not claims.get("email_verified"):
+            raise ValueError(f"Service account not allowed: {email}")
+
+    return claims
+
+
+def create_jwks_auth_handler(
+    audience,
+    allowed_service_accounts=None,
+    token_cache_size=1024,
+    token_cache_skew=30,
+):
+    """
+    Create OIDC authentication handler that verifies tokens offline.
+
+    Alternative to create_oidc_auth_handler that checks the RS256 signature
+    with ``cryptography`` against the process-wide GoogleJWKSCache, without
+    going through ``google.oauth2.id_token``.
+
+    Args:
+        audience: Audience value for token verification
+        allowed_service_accounts: Optional iterable of service account
+                                  emails allowed to invoke the handler
+        token_cache_size: Maximum number of verified tokens to keep
+        token_cache_skew: Seconds before ``exp`` at which a cached token
+                          is verified again
+
+    Returns:
+        Authentication handler function
+
+    Raises:
+        ImproperlyConfigured: If cryptography is not installed
+    """
+    _require_cryptography()
+    if allowed_service_accounts is not None:
+        allowed_service_accounts = frozenset(allowed_service_accounts)
+
+    token_cache = VerifiedTokenCache(token_cache_size, token_cache_skew)
+
+    def auth_handler(request):
+        """
+        Verify OIDC token in request.
+
+        Returns:
+            (bool, Optional[str]): (verification success flag, error message)
+        """
+        auth_header = request.headers.get("Authorization", "")
+
+        if not auth_header.startswith("Bearer "):
+            return False, "Missing or invalid Authorization header"
+
+        token = auth_header[7:]
+
+        if token_cache.get(token) is not None:
+            return True, None
+
+        try:
+            key_id = json.loads(_b64url_decode(token.split(".", 1)[0])).get("kid")
+            claims = verify_jwks_token(
+                token,
+                _jwks_cache.get(key_id),
+                audience,
+                allowed_service_accounts,
+            )
+            token_cache.set(token, claims)
+            return True, None
+
+        except Exception as e:
+            logger.error("OIDC token verification failed: %s", e)
+            return False, str(e)
+
+    auth_handler.token_cache = token_cache
+    return auth_handler
+
+
+@functools.cache
+def get_jwks_auth_handler(audience, allowed_service_accounts=None):
+    """
+    Return the JWKS authentication handler for audience.
+
+    Like get_oidc_auth_handler, handlers are created once per process.
+    allowed_service_accounts must be hashable (e.g. a tuple).
+    """
+    return create_jwks_auth_handler(audience, allowed_service_accounts)
+
+
+def get_configured_auth_handler(audience):
+    """
+    Return the authentication handler selected by Django settings.
+
+    CLOUD_TASKS_OIDC_VERIFIER chooses between "google-auth" (default,
+    get_oidc_auth_handler) and "jwks" (get_jwks_auth_handler, restricted to
+    CLOUD_TASKS_OIDC_ALLOWED_SERVICE_ACCOUNTS when set).
+    """
+    from django.conf import settings
+
+    verifier = getattr(settings, "CLOUD_TASKS_OIDC_VERIFIER", "google-auth")
+    if verifier == "jwks":
+        allowed = getattr(settings, "CLOUD_TASKS_OIDC_ALLOWED_SERVICE_ACCOUNTS", None)
+        return get_jwks_auth_handler(
+            audience, tuple(allowed) if allowed is not None else None
+        )
+    if verifier != "google-auth":
+        from django.core.exceptions import ImproperlyConfigured
+
+        raise ImproperlyConfigured(
+            f"Unknown CLOUD_TASKS_OIDC_VERIFIER: {verifier!r}. "
+            "Use 'google-auth' or 'jwks'."
+        )
+    return get_oidc_auth_handler(audience)
+
+
+def _hmac_digest(key, timestamp, body):
+    if isinstance(key, str):
+        key = key.encode()
+    return hmac.new(key, f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+
+
+def sign_payload(body, key_id, key, timestamp=None):
+    """
+    Build the HMAC signature header value for a request body.
+
+    Args:
+        body: Request body (bytes)
+        key_id: Identifier of the signing key, so receivers can rotate keys
+        key: Shared secret (str or bytes)
+        timestamp: Unix time the signature is valid from. Defaults to now;
+                   for deferred tasks pass the scheduled time.
+
+    Returns:
+        str: Value for the HMAC_SIGNATURE_HEADER header
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    timestamp = int(timestamp)
+    return f"t={timestamp},kid={key_id},v1={_hmac_digest(key, timestamp, body)}"
+
+
+def create_hmac_auth_handler(keys, max_age=DEFAULT_HMAC_MAX_AGE, clock=time.time):
+    """
+    Create HMAC signature authentication handler.
+
+    Lightweight alternative to create_oidc_auth_handler for deployments
+    where the same project enqueues and executes tasks and shares a secret.
+    Verifies the HMAC_SIGNATURE_HEADER written by CloudTasksBackend with a
+    constant-time compare, and rejects signatures outside the timestamp
+    window to limit replays.
+
+    Args:
+        keys: Mapping of key ID to shared secret. All keys are accepted,
+              which allows rotating the signing key without downtime.
+        max_age: Maximum age of a signature in seconds
+        clock: Callable returning the current time as a Unix timestamp
+
+    Returns:
+        Authentication handler function
+    """
+    keys = {
+        key_id: key.encode() if isinstance(key, str) else key
+        for key_id, key in dict(keys).items()
+    }
+
+    def auth_handler(request):
+        """
+        Verify HMAC signature of request body.
+
+        Returns:
+            (bool, Optional[str]): (verification success flag, error message)
+        """
+        header = request.headers.get(HMAC_SIGNATURE_HEADER, "")
+
+        try:
+            fields = dict(item.split("=", 1) for item in header.split(","))
+            timestamp = int(fields["t"])
+            key_id = fields["kid"]
+            signature = fields["v1"]
+        except (KeyError, ValueError):
+            return False, f"Missing or invalid {HMAC_SIGNATURE_HEADER} header"
+
+        key = keys.get(key_id)
+        if key is None:
+            return False, f"Unknown signing key: {key_id}"
+
+        now = clock()
+        if timestamp > now + HMAC_CLOCK_SKEW:
+            return False, "Signature timestamp is in the future"
+        if now - timestamp > max_age:
+            return False, "Signature has expired"
+
+        expected = _hmac_digest(key, timestamp, request.body)
+        if not hmac.compare_digest(expected, signature):
+            logger.error("HMAC signature verification failed: key_id=%s", key_id)
+            return False, "Invalid signature"
+
+        return True, None
+
+    return auth_handler
+
+
+@functools.cache
+def get_hmac_auth_handler(keys, max_age=DEFAULT_HMAC_MAX_AGE):
+    """
+    Return the HMAC authentication handler for keys.
+
+    Like get_oidc_auth_handler, handlers are created once per process.
+    keys must be hashable (e.g. a tuple of (key ID, secret) pairs).
+    """
+    return create_hmac_auth_handler(keys, max_age)
+
+
+def create_app_engine_auth_handler(fallback=None):
+    """
+    Create App Engine task header authentication handler.
+
+    Accepts requests carrying APP_ENGINE_QUEUE_HEADER, which only Cloud
+    Tasks can send to an App Engine application, so no token has to be
+    minted or verified. Only use it on App Engine: elsewhere, anyone can
+    set the header.
+
+    Args:
+        fallback: Authentication handler for requests without the header
+                  (e.g. HTTP targets with OIDC tokens), or None to reject them
+
+    Returns:
+        Authentication handler function
+    """
+
+    def auth_handler(request):
+        """
+        Verify the App Engine queue header, or defer to the fallback.
+
+        Returns:
+            (bool, Optional[str]): (verification success flag, error message)
+        """
+        if request.headers.get(APP_ENGINE_QUEUE_HEADER):
+            return True, None
+        if fallback is not None:
+            return fallback(request)
+        return False, f"Missing {APP_ENGINE_QUEUE_HEADER} header"
+
+    return auth_handler
+
+
+@functools.cache
+def get_app_engine_auth_handler(fallback=None):
+    """
+    Return the App Engine authentication handler for a fallback handler.
+
+    Like get_oidc_auth_handler, handlers are created once per process.
+    """
+    return create_app_engine_auth_handler(fallback)
+
+
 def verify_cloud_tasks_oidc(audience=None):
     """
     Decorator to verify Cloud Tasks OIDC token.
@@ -91,7 +746,7 @@ def verify_cloud_tasks_oidc(audience=None):
                 # Skip verification if audience is not configured
                 return view_func(request, *args, **kwargs)
 
-            auth_handler = create_oidc_auth_handler(aud)
+            auth_handler = get_configured_auth_handler(aud)
             is_valid, error_message = auth_handler(request)
 
             if not is_valid:
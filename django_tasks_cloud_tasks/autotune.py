@@ -0,0 +1,684 @@
+"""
+Feedback-driven tuning of queue dispatch rates.
+
+AutoTuner reads the execution metrics recorded by the task handler (see
+metrics.py) and adjusts ``max_dispatches_per_second`` and
+``max_concurrent_dispatches`` of each configured queue with an AIMD policy:
+while the queue is healthy both grow by a fixed step, and once the handler
+shows congestion (p95 task duration above target, 5xx responses or load
+shedding rejections) both are cut by a factor. Limits stay between the
+floors and ceilings of the policy.
+
+Configured per backend in OPTIONS:
+
+    "OPTIONS": {
+        "AUTOTUNE": {
+            "QUEUES": {
+                "default": {
+                    "MIN_DISPATCHES_PER_SECOND": 1,
+                    "MAX_DISPATCHES_PER_SECOND": 200,
+                    "TARGET_P95": 2.0,  # seconds
+                },
+            },
+            # Metrics endpoints to scrape; default: this host's metrics
+            # (CLOUD_TASKS_METRICS_MULTIPROC_DIR, or this process)
+            "METRICS_URLS": ["https://worker.example.com/cloudtasks/metrics/"],
+            "STATE_CACHE": "default",
+        },
+    }
+
+Metrics are cumulative, so each step compares them with the previous step,
+kept in STATE_CACHE. The first step of a queue only records them.
+"""
+
+import math
+import re
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from . import metrics
+
+DEFAULT_POLICY = {
+    "MIN_DISPATCHES_PER_SECOND": 1.0,
+    "MAX_DISPATCHES_PER_SECOND": 500.0,
+    "MIN_CONCURRENT_DISPATCHES": 1,
+    "MAX_CONCURRENT_DISPATCHES": 1000,
+    # Additive increase per healthy step
+    "INCREASE_DISPATCHES_PER_SECOND": 5.0,
+    "INCREASE_CONCURRENT_DISPATCHES": 5,
+    # Multiplicative decrease per congested step
+    "DECREASE_FACTOR": 0.5,
+    # Congestion thresholds
+    "TARGET_P95": 5.0,  # seconds
+    "MAX_ERROR_RATE": 0.05,  # 5xx responses / dispatches
+    "MAX_REJECTION_RATE": 0.01,  # load shedding rejections / dispatches
+    # Dispatches needed in a window to act on it
+    "MIN_SAMPLES": 20,
+}
+STATE_KEY_PREFIX = "django_tasks_cloud_tasks:autotune:"
+STATE_TIMEOUT = 86400  # seconds
+METRICS_TIMEOUT = 10  # seconds
+
+
+def get_policy(overrides=None):
+    """Return DEFAULT_POLICY updated with overrides."""
+    unknown = set(overrides or ()) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError(f"Unknown autotune policy keys: {', '.join(sorted(unknown))}")
+    return {**DEFAULT_POLICY, **(overrides or {})}
+
+
+@dataclass(slots=True)
+class QueueWindow:
+    """Handler metrics of one queue, cumulative or over a window."""
+
+    dispatches: int = 0
+    errors: int = 0  # 5xx responses
+    rejections: int = 0  # load shedding rejections
+    # Per-bucket (non-cumulative) counts of task durations, +Inf last
+    duration_buckets: list = field(
+        default_factory=lambda: [0] * (len(metrics.TASK_DURATION.buckets) + 1)
+    )
+
+    def since(self, previous):
+        """Return the window between previous and this sample."""
+        if previous is None or self.dispatches < previous.dispatches:
+            # Counters were reset (e.g. the workers restarted)
+            return self
+        return QueueWindow(
+            dispatches=self.dispatches - previous.dispatches,
+            errors=self.errors - previous.errors,
+            rejections=self.rejections - previous.rejections,
+            duration_buckets=[
+                max(a - b, 0)
+                for a, b in zip(
+                    self.duration_buckets, previous.duration_buckets, strict=True
+                )
+            ],
+        )
+
+    @property
+    def p95(self):
+        """Upper bound of the bucket holding the 95th percentile duration."""
+        total = sum(self.duration_buckets)
+        if not total:
+            return None
+        target = 0.95 * total
+        cumulative = 0
+        for bound, count in zip(
+            (*metrics.TASK_DURATION.buckets, math.inf),
+            self.duration_buckets,
+            strict=True,
+        ):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return math.inf
+
+    @property
+    def error_rate(self):
+        return self.errors / self.dispatches if self.dispatches else 0.0
+
+    @property
+    def rejection_rate(self):
+        return self.rejections / self.dispatches if self.dispatches else 0.0
+
+    def as_dict(self):
+        return {
+            "dispatches": self.dispatches,
+            "errors": self.errors,
+            "rejections": self.rejections,
+            "duration_buckets": list(self.duration_buckets),
+        }
+
+
+def collect_queue_windows(snapshots):
+    """
+    Sum the handler metrics of snapshots per queue.
+
+    Args:
+        snapshots: List of metrics registry snapshots
+
+    Returns:
+        dict: {queue name: cumulative QueueWindow}
+    """
+
+    def merged(metric):
+        return metric.merge(
+            sample for snapshot in snapshots for sample in snapshot.get(metric.name, [])
+        )
+
+    windows = {}
+
+    def window(queue_name):
+        if queue_name not in windows:
+            windows[queue_name] = QueueWindow()
+        return windows[queue_name]
+
+    for (queue_name, code), value in merged(metrics.DISPATCH_RESPONSES).items():
+        w = window(queue_name)
+        w.dispatches += int(value)
+        if code.startswith("5"):
+            w.errors += int(value)
+    for (_, queue_name), value in merged(metrics.DISPATCH_REJECTIONS).items():
+        window(queue_name).rejections += int(value)
+    for (_, queue_name), entry in merged(metrics.TASK_DURATION).items():
+        w = window(queue_name)
+        w.duration_buckets = [
+            a + int(b) for a, b in zip(w.duration_buckets, entry[:-1], strict=True)
+        ]
+    return windows
+
+
+_SAMPLE_RE = re.compile(r"^(\w+)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _unescape(value):
+    return value.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+
+
+def parse_metrics_text(text):
+    """
+    Convert the output of the metrics view back into a registry snapshot.
+
+    Only the metrics of this package are read.
+
+    Returns:
+        dict: Snapshot in the format of Registry.snapshot()
+    """
+    counters = {
+        m.name: m for m in (metrics.DISPATCH_RESPONSES, metrics.DISPATCH_REJECTIONS)
+    }
+    histograms = {metrics.TASK_DURATION.name: metrics.TASK_DURATION}
+    counter_values = {}
+    cumulative_buckets = {}  # {(name, labels): {bound: cumulative count}}
+
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line.strip())
+        if not match:
+            continue
+        name, label_text, value = match.groups()
+        labels = {k: _unescape(v) for k, v in _LABEL_RE.findall(label_text or "")}
+        if name in counters:
+            key = (name, tuple(labels[n] for n in counters[name].labelnames))
+            counter_values[key] = float(value)
+        elif name.endswith("_bucket") and name.removesuffix("_bucket") in histograms:
+            base = name.removesuffix("_bucket")
+            key = (base, tuple(labels[n] for n in histograms[base].labelnames))
+            bound = math.inf if labels["le"] == "+Inf" else float(labels["le"])
+            cumulative_buckets.setdefault(key, {})[bound] = float(value)
+
+    snapshot = {name: [] for name in (*counters, *histograms)}
+    for (name, labels), value in counter_values.items():
+        snapshot[name].append([list(labels), value])
+    for (name, labels), buckets in cumulative_buckets.items():
+        entry, previous = [], 0.0
+        for bound in sorted(buckets):
+            entry.append(buckets[bound] - previous)
+            previous = buckets[bound]
+        snapshot[name].append([list(labels), [*entry, 0.0]])
+    return snapshot
+
+
+class LocalMetricsSource:
+    """Metrics of this host: the multiprocess directory, or this process."""
+
+    def __call__(self):
+        directory = metrics.get_multiproc_dir()
+        if directory:
+            return metrics.registry.read_snapshots(directory)
+        return [metrics.registry.snapshot()]
+
+
+class HttpMetricsSource:
+    """
+    Metrics scraped from the metrics view of one or more instances.
+
+    Args:
+        urls: Metrics endpoint URLs, summed together
+        headers: Extra request headers (e.g. Authorization)
+        timeout: Request timeout in seconds
+    """
+
+    def __init__(self, urls, headers=None, timeout=METRICS_TIMEOUT):
+        self.urls = list(urls)
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+
+    def fetch(self, url):
+        request = urllib.request.Request(url, headers=self.headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return parse_metrics_text(response.read().decode())
+
+    def __call__(self):
+        with ThreadPoolExecutor(max_workers=len(self.urls) or 1) as executor:
+            return list(executor.map(self.fetch, self.urls))
+
+
+@dataclass(slots=True)
+class Decision:
+    """Outcome of one tuning step of a queue."""
+
+    queue_name: str
+    action: str  # "increase", "decrease", "hold" or "error"
+    reason: str
+    current: tuple = (None, None)  # (dispatches/s, concurrent dispatches)
+    target: tuple = (None, None)
+    window: QueueWindow | None = None
+    applied: bool = False
+
+    @property
+    def changed(self):
+        return self.target != self.current
+
+    def as_dict(self):
+        window = self.window
+        return {
+            "queue": self.queue_name,
+            "action": self.action,
+            "reason": self.reason,
+            "max_dispatches_per_second": [self.current[0], self.target[0]],
+            "max_concurrent_dispatches": [self.current[1], self.target[1]],
+            "dispatches": window.dispatches if window else None,
+            "p95": window.p95 if window else None,
+            "error_rate": window.error_rate if window else None,
+            "rejection_rate": window.rejection_rate if window else None,
+            "applied": self.applied,
+        }
+
+
+def _clamp(value, low, high):
+    return min(max(value, low), high)
+
+
+def decide(queue_name, policy, rate, concurrency, window):
+    """
+    Apply the AIMD policy to a queue's limits.
+
+    Args:
+        queue_name: Queue name
+        policy: Policy from get_policy()
+        rate: Current max_dispatches_per_second
+        concurrency: Current max_concurrent_dispatches
+        window: QueueWindow since the previous step
+
+    Returns:
+        Decision
+    """
+    current = (rate, concurrency)
+
+    def bounded(new_rate, new_concurrency):
+        return (
+            round(
+                _clamp(
+                    new_rate,
+                    policy["MIN_DISPATCHES_PER_SECOND"],
+                    policy["MAX_DISPATCHES_PER_SECOND"],
+                ),
+                3,
+            ),
+            int(
+                _clamp(
+                    new_concurrency,
+                    policy["MIN_CONCURRENT_DISPATCHES"],
+                    policy["MAX_CONCURRENT_DISPATCHES"],
+                )
+            ),
+        )
+
+    if window.dispatches < policy["MIN_SAMPLES"]:
+        return Decision(
+            queue_name,
+            "hold",
+            f"{window.dispatches} dispatches, fewer than {policy['MIN_SAMPLES']}",
+            current,
+            current,
+            window,
+        )
+
+    p95 = window.p95
+    congestion = []
+    if p95 is not None and p95 > policy["TARGET_P95"]:
+        congestion.append(f"p95 {p95}s > {policy['TARGET_P95']}s")
+    if window.error_rate > policy["MAX_ERROR_RATE"]:
+        congestion.append(
+            f"5xx rate {window.error_rate:.2%} > {policy['MAX_ERROR_RATE']:.2%}"
+        )
+    if window.rejection_rate > policy["MAX_REJECTION_RATE"]:
+        congestion.append(
+            f"rejection rate {window.rejection_rate:.2%} > "
+            f"{policy['MAX_REJECTION_RATE']:.2%}"
+        )
+
+    if congestion:
+        factor = policy["DECREASE_FACTOR"]
+        target = bounded(rate * factor, math.floor(concurrency * factor))
+        action = "decrease" if target != current else "hold"
+        return Decision(
+            queue_name, action, "; ".join(congestion), current, target, window
+        )
+
+    target = bounded(
+        rate + policy["INCREASE_DISPATCHES_PER_SECOND"],
+        concurrency + policy["INCREASE_CONCURRENT_DISPATCHES"],
+    )
+    if target == current:
+        return Decision(
+            queue_name, "hold", "healthy, at ceiling", current, target, window
+        )
+    return Decision(queue_name, "increase", "healthy", current, target, window)
+
+
+class DictState:
+    """In-memory tuning state (previous samples per queue)."""
+
+    def __init__(self):
+        self._values = {}
+
+    def get(self, key):
+        return self._values.get(key)
+
+    def set(self, key, value, timeout=None):
+        self._values[key] = value
+
+
+class AutoTuner:
+    """
+    Adjust the dispatch limits of queues from handler metrics.
+
+    Limits are decided from the metrics and the queue of the first
+    location, and applied to the queue in every location, so that a
+    failover location has the same limits (see locations.py).
+
+    Args:
+        project_id: GCP project of the queues
+        locations: Cloud Tasks locations of the queues, primary first (or
+                   one location)
+        policies: {queue name: policy overrides}
+        source: Callable returning a list of metrics snapshots
+        state: Object with get(key) and set(key, value, timeout), such as a
+               Django cache, keeping the previous sample of each queue
+        client: Cloud Tasks client (default: create_tasks_client())
+        state_prefix: Prefix of state keys
+    """
+
+    def __init__(
+        self,
+        project_id,
+        locations,
+        policies,
+        source=None,
+        state=None,
+        client=None,
+        state_prefix=STATE_KEY_PREFIX,
+    ):
+        self.project_id = project_id
+        self.locations = (
+            (locations,) if isinstance(locations, str) else tuple(locations)
+        )
+        self.policies = {name: get_policy(p) for name, p in policies.items()}
+        self.source = source or LocalMetricsSource()
+        self.state = state if state is not None else DictState()
+        self.state_prefix = state_prefix
+        self._client = client
+
+    @classmethod
+    def from_backend(cls, backend, **kwargs):
+        """Create a tuner from the AUTOTUNE option of a backend."""
+        from django.core.cache import caches
+
+        config = backend.options.get("AUTOTUNE") or {}
+        urls = config.get("METRICS_URLS")
+        kwargs.setdefault(
+            "source",
+            HttpMetricsSource(urls, config.get("METRICS_HEADERS")) if urls else None,
+        )
+        kwargs.setdefault("state", caches[config.get("STATE_CACHE", "default")])
+        kwargs.setdefault("state_prefix", f"{STATE_KEY_PREFIX}{backend.alias}:")
+        return cls(
+            backend.project_id,
+            backend.locations,
+            config.get("QUEUES", {}),
+            **kwargs,
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            from .backends import create_tasks_client
+
+            self._client = create_tasks_client()
+        return self._client
+
+    def _window(self, queue_name, sample):
+        key = f"{self.state_prefix}{queue_name}"
+        previous = self.state.get(key)
+        self.state.set(key, sample.as_dict(), STATE_TIMEOUT)
+        if previous is None:
+            return None
+        return sample.since(QueueWindow(**previous))
+
+    def _tune(self, queue_name, window, dry_run):
+        from google.cloud import tasks_v2
+
+        try:
+            names = [
+                self.client.queue_path(self.project_id, location, queue_name)
+                for location in self.locations
+            ]
+            rate_limits = self.client.get_queue(name=names[0]).rate_limits
+            decision = decide(
+                queue_name,
+                self.policies[queue_name],
+                rate_limits.max_dispatches_per_second,
+                rate_limits.max_concurrent_dispatches,
+                window,
+            )
+            if decision.changed and not dry_run:
+                for name in names:
+                    self.client.update_queue(
+                        queue=tasks_v2.Queue(
+                            name=name,
+                            rate_limits={
+                                "max_dispatches_per_second": decision.target[0],
+                                "max_concurrent_dispatches": decision.target[1],
+                            },
+                        ),
+                        update_mask={
+                            "paths": [
+                                "rate_limits.max_dispatches_per_second",
+                                "rate_limits.max_concurrent_dispatches",
+                            ]
+                        },
+                    )
+                decision.applied = True
+            return decision
+        except Exception as e:
+            return Decision(queue_name, "error", f"{type(e).__name__}: {e}")
+
+    def step(self, dry_run=False):
+        """
+        Run one tuning step over all configured queues.
+
+        Returns:
+            list: Decision per queue
+        """
+        samples = collect_queue_windows(self.source())
+        decisions = {}
+        windows = {}
+        for queue_name in self.policies:
+            window = self._window(queue_name, samples.get(queue_name, QueueWindow()))
+            if window is None:
+                decisions[queue_name] = Decision(
+                    queue_name, "hold", "first sample recorded"
+                )
+            else:
+                windows[queue_name] = window
+
+        with ThreadPoolExecutor(max_workers=len(windows) or 1) as executor:
+            futures = {
+                queue_name: executor.submit(self._tune, queue_name, window, dry_run)
+                for queue_name, window in windows.items()
+            }
+            for queue_name, future in futures.items():
+                decisions[queue_name] = future.result()
+        return [decisions[queue_name] for queue_name in self.policies]
+
+
+def format_decisions(decisions):
+    """Render decisions as text."""
+    lines = []
+    for d in decisions:
+        line = f"{d.queue_name}: {d.action} ({d.reason})"
+        if d.action in ("increase", "decrease"):
+            line += (
+                f" rate {d.current[0]} -> {d.target[0]}/s,"
+                f" concurrency {d.current[1]} -> {d.target[1]}"
+            )
+            if not d.applied:
+                line += " [not applied]"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# Simulation
+
+
+class SimulatedService:
+    """
+    Model of a task handler with limited capacity.
+
+    Below capacity, task duration grows with utilization like a queueing
+    system; above it, the excess dispatches fail with 5xx.
+
+    Args:
+        capacity: Dispatches per second the handler (and its downstreams)
+                  can sustain
+        base_latency: Task duration at low load (seconds)
+        demand: Dispatches per second available in the queue
+    """
+
+    def __init__(self, capacity, base_latency=0.1, demand=math.inf):
+        self.capacity = capacity
+        self.base_latency = base_latency
+        self.demand = demand
+
+    def run(self, rate, concurrency, interval):
+        """Simulate interval seconds of dispatching; return a QueueWindow."""
+        throughput = min(rate, concurrency / self.base_latency, self.demand)
+        utilization = throughput / self.capacity
+        if utilization < 1:
+            latency = self.base_latency / max(1 - utilization, 0.05)
+            error_rate = 0.0
+        else:
+            latency = self.base_latency * 20
+            error_rate = 1 - 1 / utilization
+
+        dispatches = int(throughput * interval)
+        errors = int(dispatches * error_rate)
+        window = QueueWindow(dispatches=dispatches, errors=errors)
+        index = next(
+            (
+                i
+                for i, bound in enumerate(metrics.TASK_DURATION.buckets)
+                if latency <= bound
+            ),
+            len(metrics.TASK_DURATION.buckets),
+        )
+        window.duration_buckets[index] = dispatches
+        return window
+
+
+class _SimulatedClient:
+    """Stand-in for the Cloud Tasks admin API, holding queue rate limits."""
+
+    def __init__(self, rate, concurrency):
+        self.rate = rate
+        self.concurrency = concurrency
+
+    def queue_path(self, project, location, queue):
+        return f"projects/{project}/locations/{location}/queues/{queue}"
+
+    def get_queue(self, name):
+        from google.cloud import tasks_v2
+
+        return tasks_v2.Queue(
+            name=name,
+            rate_limits={
+                "max_dispatches_per_second": self.rate,
+                "max_concurrent_dispatches": self.concurrency,
+            },
+        )
+
+    def update_queue(self, queue, update_mask):
+        self.rate = queue.rate_limits.max_dispatches_per_second
+        self.concurrency = queue.rate_limits.max_concurrent_dispatches
+
+
+def simulate(
+    service,
+    policy=None,
+    steps=30,
+    interval=60,
+    initial_rate=10.0,
+    initial_concurrency=10,
+    queue_name="default",
+):
+    """
+    Run AutoTuner against a SimulatedService.
+
+    The tuner reads the simulated metrics in the same snapshot format as the
+    handler's, and updates a stand-in of the admin API.
+
+    Returns:
+        list: Per step, {"step", "rate", "concurrency", "throughput", "p95",
+              "error_rate", "action"}
+    """
+    client = _SimulatedClient(initial_rate, initial_concurrency)
+    cumulative = QueueWindow()
+
+    def source():
+        return [
+            {
+                metrics.DISPATCH_RESPONSES.name: [
+                    [[queue_name, "200"], cumulative.dispatches - cumulative.errors],
+                    [[queue_name, "500"], cumulative.errors],
+                ],
+                metrics.TASK_DURATION.name: [
+                    [["simulated", queue_name], [*cumulative.duration_buckets, 0.0]]
+                ],
+            }
+        ]
+
+    tuner = AutoTuner(
+        "simulated", "simulated", {queue_name: policy or {}}, source, client=client
+    )
+    tuner.step()  # Record the initial sample
+
+    history = []
+    for i in range(steps):
+        rate, concurrency = client.rate, client.concurrency
+        window = service.run(rate, concurrency, interval)
+        cumulative.dispatches += window.dispatches
+        cumulative.errors += window.errors
+        cumulative.duration_buckets = [
+            a + b
+            for a, b in zip(
+                cumulative.duration_buckets, window.duration_buckets, strict=True
+            )
+        ]
+        (decision,) = tuner.step()
+        history.append(
+            {
+                "step": i + 1,
+                "rate": rate,
+                "concurrency": concurrency,
+                "throughput": window.dispatches / interval,
+                "p95": window.p95,
+                "error_rate": window.error_rate,
+                "action": decision.action,
+            }
+        )
+    return history
@@ -1,6 +1,8 @@
 """Cloud Tasks backend for Django tasks framework."""
 
 import json
+import os
+import time
 
 from django.core.exceptions import ImproperlyConfigured
 from django.tasks.backends.base import BaseTaskBackend
@@ -9,6 +11,43 @@ from django.tasks.signals import task_enqueued
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 
+from . import metrics, tracing
+from .auth import HMAC_SIGNATURE_HEADER, sign_payload
+from .debounce import created_tasks, get_collapse_policy
+from .inline import hold_back
+from .locations import LocationRouter
+from .queues import parse_queue_definitions
+from .routes import Route, TaskRouter, parse_app_engine_routing
+
+
+def create_tasks_client(version="v2"):
+    """
+    Create a Cloud Tasks client.
+
+    Connects to the emulator at CLOUD_TASKS_EMULATOR_HOST (host:port) if
+    that environment variable is set.
+
+    Args:
+        version: API version module, e.g. "v2beta3" for queue statistics
+    """
+    import importlib
+
+    tasks = importlib.import_module(f"google.cloud.tasks_{version}")
+
+    emulator_host = os.environ.get("CLOUD_TASKS_EMULATOR_HOST")
+    if not emulator_host:
+        return tasks.CloudTasksClient()
+
+    import grpc
+
+    transports = importlib.import_module(
+        f"google.cloud.tasks_{version}.services.cloud_tasks.transports"
+    )
+    channel = grpc.insecure_channel(emulator_host)
+    return tasks.CloudTasksClient(
+        transport=transports.CloudTasksGrpcTransport(channel=channel)
+    )
+
 
 class CloudTasksBackend(BaseTaskBackend):
     """
@@ -25,35 +64,57 @@ class CloudTasksBackend(BaseTaskBackend):
     def __init__(self, alias, params):
         super().__init__(alias, params)
 
-        from .detection import (
-            detect_default_service_account,
-            detect_gcp_location,
-            detect_gcp_project,
-            detect_task_handler_host,
-        )
-
         # Get from options, or auto-detect
         # Use same option names as django-database-task for consistency
-        self.project_id = (
-            self.options.get("CLOUD_TASKS_PROJECT") or detect_gcp_project()
+        self.project_id = self.options.get("CLOUD_TASKS_PROJECT") or self.detect_option(
+            "CLOUD_TASKS_PROJECT"
         )
+        # Several locations: the first one is the primary (see locations.py)
+        locations = self.options.get("CLOUD_TASKS_LOCATIONS")
         self.location = (
-            self.options.get("CLOUD_TASKS_LOCATION") or detect_gcp_location()
-        )
-        self.task_handler_host = (
-            self.options.get("TASK_HANDLER_HOST") or detect_task_handler_host()
+            locations[0]
+            if locations
+            else self.options.get("CLOUD_TASKS_LOCATION")
+            or self.detect_option("CLOUD_TASKS_LOCATION")
         )
+        self.locations = tuple(locations or [self.location])
+        self.task_handler_host = self.options.get(
+            "TASK_HANDLER_HOST"
+        ) or self.detect_option("TASK_HANDLER_HOST")
         self.task_handler_path = self.options.get(
             "TASK_HANDLER_PATH", "/cloudtasks/execute/"
         )
 
+        # App Engine target: on App Engine, unless an explicit host is set
+        self.app_engine_target = self.options.get("APP_ENGINE_TARGET")
+        if self.app_engine_target is None:
+            self.app_engine_target = bool(
+                self.detect_option("APP_ENGINE_TARGET")
+            ) and not self.options.get("TASK_HANDLER_HOST")
+        self.app_engine_routing = None
+        if self.app_engine_target:
+            self.app_engine_routing = parse_app_engine_routing(
+                self.options.get("APP_ENGINE_ROUTING")
+                or self.detect_option("APP_ENGINE_ROUTING")
+                or {},
+                "APP_ENGINE_ROUTING",
+            )
+
         # OIDC configuration
-        self.oidc_service_account_email = (
-            self.options.get("OIDC_SERVICE_ACCOUNT_EMAIL")
-            or detect_default_service_account()
-        )
+        self.oidc_service_account_email = self.options.get(
+            "OIDC_SERVICE_ACCOUNT_EMAIL"
+        ) or self.detect_option("OIDC_SERVICE_ACCOUNT_EMAIL")
         self.oidc_audience = self.options.get("OIDC_AUDIENCE") or self.task_handler_host
 
+        # HMAC payload signing (alternative to OIDC for internal deployments)
+        self.hmac_signing_key = self.options.get("HMAC_SIGNING_KEY")
+        self.hmac_signing_key_id = self.options.get("HMAC_SIGNING_KEY_ID", "default")
+
+        # Queue definitions (see queues.py)
+        self.queue_definitions = parse_queue_definitions(
+            self.options.get("QUEUE_DEFINITIONS", {})
+        )
+
         # Validate required settings
         if not self.project_id:
             raise ImproperlyConfigured(
@@ -65,24 +126,101 @@ class CloudTasksBackend(BaseTaskBackend):
                 "CLOUD_TASKS_LOCATION is required. Set it in OPTIONS or ensure "
                 "CLOUD_TASKS_LOCATION environment variable is set."
             )
-        if not self.task_handler_host:
+        if not self.task_handler_host and not self.app_engine_target:
             raise ImproperlyConfigured(
                 "TASK_HANDLER_HOST is required. Set it in OPTIONS or deploy to "
                 "Cloud Run/App Engine for auto-detection."
             )
 
-    def enqueue(self, task, args, kwargs):
-        """Enqueue task to Cloud Tasks."""
-        from google.cloud import tasks_v2
-        from google.protobuf import timestamp_pb2
+        # Handler services per task (see routes.py)
+        if self.app_engine_target:
+            default_route = Route(
+                name=None,
+                url=self.task_handler_path,
+                app_engine_routing=self.app_engine_routing,
+            )
+        else:
+            default_route = Route(
+                name=None,
+                url=f"{self.task_handler_host.rstrip('/')}{self.task_handler_path}",
+                oidc_service_account_email=self.oidc_service_account_email,
+                oidc_audience=self.oidc_audience,
+            )
+        self.task_router = TaskRouter(
+            default_route,
+            self.options.get("ROUTES"),
+            oidc_service_account_email=self.oidc_service_account_email,
+        )
 
-        self.validate_task(task)
+        try:
+            self.router = LocationRouter(
+                self.project_id, self.locations, self.options.get("LOCATION_ROUTING")
+            )
+        except ValueError as e:
+            raise ImproperlyConfigured(f"LOCATION_ROUTING: {e}") from e
 
-        task_id = get_random_string(32)
-        now = timezone.now()
+        # Queue paths of known queues, and one client per location
+        self._queue_paths = {
+            (location, queue_name): self._build_queue_path(location, queue_name)
+            for location in self.locations
+            for queue_name in set(self.queues) | set(self.queue_definitions)
+        }
+        self._clients = {}
+
+    def detect_option(self, name):
+        """
+        Detect the value of an option missing from OPTIONS.
+
+        Reads the GCP environment (metadata server, environment variables).
+        Can be overridden in subclasses.
+
+        Args:
+            name: CLOUD_TASKS_PROJECT, CLOUD_TASKS_LOCATION, TASK_HANDLER_HOST,
+                  APP_ENGINE_TARGET, APP_ENGINE_ROUTING or
+                  OIDC_SERVICE_ACCOUNT_EMAIL
 
-        # Serialize task info (including all parameters)
-        payload = {
+        Returns:
+            Detected value, or None
+        """
+        from . import detection
+
+        detectors = {
+            "CLOUD_TASKS_PROJECT": detection.detect_gcp_project,
+            "CLOUD_TASKS_LOCATION": detection.detect_gcp_location,
+            "TASK_HANDLER_HOST": detection.detect_task_handler_host,
+            "APP_ENGINE_TARGET": detection.is_app_engine,
+            "APP_ENGINE_ROUTING": detection.detect_app_engine_routing,
+            "OIDC_SERVICE_ACCOUNT_EMAIL": detection.detect_default_service_account,
+        }
+        return detectors[name]()
+
+    def _build_queue_path(self, location, queue_name):
+        return f"projects/{self.project_id}/locations/{location}/queues/{queue_name}"
+
+    def get_queue_path(self, queue_name, location=None):
+        """Return the full name of a queue in a location (default: primary)."""
+        key = (location or self.location, queue_name)
+        path = self._queue_paths.get(key)
+        if path is None:
+            path = self._queue_paths[key] = self._build_queue_path(*key)
+        return path
+
+    def get_client(self, location=None):
+        """
+        Return the Cloud Tasks client of a location.
+
+        Clients are created once per backend instance, that is per thread,
+        so each location keeps its own channel.
+        """
+        key = location or self.location
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = create_tasks_client()
+        return client
+
+    def build_payload(self, task, args, kwargs, task_id, now):
+        """Serialize task info (including all parameters) into the payload."""
+        return {
             "task_id": task_id,
             "task_path": task.module_path,
             "args": list(args),
@@ -92,31 +230,69 @@ class CloudTasksBackend(BaseTaskBackend):
             "priority": task.priority,
             "takes_context": task.takes_context,
             "enqueued_at": now.isoformat(),
+            "run_after": task.run_after.isoformat() if task.run_after else None,
         }
 
-        # Create task in Cloud Tasks
-        # Use task.queue_name as Cloud Tasks queue ID
-        client = tasks_v2.CloudTasksClient()
-        parent = client.queue_path(self.project_id, self.location, task.queue_name)
+    def build_headers(self, task, body, now):
+        """Build the HTTP headers of the task request."""
+        headers = {"Content-Type": "application/json"}
+        tracing.inject_trace_headers(headers)
+
+        # Sign payload, valid from the time the task is scheduled to run
+        if self.hmac_signing_key:
+            headers[HMAC_SIGNATURE_HEADER] = sign_payload(
+                body,
+                self.hmac_signing_key_id,
+                self.hmac_signing_key,
+                timestamp=(task.run_after or now).timestamp(),
+            )
 
-        # Build task execution URL
-        execute_url = f"{self.task_handler_host.rstrip('/')}{self.task_handler_path}"
+        return headers
 
-        http_request = {
-            "http_method": tasks_v2.HttpMethod.POST,
-            "url": execute_url,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(payload).encode(),
-        }
+    def create_task(self, task, task_id, body, headers, name=None):
+        """
+        Create the HTTP task in Cloud Tasks.
+
+        Args:
+            name: Task ID in Cloud Tasks, for named (deduplicated) tasks
+
+        Returns:
+            bool: False if a task with the same name already existed
+        """
+        from google.api_core.exceptions import AlreadyExists
+        from google.cloud import tasks_v2
+        from google.protobuf import duration_pb2, timestamp_pb2
+
+        # Handler service of the task
+        route = self.task_router.resolve(task)
 
-        # Configure OIDC authentication
-        if self.oidc_service_account_email:
-            http_request["oidc_token"] = {
-                "service_account_email": self.oidc_service_account_email,
-                "audience": self.oidc_audience,
+        if route.app_engine_routing is not None:
+            # App Engine target: authenticated by X-AppEngine-* headers
+            task_request = {
+                "app_engine_http_request": {
+                    "http_method": tasks_v2.HttpMethod.POST,
+                    "relative_uri": route.url,
+                    "app_engine_routing": route.app_engine_routing,
+                    "headers": headers,
+                    "body": body,
+                }
             }
+        else:
+            http_request = {
+                "http_method": tasks_v2.HttpMethod.POST,
+                "url": route.url,
+                "headers": headers,
+                "body": body,
+            }
+
+            # Configure OIDC authentication
+            if route.oidc_service_account_email:
+                http_request["oidc_token"] = {
+                    "service_account_email": route.oidc_service_account_email,
+                    "audience": route.oidc_audience,
+                }
 
-        task_request = {"http_request": http_request}
+            task_request = {"http_request": http_request}
 
         # Configure deferred execution
         if task.run_after:
@@ -124,8 +300,83 @@ class CloudTasksBackend(BaseTaskBackend):
             timestamp.FromDatetime(task.run_after)
             task_request["schedule_time"] = timestamp
 
-        # Create task in Cloud Tasks
-        client.create_task(parent=parent, task=task_request)
+        # Configure the handler timeout of the queue
+        dispatch_deadline = self.queue_definitions.get(task.queue_name, {}).get(
+            "dispatch_deadline"
+        )
+        if dispatch_deadline is not None:
+            duration = duration_pb2.Duration()
+            duration.FromTimedelta(dispatch_deadline)
+            task_request["dispatch_deadline"] = duration
+
+        metrics.ensure_multiproc_flusher()
+        metrics.ENQUEUE_PAYLOAD_BYTES.observe(len(body), task.queue_name)
+
+        created = True
+
+        def create(location):
+            nonlocal created
+            # Use task.queue_name as Cloud Tasks queue ID
+            parent = self.get_queue_path(task.queue_name, location)
+            request = task_request
+            if name is not None:
+                request = {**task_request, "name": f"{parent}/tasks/{name}"}
+            try:
+                self.get_client(location).create_task(parent=parent, task=request)
+            except AlreadyExists:
+                if name is None:
+                    raise
+                created = False
+
+        start = time.perf_counter()
+        try:
+            self.router.create(create)
+        except Exception as e:
+            metrics.ENQUEUE_ERRORS.inc(task.queue_name, metrics.error_code(e))
+            raise
+        finally:
+            metrics.ENQUEUE_DURATION.observe(
+                time.perf_counter() - start, task.queue_name
+            )
+        if created:
+            metrics.ENQUEUED.inc(task.module_path, task.queue_name)
+        else:
+            metrics.ENQUEUE_COLLAPSED.inc(task.module_path, task.queue_name)
+        return created
+
+    def enqueue(self, task, args, kwargs):
+        """Enqueue task to Cloud Tasks."""
+        self.validate_task(task)
+
+        now = timezone.now()
+
+        # Debounced/throttled tasks: one named task per key and window
+        policy = get_collapse_policy(task)
+        name = cache_key = None
+        if policy is None:
+            task_id = get_random_string(32)
+        else:
+            name, window_end = policy.task_name(
+                task, args, kwargs, task.run_after or now
+            )
+            task_id = name
+            if policy.mode == "debounce":
+                task = task.using(run_after=window_end)
+            cache_key = (self.alias, task.queue_name, name)
+
+        if cache_key is not None and created_tasks.contains(cache_key, now):
+            # Created by this process in the current window
+            metrics.ENQUEUE_COLLAPSED.inc(task.module_path, task.queue_name)
+        else:
+            payload = self.build_payload(task, args, kwargs, task_id, now)
+            body = json.dumps(payload).encode()
+            headers = self.build_headers(task, body, now)
+
+            # Create task in Cloud Tasks, unless it runs after the current task
+            if name is not None or not hold_back(self, task, task_id, body, headers):
+                self.create_task(task, task_id, body, headers, name=name)
+            if cache_key is not None:
+                created_tasks.add(cache_key, window_end)
 
         # Return TaskResult
         task_result = TaskResult(
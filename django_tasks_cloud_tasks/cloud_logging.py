@@ -0,0 +1,107 @@
+"""
+Structured logging for Cloud Logging.
+
+CloudLoggingFormatter writes one JSON object per line, using the fields
+that Cloud Logging recognizes in the output of Cloud Run and App Engine
+(severity, trace, span ID, labels).
+
+Usage (settings.LOGGING):
+    "formatters": {
+        "cloud": {"()": "django_tasks_cloud_tasks.cloud_logging.CloudLoggingFormatter"},
+    },
+
+Success logs of task executions are sampled per task path with
+CLOUD_TASKS_SUCCESS_LOG_SAMPLE_RATE, either a rate for all tasks or a dict
+keyed by task path with "*" as fallback:
+
+    CLOUD_TASKS_SUCCESS_LOG_SAMPLE_RATE = {"*": 0.01, "myapp.tasks.rare": 1.0}
+
+Failures are always logged.
+"""
+
+import json
+import logging
+import random
+from datetime import UTC, datetime
+
+from .tracing import TraceLogFilter
+
+# Attributes of log records (passed with ``extra``) written as labels
+LABEL_FIELDS = ("task_id", "task_path", "queue", "duration", "attempt")
+
+SEVERITIES = frozenset({"DEBUG", "INFO", "NOTICE", "WARNING", "ERROR", "CRITICAL"})
+
+
+def get_success_log_sample_rate(task_path):
+    """Return the sample rate of success logs for task_path (default 1.0)."""
+    from django.conf import settings
+
+    from .dispatch import DEFAULT_KEY
+
+    rate = getattr(settings, "CLOUD_TASKS_SUCCESS_LOG_SAMPLE_RATE", 1.0)
+    if isinstance(rate, dict):
+        rate = rate.get(task_path, rate.get(DEFAULT_KEY, 1.0))
+    return rate
+
+
+def should_log_success(logger, task_path):
+    """Decide whether to log a successful execution of task_path."""
+    if not logger.isEnabledFor(logging.INFO):
+        return False
+    rate = get_success_log_sample_rate(task_path)
+    return rate >= 1 or random.random() < rate
+
+
+class CloudLoggingFormatter(logging.Formatter):
+    """Format log records as Cloud Logging structured JSON."""
+
+    def __init__(self, project_id=None, labels=None):
+        """
+        Args:
+            project_id: GCP project of trace IDs. Auto-detected if omitted.
+            labels: Static labels added to every entry (e.g. {"service": ...})
+        """
+        super().__init__()
+        self.trace_filter = TraceLogFilter(project_id=project_id)
+        self.labels = dict(labels or {})
+
+    def format(self, record):
+        # Arguments are only interpolated here, once the record is emitted
+        message = record.getMessage()
+        if record.exc_info:
+            # Error Reporting picks up tracebacks from the message
+            message = f"{message}\n{self.formatException(record.exc_info)}"
+        elif record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+
+        entry = {
+            "severity": (
+                record.levelname if record.levelname in SEVERITIES else "DEFAULT"
+            ),
+            "message": message,
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "logger": record.name,
+            "logging.googleapis.com/sourceLocation": {
+                "file": record.pathname,
+                "line": record.lineno,
+                "function": record.funcName,
+            },
+        }
+
+        labels = dict(self.labels)
+        for field in LABEL_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                labels[field] = str(value)
+        if labels:
+            entry["logging.googleapis.com/labels"] = labels
+
+        if not hasattr(record, "trace"):
+            self.trace_filter.filter(record)
+        if record.trace:
+            entry["logging.googleapis.com/trace"] = record.trace
+            entry["logging.googleapis.com/trace_sampled"] = record.trace_sampled
+            if record.span_id:
+                entry["logging.googleapis.com/spanId"] = record.span_id
+
+        return json.dumps(entry, default=str)
@@ -0,0 +1,538 @@
+"""
+Dead-letter store for tasks that failed their final attempt.
+
+Once a queue's retries are exhausted, Cloud Tasks deletes the task and its
+payload. When enabled, the executor stores the payload and errors of a
+task that fails on its final attempt, so it can be replayed later with the
+``cloudtasks_replay`` management command.
+
+Configure in Django settings:
+
+    CLOUD_TASKS_DEAD_LETTER = {
+        "BACKEND": "django_tasks_cloud_tasks.deadletter.DatabaseDeadLetterStore",
+        "OPTIONS": {},  # FileDeadLetterStore: {"DIRECTORY": "/var/dead-letters"}
+        # Final attempt per queue, "*" as fallback. Defaults to max_attempts
+        # of the queue in the backend's QUEUE_DEFINITIONS.
+        "MAX_ATTEMPTS": {"*": 100},
+    }
+
+Deliveries acknowledged without running because they exceed
+CLOUD_TASKS_MAX_ATTEMPTS are stored as well.
+
+Cloud Tasks also gives up once a queue's max_retry_duration has passed,
+which the handler cannot see; keep that unset (or long) on queues relying
+on the dead-letter store.
+"""
+
+import abc
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .dispatch import DEFAULT_KEY
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+DEFAULT_REPLAY_CONCURRENCY = 8
+DEFAULT_REPLAY_BATCH_SIZE = 100
+# "exception" of the error stored for tasks expired by CLOUD_TASKS_MAX_ATTEMPTS
+EXPIRED_EXCEPTION = "django_tasks_cloud_tasks.expired"
+
+
+@dataclass(slots=True)
+class DeadLetterRecord:
+    """One dead-lettered task."""
+
+    id: str
+    task_id: str
+    task_path: str
+    queue_name: str
+    backend: str
+    payload: dict
+    errors: list
+    attempts: int
+    failed_at: datetime
+    replayed_at: datetime | None = None
+    replay_task_id: str = ""
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "task_id": self.task_id,
+            "task_path": self.task_path,
+            "queue_name": self.queue_name,
+            "backend": self.backend,
+            "payload": self.payload,
+            "errors": self.errors,
+            "attempts": self.attempts,
+            "failed_at": self.failed_at.isoformat(),
+            "replayed_at": self.replayed_at.isoformat() if self.replayed_at else None,
+            "replay_task_id": self.replay_task_id,
+        }
+
+
+def _matches(record, ids, task_path, queue_name, since, until, include_replayed):
+    return (
+        (ids is None or record.id in ids)
+        and (task_path is None or record.task_path == task_path)
+        and (queue_name is None or record.queue_name == queue_name)
+        and (since is None or record.failed_at >= since)
+        and (until is None or record.failed_at < until)
+        and (include_replayed or record.replayed_at is None)
+    )
+
+
+class BaseDeadLetterStore(abc.ABC):
+    """Interface of dead-letter stores."""
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    @abc.abstractmethod
+    def add(self, payload, errors, attempts):
+        """
+        Store a task that failed its final attempt.
+
+        Args:
+            payload: Task payload
+            errors: [{"exception": class path, "traceback": str}]
+            attempts: Number of attempts made
+
+        Returns:
+            DeadLetterRecord
+        """
+
+    @abc.abstractmethod
+    def list(
+        self,
+        ids=None,
+        task_path=None,
+        queue_name=None,
+        since=None,
+        until=None,
+        include_replayed=False,
+        limit=None,
+    ):
+        """Return stored records matching the filters, oldest first."""
+
+    @abc.abstractmethod
+    def mark_replayed(self, record_id, replay_task_id):
+        """Record that a dead letter was enqueued again as replay_task_id."""
+
+    @abc.abstractmethod
+    def delete(self, record_id):
+        """Delete a stored record."""
+
+
+class DatabaseDeadLetterStore(BaseDeadLetterStore):
+    """Store dead letters in the DeadLetter table."""
+
+    @staticmethod
+    def _to_record(row):
+        return DeadLetterRecord(
+            id=str(row.pk),
+            task_id=row.task_id,
+            task_path=row.task_path,
+            queue_name=row.queue_name,
+            backend=row.backend,
+            payload=row.payload,
+            errors=row.errors,
+            attempts=row.attempts,
+            failed_at=row.failed_at,
+            replayed_at=row.replayed_at,
+            replay_task_id=row.replay_task_id,
+        )
+
+    def add(self, payload, errors, attempts):
+        from .models import DeadLetter
+
+        row = DeadLetter.objects.create(
+            task_id=payload.get("task_id", ""),
+            task_path=payload.get("task_path", ""),
+            queue_name=payload.get("queue_name", ""),
+            backend=payload.get("backend", ""),
+            payload=payload,
+            errors=errors,
+            attempts=attempts,
+            failed_at=timezone.now(),
+        )
+        return self._to_record(row)
+
+    def list(
+        self,
+        ids=None,
+        task_path=None,
+        queue_name=None,
+        since=None,
+        until=None,
+        include_replayed=False,
+        limit=None,
+    ):
+        from .models import DeadLetter
+
+        rows = DeadLetter.objects.all()
+        if ids is not None:
+            rows = rows.filter(pk__in=ids)
+        if task_path is not None:
+            rows = rows.filter(task_path=task_path)
+        if queue_name is not None:
+            rows = rows.filter(queue_name=queue_name)
+        if since is not None:
+            rows = rows.filter(failed_at__gte=since)
+        if until is not None:
+            rows = rows.filter(failed_at__lt=until)
+        if not include_replayed:
+            rows = rows.filter(replayed_at__isnull=True)
+        if limit is not None:
+            rows = rows[:limit]
+        return [self._to_record(row) for row in rows]
+
+    def mark_replayed(self, record_id, replay_task_id):
+        from .models import DeadLetter
+
+        DeadLetter.objects.filter(pk=record_id).update(
+            replayed_at=timezone.now(), replay_task_id=replay_task_id
+        )
+
+    def delete(self, record_id):
+        from .models import DeadLetter
+
+        DeadLetter.objects.filter(pk=record_id).delete()
+
+
+class FileDeadLetterStore(BaseDeadLetterStore):
+    """
+    Store dead letters as JSON files in OPTIONS["DIRECTORY"].
+
+    Use a directory shared by all instances (e.g. a mounted volume) so that
+    dead letters of every instance can be replayed from one place.
+    """
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.directory = self.options["DIRECTORY"]
+
+    def _path(self, record_id):
+        return os.path.join(self.directory, f"{record_id}.json")
+
+    def _write(self, record):
+        data = record.as_dict()
+        tmp_path = f"{self._path(record.id)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(record.id))
+
+    def _read(self, filename):
+        with open(os.path.join(self.directory, filename)) as f:
+            data = json.load(f)
+        replayed_at = data["replayed_at"]
+        return DeadLetterRecord(
+            **{
+                **data,
+                "failed_at": datetime.fromisoformat(data["failed_at"]),
+                "replayed_at": datetime.fromisoformat(replayed_at)
+                if replayed_at
+                else None,
+            }
+        )
+
+    def add(self, payload, errors, attempts):
+        os.makedirs(self.directory, exist_ok=True)
+        failed_at = timezone.now()
+        task_id = payload.get("task_id", "")
+        record = DeadLetterRecord(
+            # Sortable by failure time
+            id=f"{failed_at.strftime('%Y%m%dT%H%M%S%f')}_{task_id}",
+            task_id=task_id,
+            task_path=payload.get("task_path", ""),
+            queue_name=payload.get("queue_name", ""),
+            backend=payload.get("backend", ""),
+            payload=payload,
+            errors=errors,
+            attempts=attempts,
+            failed_at=failed_at,
+        )
+        self._write(record)
+        return record
+
+    def list(
+        self,
+        ids=None,
+        task_path=None,
+        queue_name=None,
+        since=None,
+        until=None,
+        include_replayed=False,
+        limit=None,
+    ):
+        if not os.path.isdir(self.directory):
+            return []
+        ids = set(ids) if ids is not None else None
+        records = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                record = self._read(filename)
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning("Could not read dead letter %s: %s", filename, e)
+                continue
+            if _matches(
+                record, ids, task_path, queue_name, since, until, include_replayed
+            ):
+                records.append(record)
+                if limit is not None and len(records) >= limit:
+                    break
+        return records
+
+    def mark_replayed(self, record_id, replay_task_id):
+        record = self._read(f"{record_id}.json")
+        self._write(
+            replace(record, replayed_at=timezone.now(), replay_task_id=replay_task_id)
+        )
+
+    def delete(self, record_id):
+        try:
+            os.remove(self._path(record_id))
+        except FileNotFoundError:
+            pass
+
+
+@functools.cache
+def _load_store(backend, options):
+    return import_string(backend)(dict(options))
+
+
+def get_dead_letter_store():
+    """
+    Return the store configured by CLOUD_TASKS_DEAD_LETTER.
+
+    Returns:
+        BaseDeadLetterStore or None: None if dead-lettering is disabled
+    """
+    from django.conf import settings
+
+    config = getattr(settings, "CLOUD_TASKS_DEAD_LETTER", None)
+    if not config:
+        return None
+
+    backend = config.get(
+        "BACKEND", "django_tasks_cloud_tasks.deadletter.DatabaseDeadLetterStore"
+    )
+    options = tuple(sorted(config.get("OPTIONS", {}).items()))
+    return _load_store(backend, options)
+
+
+def get_final_attempt(payload):
+    """
+    Return the number of the last attempt Cloud Tasks makes for a task.
+
+    Returns:
+        int or None: None if unknown or unlimited
+    """
+    from django.conf import settings
+    from django.tasks import task_backends
+
+    queue_name = payload.get("queue_name")
+    config = getattr(settings, "CLOUD_TASKS_DEAD_LETTER", None) or {}
+    max_attempts = config.get("MAX_ATTEMPTS")
+    if isinstance(max_attempts, dict):
+        max_attempts = max_attempts.get(queue_name, max_attempts.get(DEFAULT_KEY))
+
+    if max_attempts is None:
+        try:
+            backend = task_backends[payload.get("backend")]
+        except Exception:
+            return None
+        definitions = getattr(backend, "queue_definitions", {})
+        max_attempts = definitions.get(queue_name, {}).get("max_attempts")
+
+    # -1 means unlimited attempts in Cloud Tasks
+    if max_attempts is None or max_attempts < 1:
+        return None
+    return max_attempts
+
+
+def dead_letter_if_final(payload, task_result, dispatch):
+    """
+    Store a failed task if this was its final attempt.
+
+    Errors of the store are logged, not raised.
+
+    Returns:
+        DeadLetterRecord or None
+    """
+    store = get_dead_letter_store()
+    if store is None or dispatch is None:
+        return None
+
+    final_attempt = get_final_attempt(payload)
+    if final_attempt is None or dispatch.attempt < final_attempt:
+        return None
+
+    errors = [
+        {"exception": error.exception_class_path, "traceback": error.traceback}
+        for error in task_result.errors
+    ]
+    record = _add(store, payload, errors, dispatch.attempt)
+    if record is not None:
+        logger.warning(
+            "Task dead-lettered after final attempt: id=%s path=%s attempt=%d",
+            payload.get("task_id"),
+            payload.get("task_path"),
+            dispatch.attempt,
+        )
+    return record
+
+
+def dead_letter_expired(payload, dispatch, reason):
+    """
+    Store a task acknowledged without running because it exceeded
+    CLOUD_TASKS_MAX_ATTEMPTS.
+
+    Errors of the store are logged, not raised.
+
+    Returns:
+        DeadLetterRecord or None
+    """
+    store = get_dead_letter_store()
+    if store is None:
+        return None
+
+    errors = [{"exception": EXPIRED_EXCEPTION, "traceback": reason}]
+    record = _add(store, payload, errors, dispatch.attempt)
+    if record is not None:
+        logger.warning(
+            "Task dead-lettered after max attempts: id=%s path=%s attempt=%d",
+            payload.get("task_id"),
+            payload.get("task_path"),
+            dispatch.attempt,
+        )
+    return record
+
+
+def _add(store, payload, errors, attempts):
+    try:
+        return store.add(payload, errors, attempts)
+    except Exception:
+        logger.exception("Could not store dead letter: id=%s", payload.get("task_id"))
+        return None
+
+
+# Replay
+
+
+@dataclass(slots=True)
+class ReplayResult:
+    """Outcome of a replay."""
+
+    replayed: dict = field(default_factory=dict)  # {record ID: new task ID}
+    failed: dict = field(default_factory=dict)  # {record ID: error}
+
+    def as_dict(self):
+        return {"replayed": self.replayed, "failed": self.failed}
+
+
+class _RateLimiter:
+    """Spaces calls at most rate per second across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(self._next, now)
+            self._next = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+
+def replay_record(record, patch=None, backend=None, queue_name=None):
+    """
+    Enqueue a dead-lettered task again.
+
+    Args:
+        record: DeadLetterRecord
+        patch: Callable (args, kwargs) -> (args, kwargs) changing arguments
+        backend: TASKS alias to enqueue through (default: the original one)
+        queue_name: Queue to enqueue to (default: the original one)
+
+    Returns:
+        TaskResult
+    """
+    payload = record.payload
+    args = list(payload.get("args", []))
+    kwargs = dict(payload.get("kwargs", {}))
+    if patch is not None:
+        args, kwargs = patch(args, kwargs)
+
+    task = import_string(record.task_path).using(
+        queue_name=queue_name or record.queue_name,
+        backend=backend or record.backend,
+    )
+    return task.enqueue(*args, **kwargs)
+
+
+def replay(
+    store,
+    records,
+    patch=None,
+    backend=None,
+    queue_name=None,
+    rate=None,
+    concurrency=DEFAULT_REPLAY_CONCURRENCY,
+    batch_size=DEFAULT_REPLAY_BATCH_SIZE,
+):
+    """
+    Replay dead letters in concurrent batches.
+
+    Each batch is enqueued on a thread pool, at most ``rate`` tasks per
+    second overall, and its records are marked replayed before the next
+    batch starts. Records that fail to enqueue stay in the store.
+
+    Returns:
+        ReplayResult
+    """
+    from django.db import close_old_connections
+
+    limiter = _RateLimiter(rate)
+    result = ReplayResult()
+
+    def enqueue(record):
+        limiter.wait()
+        try:
+            return replay_record(record, patch, backend, queue_name).id, None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+        finally:
+            close_old_connections()
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for start in range(0, len(records), batch_size):
+            batch = records[start : start + batch_size]
+            for record, (task_id, error) in zip(
+                batch, executor.map(enqueue, batch), strict=True
+            ):
+                if error is not None:
+                    result.failed[record.id] = error
+                    continue
+                result.replayed[record.id] = task_id
+                try:
+                    store.mark_replayed(record.id, task_id)
+                except Exception:
+                    logger.exception("Could not mark dead letter %s", record.id)
+    return result
@@ -0,0 +1,168 @@
+"""
+Collapsing of bursts of identical enqueues (debounce and throttle).
+
+    from datetime import timedelta
+
+    @task
+    @debounce(timedelta(seconds=30))
+    def reindex(doc_id):
+        ...
+
+Enqueues are keyed by task path and arguments (or by ``key(*args,
+**kwargs)``), and time is cut into windows of the given length. The task
+gets a Cloud Tasks name made of the key's hash and the window number, so
+Cloud Tasks rejects every further task of the same key in the window
+(ALREADY_EXISTS), and the enqueue returns the result of the first one:
+
+- ``debounce``: the task is scheduled at the end of the window, so the
+  enqueues of a window run once, after the burst
+- ``throttle``: the first task of a window runs right away, the others of
+  the window are dropped
+
+Names already created are cached per process until the end of their
+window, which saves the CreateTask RPC of repeated enqueues. Cloud Tasks
+refuses to reuse a task name for about an hour, so windows longer than that
+are only enforced by the local cache. Named tasks are deduplicated per
+location: with several CLOUD_TASKS_LOCATIONS, a failover can run the task
+once more.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+MODES = ("debounce", "throttle")
+POLICY_ATTRIBUTE = "cloudtasks_collapse"
+CACHE_SIZE = 10000
+
+
+@dataclass(frozen=True, slots=True)
+class CollapsePolicy:
+    """Window and key of a debounced or throttled task."""
+
+    mode: str
+    window: timedelta
+    key: object = None  # callable(*args, **kwargs), or None for all arguments
+
+    def task_name(self, task, args, kwargs, at):
+        """
+        Return the Cloud Tasks task ID and the end of the window of at.
+
+        Args:
+            task: Task being enqueued
+            args: Positional arguments of the task
+            kwargs: Keyword arguments of the task
+            at: Time the task would run (run_after or now)
+
+        Returns:
+            tuple: (task ID, datetime)
+        """
+        seconds = self.window.total_seconds()
+        window = math.floor(at.timestamp() / seconds)
+        key = self.key(*args, **kwargs) if self.key else [list(args), dict(kwargs)]
+        digest = hashlib.sha256(
+            json.dumps(
+                [task.module_path, key], sort_keys=True, separators=(",", ":")
+            ).encode()
+        ).hexdigest()
+        # Hash first: Cloud Tasks recommends names that don't share prefixes
+        return f"{digest[:32]}-{window}", datetime.fromtimestamp(
+            (window + 1) * seconds, UTC
+        )
+
+
+def _decorator(mode, window, key):
+    if not isinstance(window, timedelta):
+        window = timedelta(seconds=window)
+    if window <= timedelta():
+        raise ValueError(f"{mode} window must be positive, got {window}")
+    policy = CollapsePolicy(mode, window, key)
+
+    def decorator(func):
+        setattr(func, POLICY_ATTRIBUTE, policy)
+        return func
+
+    return decorator
+
+
+def debounce(window, key=None):
+    """
+    Decorator running a task once per window, at the end of the window.
+
+    Apply it below ``@task``, to the function itself.
+
+    Args:
+        window: timedelta or seconds
+        key: Callable returning the JSON-serializable key of the arguments
+             (default: all arguments)
+    """
+    return _decorator("debounce", window, key)
+
+
+def throttle(window, key=None):
+    """
+    Decorator running a task at most once per window, at the first enqueue.
+
+    Apply it below ``@task``, to the function itself.
+
+    Args:
+        window: timedelta or seconds
+        key: Callable returning the JSON-serializable key of the arguments
+             (default: all arguments)
+    """
+    return _decorator("throttle", window, key)
+
+
+def get_collapse_policy(task):
+    """Return the CollapsePolicy of a task, or None."""
+    return getattr(task.func, POLICY_ATTRIBUTE, None)
+
+
+class CreatedTaskCache:
+    """Bounded LRU cache of task names created in the current window."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, key, now):
+        """Whether key was added and its window has not ended at now."""
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if now.timestamp() < expires_at:
+                return True
+            del self._entries[key]
+            return False
+
+    def add(self, key, expires_at):
+        """Remember key until expires_at (datetime)."""
+        with self._lock:
+            self._entries[key] = expires_at.timestamp()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+created_tasks = CreatedTaskCache()
+
+
+def _after_fork():
+    created_tasks._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
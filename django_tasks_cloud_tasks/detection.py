@@ -8,6 +8,9 @@ METADATA_SERVER = "http://metadata.google.internal"
 METADATA_HEADERS = {"Metadata-Flavor": "Google"}
 METADATA_TIMEOUT = 2  # seconds
 
+# Successful metadata lookups, cached for the lifetime of the process
+_metadata_cache = {}
+
 
 def is_cloud_run():
     """Check if running in Cloud Run environment."""
@@ -118,13 +121,33 @@ def detect_task_handler_host():
     return None
 
 
+def detect_app_engine_routing():
+    """
+    Detect the App Engine service and version tasks should be routed to.
+
+    Uses GAE_SERVICE and GAE_VERSION, so tasks run on the version that
+    enqueued them (Blue/Green support).
+    """
+    routing = {
+        "service": os.environ.get("GAE_SERVICE"),
+        "version": os.environ.get("GAE_VERSION"),
+    }
+    return {key: value for key, value in routing.items() if value}
+
+
 def _get_metadata(path):
     """Fetch data from metadata server."""
+    if path in _metadata_cache:
+        return _metadata_cache[path]
+
     url = f"{METADATA_SERVER}/computeMetadata/v1/{path}"
     request = urllib.request.Request(url, headers=METADATA_HEADERS)
 
     try:
         with urllib.request.urlopen(request, timeout=METADATA_TIMEOUT) as response:
-            return response.read().decode("utf-8")
+            value = response.read().decode("utf-8")
     except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError):
         return None
+
+    _metadata_cache[path] = value
+    return value
@@ -0,0 +1,134 @@
+"""
+Cloud Tasks dispatch information and task expiry.
+
+Cloud Tasks describes each dispatch with request headers:
+
+- X-CloudTasks-QueueName / X-CloudTasks-TaskName
+- X-CloudTasks-TaskRetryCount: number of times the task has been retried
+- X-CloudTasks-TaskExecutionCount: number of times the handler responded
+- X-CloudTasks-TaskETA: schedule time of the dispatch (seconds since epoch)
+
+App Engine targets receive the same headers with the X-AppEngine- prefix.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from django.utils import timezone
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+# Key of the fallback entry in CLOUD_TASKS_TASK_TTL / CLOUD_TASKS_MAX_ATTEMPTS
+DEFAULT_KEY = "*"
+
+
+def get_dispatch_header(headers, name):
+    """Return X-CloudTasks-<name>, or X-AppEngine-<name> of App Engine targets."""
+    value = headers.get(f"X-CloudTasks-{name}")
+    if value is None:
+        value = headers.get(f"X-AppEngine-{name}")
+    return value
+
+
+def _int_header(headers, name):
+    try:
+        return int(get_dispatch_header(headers, name) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass(frozen=True, slots=True)
+class DispatchInfo:
+    """Dispatch details of one task request."""
+
+    queue_name: str | None = None
+    task_name: str | None = None
+    retry_count: int = 0
+    execution_count: int = 0
+    eta: datetime | None = None
+    received_at: datetime | None = None
+
+    @classmethod
+    def from_headers(cls, headers, now=None):
+        """Build DispatchInfo from the headers of a task request."""
+        eta = None
+        eta_header = get_dispatch_header(headers, "TaskETA")
+        if eta_header:
+            try:
+                eta = datetime.fromtimestamp(float(eta_header), UTC)
+            except (ValueError, OverflowError, OSError):
+                pass
+
+        return cls(
+            queue_name=get_dispatch_header(headers, "QueueName"),
+            task_name=get_dispatch_header(headers, "TaskName"),
+            retry_count=_int_header(headers, "TaskRetryCount"),
+            execution_count=_int_header(headers, "TaskExecutionCount"),
+            eta=eta,
+            received_at=now or timezone.now(),
+        )
+
+    @property
+    def attempt(self):
+        """Number of this attempt, starting at 1."""
+        return self.retry_count + 1
+
+    @property
+    def dispatch_lag(self):
+        """Seconds between the scheduled time and receipt, or None."""
+        if self.eta is None or self.received_at is None:
+            return None
+        return (self.received_at - self.eta).total_seconds()
+
+
+def _lookup(setting_name, task_path):
+    from django.conf import settings
+
+    values = getattr(settings, setting_name, None)
+    if not values:
+        return None
+    if task_path in values:
+        return values[task_path]
+    return values.get(DEFAULT_KEY)
+
+
+def exceeds_max_attempts(payload, dispatch):
+    """Whether a delivery exceeds CLOUD_TASKS_MAX_ATTEMPTS of its task."""
+    max_attempts = _lookup("CLOUD_TASKS_MAX_ATTEMPTS", payload.get("task_path"))
+    return max_attempts is not None and dispatch.attempt > max_attempts
+
+
+def get_expiry_reason(payload, dispatch):
+    """
+    Check whether a delivery should be acknowledged without running.
+
+    Uses CLOUD_TASKS_TASK_TTL (maximum age in seconds, counted from the
+    scheduled time of the task) and CLOUD_TASKS_MAX_ATTEMPTS, both keyed by
+    task path with "*" as fallback.
+
+    Returns:
+        str or None: Reason the delivery is stale, or None to run it
+    """
+    task_path = payload.get("task_path")
+
+    max_attempts = _lookup("CLOUD_TASKS_MAX_ATTEMPTS", task_path)
+    if max_attempts is not None and dispatch.attempt > max_attempts:
+        return f"attempt {dispatch.attempt} exceeds max attempts {max_attempts}"
+
+    ttl = _lookup("CLOUD_TASKS_TASK_TTL", task_path)
+    if ttl is not None:
+        scheduled_at = payload.get("run_after") or payload.get("enqueued_at")
+        if scheduled_at:
+            try:
+                scheduled_at = datetime.fromisoformat(scheduled_at)
+            except ValueError:
+                return None
+            if timezone.is_naive(scheduled_at):
+                scheduled_at = scheduled_at.replace(tzinfo=UTC)
+            now = dispatch.received_at or timezone.now()
+            age = (now - scheduled_at).total_seconds()
+            if age > ttl:
+                return f"age {age:.0f}s exceeds TTL {ttl}s"
+
+    return None
@@ -0,0 +1,152 @@
+"""
+Middleware-free WSGI/ASGI task endpoint.
+
+Wraps the project's Django application and handles task requests from
+Cloud Tasks directly, without URL resolution, the middleware stack or
+view dispatch. All other requests fall through to the wrapped application.
+
+Usage (wsgi.py):
+    from django.core.wsgi import get_wsgi_application
+    from django_tasks_cloud_tasks.endpoint import TaskEndpointWSGI
+
+    application = TaskEndpointWSGI(get_wsgi_application())
+"""
+
+import json
+from http import HTTPStatus
+
+from asgiref.sync import sync_to_async
+from django.core import signals
+from django.http.request import HttpHeaders
+from django.utils.datastructures import CaseInsensitiveMapping
+
+from .handler import get_default_auth_handler, handle_task_request
+
+DEFAULT_TASK_PATH = "/cloudtasks/execute/"
+
+METHOD_NOT_ALLOWED = (405, {"error": "Method not allowed"}, {"Allow": "POST"})
+
+
+class TaskRequest:
+    """Minimal request object passed to auth handlers and the task handler."""
+
+    __slots__ = ("headers", "body")
+
+    def __init__(self, headers, body):
+        self.headers = headers
+        self.body = body
+
+
+def _build_response(status, data, headers):
+    body = json.dumps(data).encode()
+    response_headers = [
+        ("Content-Type", "application/json"),
+        ("Content-Length", str(len(body))),
+    ]
+    response_headers.extend((name, str(value)) for name, value in headers.items())
+    return body, response_headers
+
+
+class BaseTaskEndpoint:
+    """Common configuration of the WSGI and ASGI task endpoints."""
+
+    def __init__(self, application, path=DEFAULT_TASK_PATH, auth_handler=None):
+        """
+        Args:
+            application: Django WSGI/ASGI application to fall through to
+            path: Request path handled by the endpoint
+            auth_handler: Authentication handler. Defaults to the handler
+                          configured in Django settings (as ExecuteTaskView).
+        """
+        self.application = application
+        self.path = path
+        self.auth_handler = auth_handler
+
+    def get_auth_handler(self):
+        if self.auth_handler is not None:
+            return self.auth_handler
+        return get_default_auth_handler()
+
+    def handle(self, headers, body):
+        """
+        Handle a task request.
+
+        Sends request_started/request_finished so that database connections
+        are managed as in a regular Django request.
+
+        Returns:
+            tuple: (status code, response data dict, extra response headers dict)
+        """
+        signals.request_started.send(sender=self.__class__)
+        try:
+            return handle_task_request(
+                TaskRequest(headers, body), self.get_auth_handler()
+            )
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+
+
+class TaskEndpointWSGI(BaseTaskEndpoint):
+    """WSGI application handling task requests in front of Django."""
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") != self.path:
+            return self.application(environ, start_response)
+
+        if environ.get("REQUEST_METHOD") != "POST":
+            status, data, headers = METHOD_NOT_ALLOWED
+        else:
+            try:
+                content_length = int(environ.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                content_length = 0
+            request_body = environ["wsgi.input"].read(content_length)
+            status, data, headers = self.handle(HttpHeaders(environ), request_body)
+
+        body, response_headers = _build_response(status, data, headers)
+        start_response(f"{status} {HTTPStatus(status).phrase}", response_headers)
+        return [body]
+
+
+class TaskEndpointASGI(BaseTaskEndpoint):
+    """ASGI application handling task requests in front of Django."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.application(scope, receive, send)
+
+        if scope["method"] != "POST":
+            status, data, headers = METHOD_NOT_ALLOWED
+        else:
+            chunks = []
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    break
+
+            headers = CaseInsensitiveMapping(
+                {
+                    name.decode("latin1"): value.decode("latin1")
+                    for name, value in scope["headers"]
+                }
+            )
+            # Tasks and auth handlers are synchronous code
+            status, data, headers = await sync_to_async(
+                self.handle, thread_sensitive=True
+            )(headers, b"".join(chunks))
+
+        body, response_headers = _build_response(status, data, headers)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (name.lower().encode("latin1"), value.encode("latin1"))
+                    for name, value in response_headers
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
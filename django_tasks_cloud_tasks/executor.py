@@ -1,6 +1,8 @@
 """Task execution logic."""
 
 import logging
+import time
+from datetime import UTC, datetime
 from traceback import format_exception
 
 from django.tasks.base import TaskContext, TaskError, TaskResult, TaskResultStatus
@@ -8,34 +10,129 @@ from django.tasks.signals import task_finished, task_started
 from django.utils import timezone
 from django.utils.module_loading import import_string
 
+from . import metrics, tracing
+from .cloud_logging import should_log_success
+from .deadletter import dead_letter_if_final
+from .dispatch import DispatchInfo, get_expiry_reason
+from .inline import (
+    DUPLICATE,
+    EXECUTED,
+    EXPIRED,
+    collect_continuations,
+    get_inline_budget,
+    is_collecting,
+    run_continuations,
+)
+from .ledger import COMPLETED, IN_PROGRESS, claim_task, finish_claim
+from .limits import ConcurrencyLimitExceeded, acquire_concurrency_slots
+from .memory import track_memory
+from .profiling import profile_task
+
 # Logger with naming convention similar to django-database-task
 # Allows distinguishing log sources when using multiple backends
 logger = logging.getLogger("django_tasks_cloud_tasks")
 
 
-def execute_task_from_payload(payload, worker_id):
+def _log_extra(task_id, task_path, queue_name, duration, attempt):
+    """Log record attributes, written as labels by CloudLoggingFormatter."""
+    return {
+        "task_id": task_id,
+        "task_path": task_path,
+        "queue": queue_name,
+        "duration": round(duration, 6),
+        "attempt": attempt,
+    }
+
+
+def execute_task_from_payload(payload, worker_id, dispatch=None):
     """
     Execute task from payload.
 
+    With CLOUD_TASKS_INLINE_BUDGET set, inline-eligible tasks enqueued by
+    the task run afterwards in this call (see inline.py).
+
     Args:
         payload: Payload received from Cloud Tasks (dict)
         worker_id: Worker identifier
+        dispatch: DispatchInfo parsed from the request headers, if any
 
     Returns:
-        tuple: (TaskResult, success: bool)
+        tuple: (TaskResult, success: bool) of the task of the payload
+    """
+    budget = get_inline_budget()
+    if budget is None or is_collecting():
+        return _execute_task(payload, worker_id, dispatch)
+
+    deadline = time.monotonic() + budget
+    with collect_continuations() as continuations:
+        task_result, success = _execute_task(payload, worker_id, dispatch)
+        run_continuations(
+            continuations,
+            lambda child_payload: _execute_continuation(child_payload, worker_id),
+            success,
+            deadline,
+        )
+    return task_result, success
+
+
+def _execute_continuation(payload, worker_id):
     """
+    Run an inline continuation with the checks of a dispatched task.
+
+    Returns:
+        str: Outcome for run_continuations
+    """
+    task_id = payload["task_id"]
+    task_path = payload["task_path"]
+    queue_name = payload["queue_name"]
+
+    if get_expiry_reason(payload, DispatchInfo(received_at=timezone.now())):
+        return EXPIRED
+
+    ledger, claim, token = claim_task(task_id)
+    if claim == COMPLETED:
+        return DUPLICATE
+    if claim == IN_PROGRESS:
+        return "in_progress"
+
+    try:
+        slots = acquire_concurrency_slots(task_path, queue_name)
+    except ConcurrencyLimitExceeded:
+        finish_claim(ledger, task_id, token, False)
+        return "concurrency_limited"
+
+    success = False
+    try:
+        with tracing.span(
+            "cloudtasks.execute",
+            {
+                "cloudtasks.task_id": str(task_id),
+                "cloudtasks.task_path": str(task_path),
+                "cloudtasks.attempt": 1,
+                "cloudtasks.inline": True,
+            },
+        ):
+            _, success = _execute_task(payload, worker_id)
+    finally:
+        slots.release()
+        finish_claim(ledger, task_id, token, success)
+    return EXECUTED if success else "failed"
+
+
+def _execute_task(payload, worker_id, dispatch=None):
     from .backends import CloudTasksBackend
 
     task_id = payload["task_id"]
     task_path = payload["task_path"]
     args = payload["args"]
     kwargs = payload["kwargs"]
-    # queue_name and priority are stored in payload for potential future use
-    _ = payload["queue_name"]  # noqa: F841
+    queue_name = payload["queue_name"]
+    # priority is stored in payload for potential future use
     backend_alias = payload["backend"]
     _ = payload.get("priority", 0)  # noqa: F841
     takes_context = payload.get("takes_context", False)
     enqueued_at_str = payload.get("enqueued_at")
+    run_after_str = payload.get("run_after")
 
     # Get task function
     task_func = import_string(task_path)
@@ -43,12 +140,32 @@ def execute_task_from_payload(payload, worker_id):
     # Parse enqueued_at
     enqueued_at = None
     if enqueued_at_str:
-        from datetime import datetime
-
         enqueued_at = datetime.fromisoformat(enqueued_at_str)
 
     now = timezone.now()
 
+    # Queue wait counts from the scheduled time for deferred tasks
+    metrics.ensure_multiproc_flusher()
+    scheduled_at = enqueued_at
+    if run_after_str:
+        try:
+            scheduled_at = datetime.fromisoformat(run_after_str)
+        except ValueError:
+            pass
+    if scheduled_at is not None:
+        if timezone.is_naive(scheduled_at):
+            scheduled_at = scheduled_at.replace(tzinfo=UTC)
+        metrics.TASK_QUEUE_WAIT.observe(
+            max((now - scheduled_at).total_seconds(), 0), task_path, queue_name
+        )
+
+    # TaskResult.attempts (and TaskContext.attempt) is len(worker_ids), so
+    # worker_ids holds a "" placeholder for each earlier attempt, whose
+    # worker is unknown, followed by this worker. Real IDs are the non-empty
+    # entries; the attempt number itself comes from the dispatch headers.
+    attempt = dispatch.attempt if dispatch else 1
+    worker_ids = [""] * (attempt - 1) + [worker_id]
+
     # Build TaskResult
     task_result = TaskResult(
         task=task_func,
@@ -62,32 +179,39 @@ def execute_task_from_payload(payload, worker_id):
         kwargs=kwargs,
         backend=backend_alias,
         errors=[],
-        worker_ids=[worker_id],
+        worker_ids=worker_ids,
     )
 
     # Send task_started signal
     task_started.send(sender=CloudTasksBackend, task_result=task_result)
 
+    start = time.perf_counter()
     try:
         # Execute task
-        if takes_context:
-            result = task_func.call(
-                TaskContext(task_result=task_result), *args, **kwargs
-            )
-        else:
-            result = task_func.call(*args, **kwargs)
+        with track_memory(task_id, task_path), profile_task(task_id, task_path):
+            if takes_context:
+                result = task_func.call(
+                    TaskContext(task_result=task_result), *args, **kwargs
+                )
+            else:
+                result = task_func.call(*args, **kwargs)
 
         # Success
+        duration = time.perf_counter() - start
+        metrics.TASK_DURATION.observe(duration, task_path, queue_name)
+        metrics.TASK_EXECUTIONS.inc(task_path, queue_name, "success")
         object.__setattr__(task_result, "finished_at", timezone.now())
         object.__setattr__(task_result, "status", TaskResultStatus.SUCCESSFUL)
         object.__setattr__(task_result, "_return_value", result)
 
-        # Log output (format similar to django-database-task)
-        logger.info(
-            "Task completed successfully: id=%s path=%s",
-            task_result.id,
-            task_path,
-        )
+        # Log output (format similar to django-database-task), sampled
+        if should_log_success(logger, task_path):
+            logger.info(
+                "Task completed successfully: id=%s path=%s",
+                task_result.id,
+                task_path,
+                extra=_log_extra(task_id, task_path, queue_name, duration, attempt),
+            )
 
         task_finished.send(sender=CloudTasksBackend, task_result=task_result)
 
@@ -95,6 +219,9 @@ def execute_task_from_payload(payload, worker_id):
 
     except Exception as e:
         # Failure
+        duration = time.perf_counter() - start
+        metrics.TASK_DURATION.observe(duration, task_path, queue_name)
+        metrics.TASK_EXECUTIONS.inc(task_path, queue_name, "failure")
         object.__setattr__(task_result, "finished_at", timezone.now())
         object.__setattr__(task_result, "status", TaskResultStatus.FAILED)
 
@@ -111,8 +238,12 @@ def execute_task_from_payload(payload, worker_id):
             task_result.id,
             task_path,
             error.exception_class_path,
+            extra=_log_extra(task_id, task_path, queue_name, duration, attempt),
         )
 
+        # Keep the payload once Cloud Tasks gives up on the task
+        dead_letter_if_final(payload, task_result, dispatch)
+
         task_finished.send(sender=CloudTasksBackend, task_result=task_result)
 
         return task_result, False
@@ -0,0 +1,231 @@
+"""
+Handling of task requests from Cloud Tasks.
+
+Shared by ExecuteTaskView and the middleware-free WSGI/ASGI endpoint.
+Requests only need ``headers`` (case-insensitive mapping) and ``body``.
+"""
+
+import json
+import logging
+
+from django.utils.crypto import get_random_string
+
+from . import memory, metrics, tracing
+from .deadletter import dead_letter_expired
+from .dispatch import (
+    DispatchInfo,
+    exceeds_max_attempts,
+    get_dispatch_header,
+    get_expiry_reason,
+)
+from .executor import execute_task_from_payload
+from .ledger import COMPLETED, IN_PROGRESS, claim_task, finish_claim
+from .limits import (
+    ConcurrencyLimitExceeded,
+    acquire_concurrency_slots,
+    get_shed_response,
+)
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+# Retry-After for deliveries of a task that is still running elsewhere
+DUPLICATE_RETRY_AFTER = 30  # seconds
+
+
+def get_default_auth_handler():
+    """
+    Get authentication handler configured in Django settings.
+
+    Uses HMAC signatures if CLOUD_TASKS_HMAC_KEYS is set, otherwise
+    OIDC tokens if CLOUD_TASKS_OIDC_AUDIENCE is set. On App Engine (or with
+    CLOUD_TASKS_APP_ENGINE_AUTH), requests from App Engine task targets are
+    accepted by their X-AppEngine-QueueName header first.
+    """
+    from django.conf import settings
+
+    handler = None
+    hmac_keys = getattr(settings, "CLOUD_TASKS_HMAC_KEYS", None)
+    audience = getattr(settings, "CLOUD_TASKS_OIDC_AUDIENCE", None)
+    if hmac_keys:
+        from .auth import DEFAULT_HMAC_MAX_AGE, get_hmac_auth_handler
+
+        handler = get_hmac_auth_handler(
+            tuple(hmac_keys.items()),
+            getattr(settings, "CLOUD_TASKS_HMAC_MAX_AGE", DEFAULT_HMAC_MAX_AGE),
+        )
+    elif audience:
+        from .auth import get_configured_auth_handler
+
+        handler = get_configured_auth_handler(audience)
+
+    app_engine_auth = getattr(settings, "CLOUD_TASKS_APP_ENGINE_AUTH", None)
+    if app_engine_auth is None:
+        from .detection import is_app_engine
+
+        app_engine_auth = is_app_engine()
+    if app_engine_auth:
+        from .auth import get_app_engine_auth_handler
+
+        return get_app_engine_auth_handler(handler)
+
+    return handler
+
+
+def handle_task_request(request, auth_handler=None, now=None):
+    """
+    Authenticate a task request, execute its task and build the response.
+
+    Args:
+        request: Object with ``headers`` and ``body`` attributes
+        auth_handler: Authentication handler, or None to skip authentication
+        now: Time the request was received (default: timezone.now())
+
+    Returns:
+        tuple: (status code, response data dict, extra response headers dict)
+    """
+    queue_name = get_dispatch_header(request.headers, "QueueName") or ""
+    with tracing.continue_trace(
+        request.headers, attributes={"cloudtasks.queue": queue_name}
+    ):
+        response = _handle_task_request(request, auth_handler, now)
+    metrics.DISPATCH_RESPONSES.inc(queue_name, str(response[0]))
+
+    recycle_rss = memory.recycle_requested()
+    if recycle_rss is not None:
+        status, data, headers = response
+        response = (
+            status,
+            data,
+            {**headers, memory.RECYCLE_HEADER: f"rss={recycle_rss}"},
+        )
+    return response
+
+
+def _handle_task_request(request, auth_handler, now):
+    # Authentication
+    if auth_handler:
+        with tracing.span("cloudtasks.auth"):
+            is_valid, error_message = auth_handler(request)
+        if not is_valid:
+            logger.warning("Authentication failed: %s", error_message)
+            return 401, {"error": "Unauthorized", "detail": error_message}, {}
+
+    # Parse request body
+    try:
+        with tracing.span("cloudtasks.deserialize"):
+            payload = json.loads(request.body)
+    except json.JSONDecodeError as e:
+        return 400, {"error": "Invalid JSON", "detail": str(e)}, {}
+    if not isinstance(payload, dict):
+        return 400, {"error": "Invalid payload", "detail": "Expected an object"}, {}
+
+    # Acknowledge stale deliveries without running them
+    dispatch = DispatchInfo.from_headers(request.headers, now)
+    if dispatch.dispatch_lag is not None:
+        metrics.DISPATCH_LAG.observe(
+            max(dispatch.dispatch_lag, 0),
+            payload.get("task_path", ""),
+            payload.get("queue_name", ""),
+        )
+        logger.debug(
+            "Dispatch received: id=%s attempt=%d dispatch_lag=%.3fs",
+            payload.get("task_id"),
+            dispatch.attempt,
+            dispatch.dispatch_lag,
+        )
+    task_id = payload.get("task_id")
+    expiry_reason = get_expiry_reason(payload, dispatch)
+    if expiry_reason:
+        logger.warning(
+            "Task expired, acknowledged without running: id=%s reason=%s",
+            task_id,
+            expiry_reason,
+        )
+        # Cloud Tasks drops the task once acknowledged; keep it if it was
+        # given up on rather than outdated
+        if exceeds_max_attempts(payload, dispatch):
+            dead_letter_expired(payload, dispatch, expiry_reason)
+        return (
+            200,
+            {"status": "expired", "task_id": task_id, "detail": expiry_reason},
+            {},
+        )
+
+    # Send work elsewhere while this process waits to be recycled
+    recycle_response = memory.get_recycle_response()
+    if recycle_response is not None:
+        return recycle_response
+
+    # Duplicate delivery suppression
+    ledger, claim, token = claim_task(task_id)
+    if claim == COMPLETED:
+        logger.info("Duplicate delivery acknowledged: id=%s", task_id)
+        return 200, {"status": "duplicate", "task_id": task_id}, {}
+    if claim == IN_PROGRESS:
+        return (
+            409,
+            {"error": "Task is already running", "task_id": task_id},
+            {"Retry-After": str(DUPLICATE_RETRY_AFTER)},
+        )
+
+    # Load shedding: answer quickly so Cloud Tasks backs off and retries
+    try:
+        slots = acquire_concurrency_slots(
+            payload.get("task_path"), payload.get("queue_name")
+        )
+    except ConcurrencyLimitExceeded as e:
+        logger.warning("Dispatch rejected: %s", e)
+        metrics.DISPATCH_REJECTIONS.inc(
+            payload.get("task_path", ""), payload.get("queue_name", "")
+        )
+        finish_claim(ledger, task_id, token, False)
+        status, headers = get_shed_response()
+        return (
+            status,
+            {"error": "Too many concurrent executions", "detail": str(e)},
+            headers,
+        )
+
+    # Generate worker ID
+    worker_id = get_random_string(32)
+
+    # Execute task
+    success = False
+    try:
+        with tracing.span(
+            "cloudtasks.execute",
+            {
+                "cloudtasks.task_id": str(task_id),
+                "cloudtasks.task_path": str(payload.get("task_path")),
+                "cloudtasks.attempt": dispatch.attempt,
+            },
+        ):
+            task_result, success = execute_task_from_payload(
+                payload, worker_id, dispatch
+            )
+    except Exception as e:
+        logger.exception("Task execution failed")
+        return 500, {"error": "Task execution failed", "detail": str(e)}, {}
+    finally:
+        slots.release()
+        finish_claim(ledger, task_id, token, success)
+
+    if success:
+        return 200, {"status": "success", "task_id": task_result.id}, {}
+
+    # Return 500 to enable Cloud Tasks retry
+    return (
+        500,
+        {
+            "status": "failed",
+            "task_id": task_result.id,
+            "errors": [
+                {
+                    "exception": err.exception_class_path,
+                    "traceback": err.traceback,
+                }
+                for err in task_result.errors
+            ],
+        },
+        {},
+    )
@@ -0,0 +1,183 @@
+"""
+Inline continuation: run follow-up tasks in the dispatch of their parent.
+
+A task that enqueues a child task pays a full Cloud Tasks round trip for
+every step of a workflow. With a budget configured on the handler side:
+
+    CLOUD_TASKS_INLINE_BUDGET = 5  # seconds, counted from the parent's start
+
+tasks marked with ``@inline`` and enqueued while another task executes are
+not sent to Cloud Tasks. They run in the same process right after the
+parent finishes, in enqueue order, including the tasks they enqueue in
+turn:
+
+    @task
+    @inline
+    def send_receipt(order_id):
+        ...
+
+Inline tasks go through the same checks as dispatched ones: TTL
+expiry, duplicate delivery suppression, concurrency limits and tracing.
+Expired and already completed tasks are dropped. Tasks are only sent to
+Cloud Tasks, with the same ID and payload, when:
+
+- the budget has run out
+- the parent failed (it will be retried, its children are kept)
+- the task is running elsewhere or its concurrency limit is reached
+- the inline execution of the task failed or raised, so Cloud Tasks
+  retries it
+
+A task that cannot be sent is logged and counted with the
+``enqueue_failed`` outcome; the parent still succeeds.
+
+Deferred (run_after), debounced and throttled tasks are always sent to
+Cloud Tasks. The queue's dispatch deadline must cover the parent and the
+budget.
+"""
+
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import time
+from dataclasses import dataclass
+
+from . import metrics
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+INLINE_ATTRIBUTE = "cloudtasks_inline"
+
+# Outcomes of continuations run, or dropped without running
+EXECUTED = "executed"
+DUPLICATE = "duplicate"
+EXPIRED = "expired"
+DROPPED_OUTCOMES = frozenset({EXECUTED, DUPLICATE, EXPIRED})
+
+_continuations = contextvars.ContextVar("cloud_tasks_continuations", default=None)
+
+
+def inline(func):
+    """
+    Decorator marking a task as eligible to run inline after its parent.
+
+    Apply it below ``@task``, to the function itself.
+    """
+    setattr(func, INLINE_ATTRIBUTE, True)
+    return func
+
+
+def get_inline_budget():
+    """Return CLOUD_TASKS_INLINE_BUDGET in seconds, or None if disabled."""
+    from django.conf import settings
+
+    return getattr(settings, "CLOUD_TASKS_INLINE_BUDGET", None)
+
+
+@dataclass(slots=True)
+class Continuation:
+    """Follow-up task held back from Cloud Tasks."""
+
+    backend: object
+    task: object
+    task_id: str
+    body: bytes
+    headers: dict
+
+    def enqueue(self, outcome):
+        """
+        Send the task to Cloud Tasks after all.
+
+        Failures are logged and counted, not raised: the parent has run.
+        """
+        try:
+            self.backend.create_task(self.task, self.task_id, self.body, self.headers)
+        except Exception:
+            logger.exception(
+                "Inline continuation could not be enqueued: id=%s task=%s",
+                self.task_id,
+                self.task.module_path,
+            )
+            outcome = "enqueue_failed"
+        self.record(outcome)
+
+    def record(self, outcome):
+        """Count the outcome of the continuation."""
+        metrics.INLINE_CONTINUATIONS.inc(
+            self.task.module_path, self.task.queue_name, outcome
+        )
+
+
+def hold_back(backend, task, task_id, body, headers):
+    """
+    Keep an enqueued task for inline execution, if possible.
+
+    Returns:
+        bool: False if the task must be sent to Cloud Tasks
+    """
+    continuations = _continuations.get()
+    if (
+        continuations is None
+        or task.run_after is not None
+        or not getattr(task.func, INLINE_ATTRIBUTE, False)
+    ):
+        return False
+    continuations.append(Continuation(backend, task, task_id, body, headers))
+    return True
+
+
+@contextlib.contextmanager
+def collect_continuations():
+    """Collect the inline-eligible tasks enqueued in the block."""
+    continuations = collections.deque()
+    token = _continuations.set(continuations)
+    try:
+        yield continuations
+    finally:
+        _continuations.reset(token)
+
+
+def is_collecting():
+    """Whether continuations of a parent task are being collected."""
+    return _continuations.get() is not None
+
+
+def run_continuations(continuations, execute, parent_succeeded, deadline):
+    """
+    Run collected tasks until the deadline, then send the rest to Cloud Tasks.
+
+    Args:
+        continuations: Deque of Continuation, extended by the tasks run
+        execute: Callable taking a payload and returning the outcome:
+                 "executed", "duplicate" or "expired", else the reason to
+                 send the task to Cloud Tasks
+        parent_succeeded: Whether the parent task succeeded
+        deadline: time.monotonic() value at which the budget runs out
+    """
+    try:
+        while continuations:
+            continuation = continuations.popleft()
+            if not parent_succeeded:
+                continuation.enqueue("parent_failed")
+            elif time.monotonic() >= deadline:
+                continuation.enqueue("budget_exhausted")
+            else:
+                try:
+                    outcome = execute(json.loads(continuation.body))
+                except Exception:
+                    # The parent has succeeded: a child must not fail it
+                    logger.exception(
+                        "Inline continuation failed: id=%s task=%s",
+                        continuation.task_id,
+                        continuation.task.module_path,
+                    )
+                    outcome = "failed"
+                if outcome in DROPPED_OUTCOMES:
+                    continuation.record(outcome)
+                else:
+                    continuation.enqueue(outcome)
+    finally:
+        # Never lose the siblings of a continuation that did not return
+        while continuations:
+            continuations.popleft().enqueue("aborted")
@@ -0,0 +1,271 @@
+"""
+Completion ledger for suppressing duplicate deliveries.
+
+Cloud Tasks delivers at least once, so a task may be dispatched again after
+it has already run (e.g. when the response was lost to a network error).
+When enabled, the task handler claims each task ID in the ledger before
+executing it:
+
+- already completed: the dispatch is acknowledged without running the task
+- being executed by another dispatch (lease not expired): the dispatch is
+  rejected with 409 so Cloud Tasks retries it later
+- otherwise: the task runs, and is marked completed on success or
+  released on failure so a retry can run it again
+
+Configure in Django settings:
+
+    CLOUD_TASKS_DEDUPLICATION = {
+        "BACKEND": "django_tasks_cloud_tasks.ledger.CacheLedger",
+        "OPTIONS": {"CACHE": "default"},
+    }
+"""
+
+import abc
+import functools
+import logging
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+CLAIMED = "claimed"
+COMPLETED = "completed"
+IN_PROGRESS = "in_progress"
+
+# How long a running execution holds its task ID. Must exceed the longest
+# task duration, or a redelivery may run concurrently.
+DEFAULT_LEASE_TIMEOUT = 600  # seconds
+# How long completed task IDs are remembered. Should cover the queue's
+# retry period.
+DEFAULT_COMPLETED_TIMEOUT = 86400  # seconds
+
+
+class BaseLedger(abc.ABC):
+    """Interface of completion ledgers."""
+
+    def __init__(self, options=None):
+        options = options or {}
+        self.lease_timeout = options.get("LEASE_TIMEOUT", DEFAULT_LEASE_TIMEOUT)
+        self.completed_timeout = options.get(
+            "COMPLETED_TIMEOUT", DEFAULT_COMPLETED_TIMEOUT
+        )
+
+    @abc.abstractmethod
+    def claim(self, task_id):
+        """
+        Try to take the lease on task_id.
+
+        Returns:
+            tuple: (CLAIMED, COMPLETED or IN_PROGRESS, token identifying the
+                   lease if CLAIMED, else None)
+        """
+
+    @abc.abstractmethod
+    def complete(self, task_id):
+        """Mark task_id as completed."""
+
+    @abc.abstractmethod
+    def release(self, task_id, token):
+        """
+        Give up the lease on task_id so a retry can run it.
+
+        Does nothing if the lease is no longer the one identified by token,
+        e.g. because it expired and another dispatch claimed the task.
+        """
+
+
+class CacheLedger(BaseLedger):
+    """
+    Ledger stored in a Django cache.
+
+    Relies on the atomic ``add()`` of the cache backend; use a shared
+    backend (Redis, Memcached, database) when running multiple instances.
+    The lease stores its token, and release() only deletes the entry if it
+    still holds that token. Django caches have no atomic compare-and-delete,
+    so a lease taken over between the check and the delete can still be
+    dropped; this only happens when a task outlives LEASE_TIMEOUT.
+    """
+
+    key_prefix = "django_tasks_cloud_tasks:ledger:"
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.cache_alias = (options or {}).get("CACHE", "default")
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+
+        return caches[self.cache_alias]
+
+    def claim(self, task_id):
+        key = self.key_prefix + task_id
+        token = uuid.uuid4().hex
+        if self.cache.add(key, f"{IN_PROGRESS}:{token}", self.lease_timeout):
+            return CLAIMED, token
+        if self.cache.get(key) == COMPLETED:
+            return COMPLETED, None
+        return IN_PROGRESS, None
+
+    def complete(self, task_id):
+        self.cache.set(self.key_prefix + task_id, COMPLETED, self.completed_timeout)
+
+    def release(self, task_id, token):
+        key = self.key_prefix + task_id
+        if self.cache.get(key) == f"{IN_PROGRESS}:{token}":
+            self.cache.delete(key)
+
+
+class DatabaseLedger(BaseLedger):
+    """
+    Ledger stored in the TaskExecution table.
+
+    Completed entries are kept for COMPLETED_TIMEOUT; delete older rows
+    periodically with prune(). The lease expiry of a claim serves as its
+    token, so release() deletes the row only if it still holds that lease.
+    """
+
+    def claim(self, task_id):
+        from django.db import IntegrityError, transaction
+
+        from .models import TaskExecution
+
+        now = timezone.now()
+        lease_expires_at = now + timedelta(seconds=self.lease_timeout)
+
+        try:
+            with transaction.atomic():
+                TaskExecution.objects.create(
+                    task_id=task_id,
+                    status=TaskExecution.STATUS_RUNNING,
+                    lease_expires_at=lease_expires_at,
+                )
+            return CLAIMED, lease_expires_at
+        except IntegrityError:
+            pass
+
+        with transaction.atomic():
+            execution = (
+                TaskExecution.objects.select_for_update()
+                .filter(task_id=task_id)
+                .first()
+            )
+            if execution is None:
+                # Released in the meantime
+                TaskExecution.objects.create(
+                    task_id=task_id,
+                    status=TaskExecution.STATUS_RUNNING,
+                    lease_expires_at=lease_expires_at,
+                )
+                return CLAIMED, lease_expires_at
+
+            if execution.status == TaskExecution.STATUS_COMPLETED:
+                cutoff = now - timedelta(seconds=self.completed_timeout)
+                if execution.completed_at and execution.completed_at >= cutoff:
+                    return COMPLETED, None
+            elif execution.lease_expires_at and execution.lease_expires_at > now:
+                return IN_PROGRESS, None
+
+            # Expired lease (the previous execution died) or forgotten completion
+            execution.status = TaskExecution.STATUS_RUNNING
+            execution.lease_expires_at = lease_expires_at
+            execution.completed_at = None
+            execution.save()
+            return CLAIMED, lease_expires_at
+
+    def complete(self, task_id):
+        from .models import TaskExecution
+
+        TaskExecution.objects.update_or_create(
+            task_id=task_id,
+            defaults={
+                "status": TaskExecution.STATUS_COMPLETED,
+                "lease_expires_at": None,
+                "completed_at": timezone.now(),
+            },
+        )
+
+    def release(self, task_id, token):
+        from .models import TaskExecution
+
+        TaskExecution.objects.filter(
+            task_id=task_id,
+            status=TaskExecution.STATUS_RUNNING,
+            lease_expires_at=token,
+        ).delete()
+
+    def prune(self):
+        """
+        Delete completed entries older than COMPLETED_TIMEOUT.
+
+        Returns:
+            int: Number of deleted entries
+        """
+        from .models import TaskExecution
+
+        cutoff = timezone.now() - timedelta(seconds=self.completed_timeout)
+        deleted, _ = TaskExecution.objects.filter(
+            status=TaskExecution.STATUS_COMPLETED, completed_at__lt=cutoff
+        ).delete()
+        return deleted
+
+
+@functools.cache
+def _load_ledger(backend, options):
+    return import_string(backend)(dict(options))
+
+
+def get_ledger():
+    """
+    Return the ledger configured by CLOUD_TASKS_DEDUPLICATION.
+
+    Returns:
+        BaseLedger or None: None if deduplication is disabled
+    """
+    from django.conf import settings
+
+    config = getattr(settings, "CLOUD_TASKS_DEDUPLICATION", None)
+    if not config:
+        return None
+
+    backend = config.get("BACKEND", "django_tasks_cloud_tasks.ledger.CacheLedger")
+    options = tuple(sorted(config.get("OPTIONS", {}).items()))
+    return _load_ledger(backend, options)
+
+
+def claim_task(task_id):
+    """
+    Claim task_id in the completion ledger, if deduplication is enabled.
+
+    Returns:
+        tuple: (ledger holding the claim or None, claim result or None if
+               deduplication is disabled or unavailable, lease token)
+    """
+    ledger = get_ledger()
+    if ledger is None or not task_id:
+        return None, None, None
+
+    try:
+        claim, token = ledger.claim(task_id)
+    except Exception as e:
+        # Fail open: running a duplicate is better than not running at all
+        logger.warning(f"Completion ledger unavailable: {e}")
+        return None, None, None
+
+    return (ledger if claim == CLAIMED else None), claim, token
+
+
+def finish_claim(ledger, task_id, token, success):
+    """Mark a claimed task completed, or release it so a retry can run."""
+    if ledger is None:
+        return
+    try:
+        if success:
+            ledger.complete(task_id)
+        else:
+            ledger.release(task_id, token)
+    except Exception as e:
+        logger.warning(f"Completion ledger unavailable: {e}")
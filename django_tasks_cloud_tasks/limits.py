@@ -0,0 +1,229 @@
+"""
+Concurrency limits and load shedding for task execution.
+
+Limits are configured per task path and per queue in Django settings:
+
+    CLOUD_TASKS_TASK_CONCURRENCY = {"myapp.tasks.generate_report": 4}
+    CLOUD_TASKS_QUEUE_CONCURRENCY = {"reports": 10}
+
+Each limit is enforced per process with a semaphore. If
+CLOUD_TASKS_CONCURRENCY_CACHE names a Django cache, the limit is also
+enforced across instances with a shared counter in that cache.
+
+A dispatch that would exceed a limit is rejected right away, so Cloud Tasks
+backs off and retries it later instead of the worker stalling.
+"""
+
+import functools
+import logging
+import threading
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+DEFAULT_SHED_STATUS = 429
+DEFAULT_SHED_RETRY_AFTER = 5  # seconds
+# Shared counters expire once unused for this time, so slots held by
+# crashed instances are eventually freed. Must exceed the longest task
+# duration.
+DEFAULT_CONCURRENCY_CACHE_TIMEOUT = 1800  # seconds
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """Raised when a dispatch would exceed a concurrency limit."""
+
+    def __init__(self, scope, name, limit):
+        self.scope = scope
+        self.name = name
+        self.limit = limit
+        super().__init__(f"Concurrency limit reached: {scope}={name} limit={limit}")
+
+
+class ConcurrencyLimiter:
+    """Non-blocking concurrency limit for one task path or queue."""
+
+    def __init__(self, scope, name, limit, cache_alias=None, cache_timeout=None):
+        self.scope = scope
+        self.name = name
+        self.limit = limit
+        self.cache_alias = cache_alias
+        self.cache_timeout = cache_timeout or DEFAULT_CONCURRENCY_CACHE_TIMEOUT
+        self.cache_key = f"django_tasks_cloud_tasks:concurrency:{scope}:{name}"
+        self.rejections = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def _get_cache(self):
+        from django.core.cache import caches
+
+        return caches[self.cache_alias]
+
+    def _incr_shared(self):
+        cache = self._get_cache()
+        cache.add(self.cache_key, 0, self.cache_timeout)
+        try:
+            count = cache.incr(self.cache_key)
+        except ValueError:
+            # Key expired between add() and incr()
+            cache.add(self.cache_key, 1, self.cache_timeout)
+            return 1
+        # Expire only once no instance has used the counter for the timeout,
+        # not while slots are held under steady load
+        cache.touch(self.cache_key, self.cache_timeout)
+        return count
+
+    def _decr_shared(self):
+        cache = self._get_cache()
+        try:
+            count = cache.decr(self.cache_key)
+        except ValueError:
+            return
+        if count < 0:
+            # Slot counted before the key expired: don't go below 0, or the
+            # next slots would be admitted over the limit
+            cache.incr(self.cache_key, -count)
+        cache.touch(self.cache_key, self.cache_timeout)
+
+    def acquire(self):
+        """
+        Take a slot without waiting.
+
+        Returns:
+            ConcurrencySlot: Slot taken, or None if the limit is reached
+        """
+        if not self._semaphore.acquire(blocking=False):
+            self.rejections += 1
+            return None
+
+        if self.cache_alias is None:
+            return ConcurrencySlot(self, shared=False)
+
+        try:
+            count = self._incr_shared()
+        except Exception as e:
+            # Fall back to the per-process limit if the cache is unavailable
+            logger.warning(f"Shared concurrency counter unavailable: {e}")
+            return ConcurrencySlot(self, shared=False)
+
+        if count > self.limit:
+            self._decr_shared()
+            self._semaphore.release()
+            self.rejections += 1
+            return None
+
+        return ConcurrencySlot(self, shared=True)
+
+    def release(self, shared):
+        """
+        Return a slot taken by acquire().
+
+        Args:
+            shared: Whether the slot was counted in the shared counter
+        """
+        if shared:
+            try:
+                self._decr_shared()
+            except Exception as e:
+                logger.warning(f"Shared concurrency counter unavailable: {e}")
+        self._semaphore.release()
+
+
+class ConcurrencySlot:
+    """
+    Slot of one limiter.
+
+    shared records whether the shared counter was incremented, so a slot
+    taken while the cache was unavailable doesn't decrement it on release.
+    """
+
+    __slots__ = ("limiter", "shared")
+
+    def __init__(self, limiter, shared):
+        self.limiter = limiter
+        self.shared = shared
+
+    def release(self):
+        self.limiter.release(self.shared)
+
+
+@functools.cache
+def get_limiter(scope, name, limit, cache_alias=None, cache_timeout=None):
+    """Return the process-wide limiter for a task path or queue."""
+    return ConcurrencyLimiter(scope, name, limit, cache_alias, cache_timeout)
+
+
+class ConcurrencySlots:
+    """Slots taken for one dispatch, released after execution."""
+
+    __slots__ = ("slots",)
+
+    def __init__(self, slots=()):
+        self.slots = slots
+
+    def release(self):
+        for slot in reversed(self.slots):
+            slot.release()
+
+
+def acquire_concurrency_slots(task_path, queue_name):
+    """
+    Take a slot from every limit that applies to a dispatch.
+
+    Returns:
+        ConcurrencySlots: Slots to release once the task has finished
+
+    Raises:
+        ConcurrencyLimitExceeded: If any limit is reached. Slots taken
+                                  from other limits are released.
+    """
+    from django.conf import settings
+
+    task_limits = getattr(settings, "CLOUD_TASKS_TASK_CONCURRENCY", None)
+    queue_limits = getattr(settings, "CLOUD_TASKS_QUEUE_CONCURRENCY", None)
+    if not task_limits and not queue_limits:
+        return ConcurrencySlots()
+
+    cache_alias = getattr(settings, "CLOUD_TASKS_CONCURRENCY_CACHE", None)
+    cache_timeout = getattr(settings, "CLOUD_TASKS_CONCURRENCY_CACHE_TIMEOUT", None)
+
+    limiters = []
+    if task_limits and task_path in task_limits:
+        limiters.append(
+            get_limiter(
+                "task", task_path, task_limits[task_path], cache_alias, cache_timeout
+            )
+        )
+    if queue_limits and queue_name in queue_limits:
+        limiters.append(
+            get_limiter(
+                "queue",
+                queue_name,
+                queue_limits[queue_name],
+                cache_alias,
+                cache_timeout,
+            )
+        )
+
+    acquired = []
+    for limiter in limiters:
+        slot = limiter.acquire()
+        if slot is None:
+            ConcurrencySlots(acquired).release()
+            raise ConcurrencyLimitExceeded(limiter.scope, limiter.name, limiter.limit)
+        acquired.append(slot)
+
+    return ConcurrencySlots(acquired)
+
+
+def get_shed_response():
+    """
+    Build the response for a rejected dispatch.
+
+    Returns:
+        tuple: (status code, extra response headers dict)
+    """
+    from django.conf import settings
+
+    status = getattr(settings, "CLOUD_TASKS_SHED_STATUS", DEFAULT_SHED_STATUS)
+    retry_after = getattr(
+        settings, "CLOUD_TASKS_SHED_RETRY_AFTER", DEFAULT_SHED_RETRY_AFTER
+    )
+    return status, {"Retry-After": str(retry_after)}
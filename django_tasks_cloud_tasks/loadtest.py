@@ -0,0 +1,297 @@
+"""
+Load testing of task enqueue and execution.
+
+Used by the ``cloudtasks_loadtest`` management command. Synthetic tasks
+record their start and finish times in a Django cache, keyed by task ID,
+so the command can collect them even when the tasks run on other instances
+(use a shared cache such as Redis in that case). Latencies are measured
+from the payload's ``enqueued_at``, so clocks of the enqueuing and
+executing hosts must be in sync.
+"""
+
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.tasks import Task
+from django.utils import timezone
+
+RESULT_KEY_PREFIX = "django_tasks_cloud_tasks:loadtest:"
+RESULT_TIMEOUT = 3600  # seconds
+
+PERCENTILES = (50, 90, 95, 99)
+# Upper bounds of the latency histogram, in seconds
+HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class LoadTestTask(Task):
+    """
+    Task validated by LoadTest instead of on creation.
+
+    Task validates itself against its backend in TASKS, so the ``@task``
+    decorator would instantiate the default backend on import, and the
+    stand-in backend of the command is not in TASKS at all.
+    """
+
+    def __post_init__(self):
+        pass
+
+
+def loadtest_task(context, cache_alias="default", sleep_ms=0, fail=False, padding=""):
+    """Synthetic task recording its timings for the load test."""
+    from django.core.cache import caches
+
+    task_result = context.task_result
+    started_at = task_result.started_at or timezone.now()
+    if sleep_ms:
+        time.sleep(sleep_ms / 1000)
+    finished_at = timezone.now()
+
+    caches[cache_alias].set(
+        RESULT_KEY_PREFIX + task_result.id,
+        {
+            "enqueued_at": task_result.enqueued_at.timestamp(),
+            "started_at": started_at.timestamp(),
+            "finished_at": finished_at.timestamp(),
+            "attempt": context.attempt,
+            "ok": not fail,
+        },
+        RESULT_TIMEOUT,
+    )
+    if fail:
+        raise RuntimeError("Synthetic load test failure")
+
+
+loadtest_task = LoadTestTask(func=loadtest_task, takes_context=True)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    index = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def summarize(values):
+    """Summary statistics of latencies (seconds)."""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    summary = {
+        "count": len(values),
+        "min": values[0],
+        "mean": sum(values) / len(values),
+        "max": values[-1],
+    }
+    for p in PERCENTILES:
+        summary[f"p{p}"] = percentile(values, p)
+    return summary
+
+
+def histogram(values, buckets=HISTOGRAM_BUCKETS):
+    """
+    Count values per bucket.
+
+    Returns:
+        list: [(upper bound, count)] for each bucket
+    """
+    counts = [0] * len(buckets)
+    for value in values:
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+    return list(zip(buckets, counts, strict=True))
+
+
+class LoadTest:
+    """
+    Enqueue synthetic tasks at a target rate and collect their timings.
+
+    Args:
+        backend: Task backend to enqueue through
+        count: Number of tasks
+        rate: Target enqueue rate (tasks per second)
+        queue_name: Queue of the tasks
+        sleep_ms: Duration of each task
+        failure_rate: Fraction of tasks that raise
+        payload_bytes: Size of padding added to each payload
+        enqueue_concurrency: Threads calling enqueue()
+        cache_alias: Django cache where tasks record their timings
+    """
+
+    def __init__(
+        self,
+        backend,
+        count,
+        rate,
+        queue_name="default",
+        sleep_ms=0,
+        failure_rate=0.0,
+        payload_bytes=0,
+        enqueue_concurrency=8,
+        cache_alias="default",
+    ):
+        self.backend = backend
+        self.count = count
+        self.rate = rate
+        self.sleep_ms = sleep_ms
+        self.failure_rate = failure_rate
+        self.padding = "x" * payload_bytes
+        self.enqueue_concurrency = enqueue_concurrency
+        self.cache_alias = cache_alias
+        self.task = loadtest_task.using(backend=backend.alias, queue_name=queue_name)
+        backend.validate_task(self.task)
+
+        self.task_ids = []
+        self.enqueue_latencies = []
+        self.enqueue_errors = {}
+        self.enqueue_duration = 0.0
+        self._lock = threading.Lock()
+
+    def _enqueue(self, scheduled):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        start = time.perf_counter()
+        try:
+            result = self.backend.enqueue(
+                self.task,
+                (),
+                {
+                    "cache_alias": self.cache_alias,
+                    "sleep_ms": self.sleep_ms,
+                    "fail": random.random() < self.failure_rate,
+                    "padding": self.padding,
+                },
+            )
+        except Exception as e:
+            with self._lock:
+                name = type(e).__name__
+                self.enqueue_errors[name] = self.enqueue_errors.get(name, 0) + 1
+            return
+
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.task_ids.append(result.id)
+            self.enqueue_latencies.append(latency)
+
+    def enqueue_all(self):
+        """Enqueue all tasks, paced at the target rate."""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.enqueue_concurrency) as executor:
+            for i in range(self.count):
+                executor.submit(self._enqueue, start + i / self.rate)
+        self.enqueue_duration = time.perf_counter() - start
+
+    def collect(self, timeout, poll_interval=1.0, wait=None):
+        """
+        Collect the timings recorded by the tasks.
+
+        Args:
+            timeout: Seconds to wait for missing results
+            poll_interval: Seconds between polls of the cache
+            wait: Callable run before polling (e.g. draining a local backend)
+
+        Returns:
+            dict: {task ID: timings}
+        """
+        from django.core.cache import caches
+
+        cache = caches[self.cache_alias]
+        if wait is not None:
+            wait()
+
+        results = {}
+        deadline = time.monotonic() + timeout
+        while True:
+            missing = [task_id for task_id in self.task_ids if task_id not in results]
+            if missing:
+                found = cache.get_many([RESULT_KEY_PREFIX + i for i in missing])
+                for key, value in found.items():
+                    results[key.removeprefix(RESULT_KEY_PREFIX)] = value
+            if len(results) >= len(self.task_ids) or time.monotonic() >= deadline:
+                return results
+            time.sleep(poll_interval)
+
+    def report(self, results):
+        """Build the report of a run from the collected results."""
+        start_latencies = [r["started_at"] - r["enqueued_at"] for r in results.values()]
+        finish_latencies = [
+            r["finished_at"] - r["enqueued_at"] for r in results.values()
+        ]
+        failed = sum(1 for r in results.values() if not r["ok"])
+        enqueued = len(self.task_ids)
+
+        if results:
+            first_start = min(r["started_at"] for r in results.values())
+            last_finish = max(r["finished_at"] for r in results.values())
+            execution_window = last_finish - first_start
+        else:
+            execution_window = 0.0
+
+        return {
+            "requested": self.count,
+            "target_rate": self.rate,
+            "enqueued": enqueued,
+            "enqueue_errors": dict(self.enqueue_errors),
+            "enqueue_error_rate": (self.count - enqueued) / self.count
+            if self.count
+            else 0.0,
+            "enqueue_throughput": enqueued / self.enqueue_duration
+            if self.enqueue_duration
+            else 0.0,
+            "enqueue_latency": summarize(self.enqueue_latencies),
+            "completed": len(results) - failed,
+            "failed": failed,
+            "missing": enqueued - len(results),
+            "task_error_rate": failed / len(results) if results else 0.0,
+            "execution_throughput": len(results) / execution_window
+            if execution_window
+            else 0.0,
+            "enqueue_to_start": summarize(start_latencies),
+            "enqueue_to_finish": summarize(finish_latencies),
+            "histogram": [
+                ["+Inf" if math.isinf(bound) else bound, count]
+                for bound, count in histogram(finish_latencies)
+            ],
+        }
+
+
+def _format_summary(summary):
+    if not summary["count"]:
+        return "n/a"
+    parts = [f"p{p}={summary[f'p{p}'] * 1000:.1f}ms" for p in PERCENTILES]
+    parts.append(f"max={summary['max'] * 1000:.1f}ms")
+    return " ".join(parts)
+
+
+def format_report(report):
+    """Render a report as text."""
+    lines = [
+        f"Enqueued:            {report['enqueued']}/{report['requested']} "
+        f"({report['enqueue_throughput']:.1f}/s, target {report['target_rate']}/s)",
+        f"Enqueue errors:      {report['enqueue_errors'] or 'none'} "
+        f"({report['enqueue_error_rate']:.2%})",
+        f"Enqueue latency:     {_format_summary(report['enqueue_latency'])}",
+        f"Completed:           {report['completed']} "
+        f"(failed {report['failed']}, missing {report['missing']}, "
+        f"error rate {report['task_error_rate']:.2%})",
+        f"Execution rate:      {report['execution_throughput']:.1f}/s",
+        f"Enqueue to start:    {_format_summary(report['enqueue_to_start'])}",
+        f"Enqueue to finish:   {_format_summary(report['enqueue_to_finish'])}",
+        "",
+        "Enqueue to finish histogram:",
+    ]
+    total = sum(count for _, count in report["histogram"]) or 1
+    for bound, count in report["histogram"]:
+        label = bound if bound == "+Inf" else f"{bound}s"
+        bar = "#" * round(40 * count / total)
+        lines.append(f"  <= {label:>6} {count:>8} {bar}")
+    return "\n".join(lines)
@@ -0,0 +1,384 @@
+"""
+Local backend running tasks in-process through the real task handler.
+
+CloudTasksLocalBackend builds the same payload and headers as
+CloudTasksBackend.enqueue(), but instead of calling the Cloud Tasks API it
+dispatches them to ExecuteTaskView like Cloud Tasks would, including the
+X-CloudTasks-* headers. No network access or mocking is needed.
+
+    TASKS = {
+        "default": {
+            "BACKEND": "django_tasks_cloud_tasks.CloudTasksLocalBackend",
+            "OPTIONS": {
+                "MODE": "sync",  # "sync", "thread" or "deferred"
+            },
+        },
+    }
+
+Modes:
+
+- ``sync``: tasks run during enqueue()
+- ``thread``: tasks run on a thread pool (MAX_WORKERS)
+- ``deferred``: tasks run on drain()
+
+Tasks with run_after are held until a virtual clock reaches their
+scheduled time; move the clock with advance().
+"""
+
+import heapq
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .backends import CloudTasksBackend
+from .debounce import created_tasks
+from .handler import handle_task_request
+from .views import ExecuteTaskView
+
+MODES = ("sync", "thread", "deferred")
+DEFAULT_MAX_WORKERS = 4
+# Used instead of the GCP environment for options missing from OPTIONS
+LOCAL_DEFAULTS = {
+    "CLOUD_TASKS_PROJECT": "local",
+    "CLOUD_TASKS_LOCATION": "local",
+    "TASK_HANDLER_HOST": "http://localhost",
+}
+
+
+class LocalExecuteTaskView(ExecuteTaskView):
+    """
+    ExecuteTaskView that skips authentication unless enabled, and receives
+    dispatches at the time of a virtual clock.
+    """
+
+    authenticate = False
+    clock = None
+
+    def get_auth_handler(self):
+        if not self.authenticate:
+            return None
+
+        from django.conf import settings
+
+        hmac_keys = getattr(settings, "CLOUD_TASKS_HMAC_KEYS", None)
+        if hmac_keys:
+            from .auth import DEFAULT_HMAC_MAX_AGE, create_hmac_auth_handler
+
+            # Signatures of scheduled tasks are valid from their run_after
+            return create_hmac_auth_handler(
+                hmac_keys,
+                getattr(settings, "CLOUD_TASKS_HMAC_MAX_AGE", DEFAULT_HMAC_MAX_AGE),
+                clock=lambda: self.clock.now().timestamp(),
+            )
+        return super().get_auth_handler()
+
+    def post(self, request):
+        status, data, headers = handle_task_request(
+            request, self.get_auth_handler(), now=self.clock.now()
+        )
+        return JsonResponse(data, status=status, headers=headers)
+
+
+class VirtualClock:
+    """Real time, shifted by the total of advance() calls."""
+
+    def __init__(self):
+        self.offset = timedelta()
+
+    def now(self):
+        return timezone.now() + self.offset
+
+    def advance(self, delta):
+        self.offset += delta
+
+    def reset(self):
+        self.offset = timedelta()
+
+
+@dataclass(frozen=True, slots=True)
+class LocalDispatch:
+    """Outcome of one dispatch of a task to the handler."""
+
+    task_id: str
+    task_path: str
+    queue_name: str
+    attempt: int
+    status_code: int
+    response: dict
+
+    @property
+    def succeeded(self):
+        return 200 <= self.status_code < 300
+
+
+@dataclass(order=True, slots=True)
+class _PendingTask:
+    eta: datetime
+    sequence: int
+    task_id: str = field(compare=False)
+    task_path: str = field(compare=False)
+    queue_name: str = field(compare=False)
+    body: bytes = field(compare=False)
+    headers: dict = field(compare=False)
+
+
+class LocalTaskQueue:
+    """
+    Tasks of one local backend alias.
+
+    Shared by the backend instances of all threads (Django creates one
+    backend instance per thread), so tasks enqueued from worker threads can
+    be drained from the test thread.
+    """
+
+    def __init__(self, mode, max_workers, max_attempts, authenticate):
+        if mode not in MODES:
+            raise ValueError(f"MODE must be one of {MODES}, got {mode!r}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.clock = VirtualClock()
+        self.view = LocalExecuteTaskView.as_view(
+            authenticate=authenticate, clock=self.clock
+        )
+        self.dispatches = []
+        self._pending = []
+        self._names = set()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._executor = None
+
+    def add(self, eta, task_id, task_path, queue_name, body, headers, name=None):
+        """
+        Add a task.
+
+        Returns:
+            bool: False if a task with the same name was added before, like
+                  the ALREADY_EXISTS error of Cloud Tasks
+        """
+        with self._lock:
+            if name is not None:
+                if (queue_name, name) in self._names:
+                    return False
+                self._names.add((queue_name, name))
+            heapq.heappush(
+                self._pending,
+                _PendingTask(
+                    eta=eta or timezone.now(),
+                    sequence=next(self._sequence),
+                    task_id=task_id,
+                    task_path=task_path,
+                    queue_name=queue_name,
+                    body=body,
+                    headers=headers,
+                ),
+            )
+
+        if self.mode != "deferred":
+            self.run_due(wait_for_threads=False)
+        return True
+
+    def __len__(self):
+        """Number of tasks not dispatched yet."""
+        return len(self._pending)
+
+    def _pop_due(self):
+        now = self.clock.now()
+        with self._lock:
+            if self._pending and self._pending[0].eta <= now:
+                return heapq.heappop(self._pending)
+        return None
+
+    def _dispatch(self, pending):
+        from django.test import RequestFactory
+
+        factory = RequestFactory()
+        headers = {
+            name: value
+            for name, value in pending.headers.items()
+            if name.lower() != "content-type"
+        }
+        for retry_count in range(self.max_attempts):
+            headers.update(
+                {
+                    "X-CloudTasks-QueueName": pending.queue_name,
+                    "X-CloudTasks-TaskName": pending.task_id,
+                    "X-CloudTasks-TaskRetryCount": str(retry_count),
+                    "X-CloudTasks-TaskExecutionCount": str(retry_count),
+                    "X-CloudTasks-TaskETA": f"{pending.eta.timestamp():.6f}",
+                }
+            )
+            request = factory.post(
+                "/cloudtasks/execute/",
+                data=pending.body,
+                content_type="application/json",
+                headers=headers,
+            )
+            response = self.view(request)
+            dispatch = LocalDispatch(
+                task_id=pending.task_id,
+                task_path=pending.task_path,
+                queue_name=pending.queue_name,
+                attempt=retry_count + 1,
+                status_code=response.status_code,
+                response=json.loads(response.content),
+            )
+            with self._lock:
+                self.dispatches.append(dispatch)
+            if dispatch.succeeded:
+                break
+
+    def _dispatch_in_thread(self, pending):
+        from django.db import close_old_connections
+
+        try:
+            self._dispatch(pending)
+        finally:
+            close_old_connections()
+
+    def _submit(self, pending):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="cloudtasks-local",
+                )
+            future = self._executor.submit(self._dispatch_in_thread, pending)
+            self._futures.add(future)
+        future.add_done_callback(self._forget_future)
+
+    def _forget_future(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def run_due(self, wait_for_threads=True):
+        """Dispatch every task whose scheduled time has come."""
+        while True:
+            pending = self._pop_due()
+            if pending is not None:
+                if self.mode == "thread":
+                    self._submit(pending)
+                else:
+                    self._dispatch(pending)
+                continue
+
+            with self._lock:
+                futures = set(self._futures)
+            if not (wait_for_threads and futures):
+                return
+            # Running tasks may enqueue more tasks
+            done, _ = wait(futures)
+            for future in done:
+                future.result()
+
+    def drain(self, include_scheduled=False):
+        """
+        Dispatch all due tasks, and wait for them in thread mode.
+
+        Args:
+            include_scheduled: Also advance the virtual clock to run tasks
+                               scheduled in the future, until none are left.
+        """
+        self.run_due()
+        while include_scheduled and self._pending:
+            delay = self._pending[0].eta - self.clock.now()
+            if delay > timedelta():
+                self.clock.advance(delay)
+            self.run_due()
+
+    def advance(self, delta):
+        """Move the virtual clock forward and run the tasks that became due."""
+        self.clock.advance(delta)
+        if self.mode != "deferred":
+            self.run_due()
+
+    def reset(self):
+        """Drop pending tasks and recorded dispatches, and reset the clock."""
+        with self._lock:
+            self._pending.clear()
+            self._names.clear()
+            self.dispatches.clear()
+        self.clock.reset()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_local_queue(alias, options):
+    """Return the process-wide queue of a local backend alias."""
+    config = (
+        options.get("MODE", "sync"),
+        options.get("MAX_WORKERS", DEFAULT_MAX_WORKERS),
+        options.get("MAX_ATTEMPTS", 1),
+        options.get("AUTHENTICATE", False),
+    )
+    with _queues_lock:
+        queue = _queues.get((alias, config))
+        if queue is None:
+            queue = _queues[(alias, config)] = LocalTaskQueue(*config)
+        return queue
+
+
+class CloudTasksLocalBackend(CloudTasksBackend):
+    """
+    Backend dispatching tasks in-process to the task handler.
+
+    OPTIONS:
+        MODE: "sync" (default), "thread" or "deferred"
+        MAX_WORKERS: Thread pool size of thread mode (default 4)
+        MAX_ATTEMPTS: Dispatches of a failing task, like a queue's
+                      max attempts (default 1)
+        AUTHENTICATE: Run the configured authentication (e.g. HMAC, with
+                      HMAC_SIGNING_KEY set) instead of skipping it
+    """
+
+    def __init__(self, alias, params):
+        super().__init__(alias, params)
+        self.queue = get_local_queue(alias, self.options)
+
+    def detect_option(self, name):
+        # GCP settings are not needed, so skip their auto-detection
+        return LOCAL_DEFAULTS.get(name)
+
+    def build_headers(self, task, body, now):
+        # Sign at the time of the virtual clock, which verifies signatures
+        return super().build_headers(task, body, self.clock.now())
+
+    def create_task(self, task, task_id, body, headers, name=None):
+        return self.queue.add(
+            task.run_after,
+            task_id,
+            task.module_path,
+            task.queue_name,
+            body,
+            headers,
+            name=name,
+        )
+
+    @property
+    def clock(self):
+        return self.queue.clock
+
+    @property
+    def dispatches(self):
+        """LocalDispatch of every dispatch so far."""
+        return self.queue.dispatches
+
+    def drain(self, include_scheduled=False):
+        self.queue.drain(include_scheduled)
+
+    def advance(self, delta):
+        self.queue.advance(delta)
+
+    def reset(self):
+        self.queue.reset()
+        # Forget debounced/throttled tasks created so far
+        created_tasks.clear()
@@ -0,0 +1,320 @@
+"""
+Multi-location enqueue with health tracking, failover and hedging.
+
+A backend can enqueue to the same queues in several Cloud Tasks locations:
+
+    "OPTIONS": {
+        "CLOUD_TASKS_LOCATIONS": ["asia-northeast1", "asia-northeast2"],
+        "LOCATION_ROUTING": {
+            "STRATEGY": "failover",  # or "hedge"
+            "LATENCY_THRESHOLD": 1.0,  # seconds, moving average
+            "ERROR_RATE_THRESHOLD": 0.5,  # moving average
+            "PROBE_INTERVAL": 30,  # seconds
+            "HEDGE_DELAY": 0.2,  # seconds
+        },
+    }
+
+The first location is the primary. The latency and error rate of
+CreateTask calls are tracked per location with exponentially weighted
+moving averages, shared by all backends of the process. A location is
+degraded while either average is above its threshold; degraded locations
+are tried after healthy ones, and get a probe request every PROBE_INTERVAL
+so they can recover.
+
+Strategies:
+
+- ``failover``: try locations in order; move on to the next one on errors
+  that could succeed elsewhere (unavailable, deadline exceeded, ...)
+- ``hedge``: additionally send the task to the next location if the first
+  has not answered within HEDGE_DELAY. Both tasks may be created, so enable
+  duplicate delivery suppression (CLOUD_TASKS_DEDUPLICATION) with hedging.
+"""
+
+import functools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import metrics
+
+STRATEGIES = ("failover", "hedge")
+DEFAULT_STRATEGY = "failover"
+DEFAULT_EWMA_ALPHA = 0.2
+DEFAULT_LATENCY_THRESHOLD = 1.0  # seconds
+DEFAULT_ERROR_RATE_THRESHOLD = 0.5
+DEFAULT_PROBE_INTERVAL = 30  # seconds
+DEFAULT_HEDGE_DELAY = 0.2  # seconds
+HEDGE_WORKERS = 16
+
+# gRPC status codes worth retrying in another location
+FAILOVER_CODES = frozenset(
+    {"UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL", "UNKNOWN", "RESOURCE_EXHAUSTED"}
+)
+
+
+@functools.cache
+def _location_error_types():
+    from google.api_core import exceptions
+
+    types = [
+        exceptions.GoogleAPICallError,
+        exceptions.RetryError,
+        ConnectionError,
+        TimeoutError,
+    ]
+    try:
+        import grpc
+
+        types.append(grpc.RpcError)
+    except ImportError:
+        pass
+    try:
+        from requests import exceptions as requests_exceptions
+
+        types += [requests_exceptions.ConnectionError, requests_exceptions.Timeout]
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+def is_location_error(exception):
+    """
+    Whether a CreateTask call failed in the API or on the way to it.
+
+    Other errors (e.g. building the request) would fail in every location,
+    and say nothing about the health of this one.
+    """
+    return isinstance(exception, _location_error_types())
+
+
+def should_fail_over(exception):
+    """Whether a failed CreateTask call could succeed in another location."""
+    if not is_location_error(exception):
+        return False
+    code = getattr(exception, "grpc_status_code", None)
+    if code is None:
+        # Transport errors, timeouts
+        return True
+    return getattr(code, "name", str(code)) in FAILOVER_CODES
+
+
+class LocationHealth:
+    """Moving averages of CreateTask latency and errors for one location."""
+
+    def __init__(self, location, alpha=DEFAULT_EWMA_ALPHA):
+        self.location = location
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.last_probe = 0.0
+        self.reported_healthy = None  # last value of the LOCATION_HEALTHY gauge
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        metrics.LOCATION_LATENCY.set(self.latency, self.location)
+        metrics.LOCATION_ERROR_RATE.set(self.error_rate, self.location)
+
+    def is_degraded(self, latency_threshold, error_rate_threshold):
+        return self.error_rate > error_rate_threshold or (
+            self.latency is not None and self.latency > latency_threshold
+        )
+
+    def report_healthy(self, healthy):
+        """Set the LOCATION_HEALTHY gauge when the state changes."""
+        if healthy != self.reported_healthy:
+            self.reported_healthy = healthy
+            metrics.LOCATION_HEALTHY.set(1 if healthy else 0, self.location)
+
+    def claim_probe(self, interval, now):
+        """Whether a degraded location should get a request to test it."""
+        with self._lock:
+            if now - self.last_probe < interval:
+                return False
+            self.last_probe = now
+            return True
+
+    def as_dict(self):
+        return {
+            "location": self.location,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+        }
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_location_health(project_id, location, alpha=DEFAULT_EWMA_ALPHA):
+    """Return the process-wide health of a location."""
+    key = (project_id, location)
+    with _health_lock:
+        health = _health.get(key)
+        if health is None:
+            health = _health[key] = LocationHealth(location, alpha)
+        return health
+
+
+def reset_location_health():
+    """Forget the health of all locations (mainly for tests)."""
+    with _health_lock:
+        _health.clear()
+
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=HEDGE_WORKERS, thread_name_prefix="cloudtasks-hedge"
+            )
+        return _hedge_executor
+
+
+def _after_fork():
+    global _hedge_executor, _hedge_executor_lock, _health_lock
+    _hedge_executor = None
+    _hedge_executor_lock = threading.Lock()
+    _health_lock = threading.Lock()
+    for health in _health.values():
+        health._lock = threading.Lock()
+        # The metrics of the child start empty
+        health.reported_healthy = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class LocationRouter:
+    """
+    Order locations by health and call CreateTask with failover or hedging.
+
+    Args:
+        project_id: GCP project
+        locations: Locations, primary first
+        options: LOCATION_ROUTING option
+    """
+
+    def __init__(self, project_id, locations, options=None):
+        options = options or {}
+        self.locations = tuple(locations)
+        self.strategy = options.get("STRATEGY", DEFAULT_STRATEGY)
+        if self.strategy not in STRATEGIES:
+            raise ValueError(
+                f"STRATEGY must be one of {STRATEGIES}, got {self.strategy!r}"
+            )
+        self.latency_threshold = options.get(
+            "LATENCY_THRESHOLD", DEFAULT_LATENCY_THRESHOLD
+        )
+        self.error_rate_threshold = options.get(
+            "ERROR_RATE_THRESHOLD", DEFAULT_ERROR_RATE_THRESHOLD
+        )
+        self.probe_interval = options.get("PROBE_INTERVAL", DEFAULT_PROBE_INTERVAL)
+        self.hedge_delay = options.get("HEDGE_DELAY", DEFAULT_HEDGE_DELAY)
+        alpha = options.get("EWMA_ALPHA", DEFAULT_EWMA_ALPHA)
+        self.health = {
+            location: get_location_health(project_id, location, alpha)
+            for location in self.locations
+        }
+
+    def is_degraded(self, location):
+        return self.health[location].is_degraded(
+            self.latency_threshold, self.error_rate_threshold
+        )
+
+    def order(self):
+        """Return locations to try: healthy ones first, in configured order."""
+        if len(self.locations) == 1:
+            return self.locations
+
+        now = time.monotonic()
+        healthy, degraded = [], []
+        for location in self.locations:
+            is_degraded = self.is_degraded(location)
+            self.health[location].report_healthy(not is_degraded)
+            if not is_degraded or self.health[location].claim_probe(
+                self.probe_interval, now
+            ):
+                healthy.append(location)
+            else:
+                degraded.append(location)
+        return (*healthy, *degraded)
+
+    def _call(self, location, create):
+        start = time.perf_counter()
+        try:
+            result = create(location)
+        except Exception as e:
+            if is_location_error(e):
+                self.health[location].record(time.perf_counter() - start, False)
+            raise
+        self.health[location].record(time.perf_counter() - start, True)
+        return result
+
+    def create(self, create):
+        """
+        Call create(location) on the best location, failing over on errors.
+
+        Args:
+            create: Callable taking a location and creating the task there
+
+        Returns:
+            str: Location where the task was created
+        """
+        if self.strategy == "hedge" and len(self.locations) > 1:
+            return self._create_hedged(create)
+
+        order = self.order()
+        for i, location in enumerate(order):
+            try:
+                self._call(location, create)
+                return location
+            except Exception as e:
+                if i == len(order) - 1 or not should_fail_over(e):
+                    raise
+                metrics.ENQUEUE_FAILOVERS.inc(order[i + 1])
+
+    def _create_hedged(self, create):
+        executor = _get_hedge_executor()
+        order = list(self.order())
+        pending = {}
+        last_error = None
+
+        def start(location):
+            pending[executor.submit(self._call, location, create)] = location
+
+        start(order.pop(0))
+        while pending:
+            timeout = self.hedge_delay if order else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Too slow: hedge to the next location
+                location = order.pop(0)
+                metrics.ENQUEUE_HEDGES.inc(location)
+                start(location)
+                continue
+            for future in done:
+                location = pending.pop(future)
+                try:
+                    future.result()
+                    return location
+                except Exception as e:
+                    if not is_location_error(e):
+                        raise
+                    last_error = e
+                    if should_fail_over(e) and order and not pending:
+                        location = order.pop(0)
+                        metrics.ENQUEUE_FAILOVERS.inc(location)
+                        start(location)
+        raise last_error
@@ -0,0 +1,101 @@
+"""Management command to tune queue dispatch rates from handler metrics."""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Adjust max_dispatches_per_second and max_concurrent_dispatches of "
+        "the queues in the AUTOTUNE backend option (AIMD), from the handler "
+        "metrics. Run periodically, or with --interval to loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", default="default", help="TASKS alias")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report decisions without applying"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Seconds between steps; run one step if 0",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=0,
+            help="Steps to run with --interval (default: until interrupted)",
+        )
+        parser.add_argument(
+            "--simulate",
+            action="store_true",
+            help="Run the policy against a simulated handler instead",
+        )
+        parser.add_argument(
+            "--capacity",
+            type=float,
+            default=100.0,
+            help="Simulated handler capacity (dispatches/s)",
+        )
+        parser.add_argument(
+            "--base-latency",
+            type=float,
+            default=0.1,
+            help="Simulated task duration at low load (seconds)",
+        )
+        parser.add_argument("--steps", type=int, default=30, help="Simulated steps")
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        if options["simulate"]:
+            self.simulate(options)
+            return
+
+        from django.tasks import task_backends
+
+        from ...autotune import AutoTuner, format_decisions
+
+        backend = task_backends[options["backend"]]
+        if not (backend.options.get("AUTOTUNE") or {}).get("QUEUES"):
+            raise CommandError(f"{options['backend']} has no AUTOTUNE queues")
+        tuner = AutoTuner.from_backend(backend)
+
+        iteration = 0
+        while True:
+            decisions = tuner.step(dry_run=options["dry_run"])
+            if options["json"]:
+                self.stdout.write(json.dumps([d.as_dict() for d in decisions]))
+            else:
+                self.stdout.write(format_decisions(decisions))
+
+            iteration += 1
+            if not options["interval"] or iteration == options["iterations"]:
+                return
+            time.sleep(options["interval"])
+
+    def simulate(self, options):
+        from django.tasks import task_backends
+
+        from ...autotune import SimulatedService, simulate
+
+        config = task_backends[options["backend"]].options.get("AUTOTUNE") or {}
+        policies = config.get("QUEUES") or {}
+        history = simulate(
+            SimulatedService(options["capacity"], options["base_latency"]),
+            policy=next(iter(policies.values()), None),
+            steps=options["steps"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(history, indent=2))
+            return
+        for row in history:
+            self.stdout.write(
+                f"{row['step']:>4} rate={row['rate']:>8} "
+                f"concurrency={row['concurrency']:>5} "
+                f"throughput={row['throughput']:>8.1f}/s p95={row['p95']}s "
+                f"5xx={row['error_rate']:.1%} -> {row['action']}"
+            )
@@ -0,0 +1,110 @@
+"""Management command to load test task enqueue and execution."""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Enqueue synthetic tasks at a target rate and report enqueue-to-start "
+        "and enqueue-to-finish latencies, throughput and error rates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100, help="Number of tasks")
+        parser.add_argument(
+            "--rate", type=float, default=10.0, help="Target enqueue rate (tasks/s)"
+        )
+        parser.add_argument(
+            "--backend",
+            default="default",
+            help="TASKS alias to enqueue through (real API or emulator)",
+        )
+        parser.add_argument(
+            "--stand-in",
+            action="store_true",
+            help="Dispatch in-process to ExecuteTaskView instead of Cloud Tasks",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Concurrent executions of the stand-in",
+        )
+        parser.add_argument("--queue", default="default", help="Queue name")
+        parser.add_argument(
+            "--sleep-ms", type=int, default=0, help="Duration of each task"
+        )
+        parser.add_argument(
+            "--failure-rate", type=float, default=0.0, help="Fraction of failing tasks"
+        )
+        parser.add_argument(
+            "--payload-bytes", type=int, default=0, help="Padding added to payloads"
+        )
+        parser.add_argument(
+            "--enqueue-concurrency",
+            type=int,
+            default=8,
+            help="Threads calling enqueue()",
+        )
+        parser.add_argument(
+            "--cache",
+            default="default",
+            help="Cache where tasks record timings (must be shared with workers)",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=300.0,
+            help="Seconds to wait for tasks to finish",
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        from django.tasks import task_backends
+
+        from ...loadtest import LoadTest, format_report
+        from ...local import CloudTasksLocalBackend
+
+        if options["count"] <= 0 or options["rate"] <= 0:
+            raise CommandError("--count and --rate must be positive")
+
+        if options["stand_in"]:
+            backend = CloudTasksLocalBackend(
+                "loadtest",
+                {
+                    "QUEUES": [],
+                    "OPTIONS": {"MODE": "thread", "MAX_WORKERS": options["workers"]},
+                },
+            )
+            backend.reset()
+            wait = backend.drain
+        else:
+            backend = task_backends[options["backend"]]
+            wait = None
+
+        loadtest = LoadTest(
+            backend,
+            count=options["count"],
+            rate=options["rate"],
+            queue_name=options["queue"],
+            sleep_ms=options["sleep_ms"],
+            failure_rate=options["failure_rate"],
+            payload_bytes=options["payload_bytes"],
+            enqueue_concurrency=options["enqueue_concurrency"],
+            cache_alias=options["cache"],
+        )
+
+        if not options["json"]:
+            self.stdout.write(
+                f"Enqueuing {options['count']} tasks at {options['rate']}/s..."
+            )
+        loadtest.enqueue_all()
+        results = loadtest.collect(options["timeout"], wait=wait)
+        report = loadtest.report(results)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(format_report(report))
@@ -0,0 +1,134 @@
+"""Management command to replay dead-lettered tasks."""
+
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+def _parse_datetime(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise CommandError(f"Invalid datetime: {value}") from e
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_assignment(value):
+    name, sep, raw = value.partition("=")
+    if not sep or not name:
+        raise CommandError(f"--set expects NAME=JSON, got {value!r}")
+    try:
+        return name, json.loads(raw)
+    except json.JSONDecodeError:
+        # Plain strings need no quotes
+        return name, raw
+
+
+class Command(BaseCommand):
+    help = (
+        "Enqueue dead-lettered tasks again, in concurrent batches with rate "
+        "limiting, optionally overriding keyword arguments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--id", action="append", dest="ids", help="Dead letter ID (repeatable)"
+        )
+        parser.add_argument("--task", help="Only dead letters of this task path")
+        parser.add_argument("--queue", help="Only dead letters of this queue")
+        parser.add_argument("--since", help="Failed at or after (ISO 8601)")
+        parser.add_argument("--until", help="Failed before (ISO 8601)")
+        parser.add_argument("--limit", type=int, help="Replay at most this many")
+        parser.add_argument(
+            "--include-replayed",
+            action="store_true",
+            help="Also select dead letters replayed before",
+        )
+        parser.add_argument(
+            "--list", action="store_true", help="List the selection, do not replay"
+        )
+        parser.add_argument(
+            "--set",
+            action="append",
+            dest="assignments",
+            default=[],
+            metavar="NAME=JSON",
+            help="Override a keyword argument (repeatable)",
+        )
+        parser.add_argument("--to-backend", help="Enqueue through this TASKS alias")
+        parser.add_argument("--to-queue", help="Enqueue to this queue")
+        parser.add_argument(
+            "--rate", type=float, help="Tasks enqueued per second (default: no limit)"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Threads calling enqueue()"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Tasks per batch"
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        from ...deadletter import get_dead_letter_store, replay
+
+        store = get_dead_letter_store()
+        if store is None:
+            raise CommandError("CLOUD_TASKS_DEAD_LETTER is not configured")
+
+        records = store.list(
+            ids=options["ids"],
+            task_path=options["task"],
+            queue_name=options["queue"],
+            since=_parse_datetime(options["since"]) if options["since"] else None,
+            until=_parse_datetime(options["until"]) if options["until"] else None,
+            include_replayed=options["include_replayed"],
+            limit=options["limit"],
+        )
+
+        if options["list"]:
+            if options["json"]:
+                self.stdout.write(
+                    json.dumps([r.as_dict() for r in records], indent=2, default=str)
+                )
+            else:
+                for r in records:
+                    error = r.errors[-1]["exception"] if r.errors else ""
+                    self.stdout.write(
+                        f"{r.id}  {r.failed_at.isoformat()}  {r.queue_name}  "
+                        f"{r.task_path}  attempts={r.attempts}  {error}"
+                    )
+            return
+
+        overrides = dict(_parse_assignment(a) for a in options["assignments"])
+        patch = None
+        if overrides:
+
+            def patch(task_args, task_kwargs):
+                return task_args, {**task_kwargs, **overrides}
+
+        result = replay(
+            store,
+            records,
+            patch=patch,
+            backend=options["to_backend"],
+            queue_name=options["to_queue"],
+            rate=options["rate"],
+            concurrency=options["concurrency"],
+            batch_size=options["batch_size"],
+        )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result.as_dict(), indent=2))
+        else:
+            self.stdout.write(
+                f"Replayed {len(result.replayed)} of {len(records)} dead letters"
+            )
+            for record_id, error in result.failed.items():
+                self.stdout.write(f"  {record_id}: {error}")
+
+        if result.failed:
+            raise CommandError(f"{len(result.failed)} dead letters failed to replay")
@@ -0,0 +1,61 @@
+"""Management command to report queue depth and backlog."""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Report task count, oldest schedule time, dispatch attempts and rate "
+        "limits of Cloud Tasks queues."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", default="default", help="TASKS alias")
+        parser.add_argument(
+            "--queue",
+            action="append",
+            dest="queues",
+            help="Queue to report (default: QUEUES and QUEUE_DEFINITIONS)",
+        )
+        parser.add_argument(
+            "--method",
+            choices=("list", "stats"),
+            default="list",
+            help="Page through ListTasks, or read v2beta3 queue stats",
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=1000, help="ListTasks page size"
+        )
+        parser.add_argument(
+            "--max-tasks", type=int, default=10000, help="Tasks listed per queue"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Queues read at once"
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        from django.tasks import task_backends
+
+        from ...stats import format_table, get_queue_stats
+
+        stats_list = get_queue_stats(
+            task_backends[options["backend"]],
+            queue_names=options["queues"],
+            method=options["method"],
+            page_size=options["page_size"],
+            max_tasks=options["max_tasks"],
+            concurrency=options["concurrency"],
+        )
+
+        if options["json"]:
+            self.stdout.write(
+                json.dumps([stats.as_dict() for stats in stats_list], indent=2)
+            )
+        else:
+            self.stdout.write(format_table(stats_list))
+
+        if any(stats.error for stats in stats_list):
+            raise CommandError("Some queues could not be read")
@@ -0,0 +1,108 @@
+"""Management command to sync Cloud Tasks queues with their definitions."""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update Cloud Tasks queues to match QUEUE_DEFINITIONS in "
+        "the TASKS backend options. Safe to run repeatedly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            action="append",
+            dest="backends",
+            help="TASKS alias to sync (default: every alias with QUEUE_DEFINITIONS)",
+        )
+        parser.add_argument(
+            "--queue",
+            action="append",
+            dest="queues",
+            help="Queue to sync (default: all defined queues)",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report changes without applying"
+        )
+        parser.add_argument(
+            "--no-create", action="store_true", help="Do not create missing queues"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Queues synced at once"
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from django.tasks import task_backends
+
+        from ...backends import CloudTasksBackend
+        from ...local import CloudTasksLocalBackend
+        from ...queues import format_results, sync_queues
+
+        aliases = options["backends"]
+        if aliases is None:
+            aliases = [
+                alias
+                for alias in settings.TASKS
+                if getattr(task_backends[alias], "queue_definitions", None)
+            ]
+
+        backends = {}
+        for alias in aliases:
+            backend = task_backends[alias]
+            if not isinstance(backend, CloudTasksBackend) or isinstance(
+                backend, CloudTasksLocalBackend
+            ):
+                raise CommandError(f"{alias} is not a Cloud Tasks backend")
+            backends[alias] = backend
+
+        # Each --queue must be defined in at least one of the backends
+        if options["queues"] is not None:
+            unknown = [
+                queue_name
+                for queue_name in options["queues"]
+                if not any(
+                    queue_name in backend.queue_definitions
+                    for backend in backends.values()
+                )
+            ]
+            if unknown:
+                raise CommandError(
+                    f"Queues not defined in {', '.join(aliases)}: {', '.join(unknown)}"
+                )
+
+        output = {}
+        failed = False
+        for alias, backend in backends.items():
+            queue_names = options["queues"]
+            if queue_names is not None:
+                queue_names = [q for q in queue_names if q in backend.queue_definitions]
+            try:
+                results = sync_queues(
+                    backend,
+                    queue_names=queue_names,
+                    dry_run=options["dry_run"],
+                    create=not options["no_create"],
+                    concurrency=options["concurrency"],
+                )
+            except ValueError as e:
+                raise CommandError(str(e)) from e
+
+            failed = failed or any(r.action == "error" for r in results)
+            if options["json"]:
+                output[alias] = [result.as_dict() for result in results]
+            else:
+                self.stdout.write(
+                    f"[{alias}] {backend.project_id}/{','.join(backend.locations)}"
+                )
+                if results:
+                    self.stdout.write(format_results(results))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(output, indent=2))
+        if failed:
+            raise CommandError("Some queues could not be synced")
@@ -0,0 +1,256 @@
+"""
+Memory accounting of task executions and worker recycling.
+
+Disabled unless configured in Django settings:
+
+    CLOUD_TASKS_MEMORY = {
+        # tracemalloc top allocations of these task paths
+        "TRACEMALLOC_TASK_PATHS": ["myapp.tasks.import_csv"],
+        "TRACEMALLOC_TOP": 10,
+        # Recycle the process once its RSS exceeds this (bytes)
+        "RSS_WATERMARK": 768 * 1024 * 1024,
+        "RECYCLE_ACTION": "header",  # or "reject"
+        "ON_WATERMARK": "django_tasks_cloud_tasks.memory.terminate_worker",
+    }
+
+When enabled, the RSS of the process is measured before and after each
+task, and growth and peak RSS are aggregated per task path (see
+get_memory_stats()). With concurrent executions in one process, growth is
+attributed to whichever task finishes, so look at the statistics over many
+executions.
+
+Once RSS exceeds RSS_WATERMARK, the process asks to be recycled:
+
+- ``header``: every task response carries ``X-Worker-Recycle``
+- ``reject``: new dispatches are refused with 503, so Cloud Tasks retries
+  them on other instances
+- ON_WATERMARK, if set, is called once with (rss, task_path); the bundled
+  terminate_worker() sends SIGTERM to the process, which gunicorn handles
+  as a graceful worker restart
+"""
+
+import contextlib
+import logging
+import os
+import signal
+import threading
+import tracemalloc
+from dataclasses import dataclass
+
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+RECYCLE_HEADER = "X-Worker-Recycle"
+DEFAULT_TRACEMALLOC_TOP = 10
+DEFAULT_RECYCLE_ACTION = "header"
+RECYCLE_RETRY_AFTER = 1  # seconds
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_NOT_TRACKED = contextlib.nullcontext()
+
+_stats = {}
+_stats_lock = threading.Lock()
+_recycle_rss = None
+
+# Executions using tracemalloc; it is stopped after the last one if this
+# module started it
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False
+
+
+def get_rss():
+    """
+    Return the resident set size of the process in bytes.
+
+    Returns:
+        int or None: None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
+class TaskMemoryStats:
+    """RSS statistics of the executions of one task path."""
+
+    executions: int = 0
+    peak_rss: int = 0  # highest RSS after an execution
+    max_growth: int = 0  # largest RSS growth of one execution
+    total_growth: int = 0
+
+    def as_dict(self):
+        return {
+            "executions": self.executions,
+            "peak_rss": self.peak_rss,
+            "max_growth": self.max_growth,
+            "total_growth": self.total_growth,
+        }
+
+
+def get_memory_stats():
+    """
+    Return RSS statistics per task path.
+
+    Returns:
+        dict: {task_path: {"executions", "peak_rss", "max_growth",
+              "total_growth"}}
+    """
+    with _stats_lock:
+        return {path: stats.as_dict() for path, stats in _stats.items()}
+
+
+def reset_memory_stats():
+    """Forget statistics and any recycle request (mainly for tests)."""
+    global _recycle_rss
+    with _stats_lock:
+        _stats.clear()
+        _recycle_rss = None
+
+
+def recycle_requested():
+    """Return the RSS that crossed the watermark, or None."""
+    return _recycle_rss
+
+
+def terminate_worker(rss, task_path):
+    """ON_WATERMARK hook: ask the process to shut down gracefully."""
+    logger.warning(f"Terminating worker process {os.getpid()}: rss={rss}")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def get_recycle_response():
+    """
+    Build the response refusing new dispatches, if the process should be
+    recycled and RECYCLE_ACTION is "reject".
+
+    Returns:
+        tuple or None: (status code, response data dict, extra headers dict)
+    """
+    if _recycle_rss is None:
+        return None
+
+    from django.conf import settings
+
+    config = getattr(settings, "CLOUD_TASKS_MEMORY", None) or {}
+    if config.get("RECYCLE_ACTION", DEFAULT_RECYCLE_ACTION) != "reject":
+        return None
+    return (
+        503,
+        {"error": "Worker is being recycled", "rss": _recycle_rss},
+        {"Retry-After": str(RECYCLE_RETRY_AFTER)},
+    )
+
+
+def _record(config, task_path, rss_before, rss_after):
+    global _recycle_rss
+
+    growth = rss_after - rss_before
+    with _stats_lock:
+        stats = _stats.get(task_path)
+        if stats is None:
+            stats = _stats[task_path] = TaskMemoryStats()
+        stats.executions += 1
+        stats.peak_rss = max(stats.peak_rss, rss_after)
+        stats.max_growth = max(stats.max_growth, growth)
+        stats.total_growth += growth
+
+        watermark = config.get("RSS_WATERMARK")
+        crossed = (
+            watermark is not None and rss_after > watermark and _recycle_rss is None
+        )
+        if crossed:
+            _recycle_rss = rss_after
+
+    if not crossed:
+        return
+
+    logger.warning(
+        "RSS watermark crossed, requesting recycle: rss=%d watermark=%d path=%s",
+        rss_after,
+        watermark,
+        task_path,
+    )
+    hook = config.get("ON_WATERMARK")
+    if hook:
+        try:
+            (import_string(hook) if isinstance(hook, str) else hook)(
+                rss_after, task_path
+            )
+        except Exception:
+            logger.exception("RSS watermark hook failed")
+
+
+def _log_top_allocations(task_id, task_path, before, after, limit):
+    lines = [
+        f"  {stat.traceback[0]}: size_diff={stat.size_diff} count_diff="
+        f"{stat.count_diff}"
+        for stat in after.compare_to(before, "lineno")[:limit]
+    ]
+    logger.info(
+        "Top allocations: id=%s path=%s\n%s", task_id, task_path, "\n".join(lines)
+    )
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_started = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+
+
+@contextlib.contextmanager
+def _track(config, task_id, task_path):
+    snapshot_before = None
+    if task_path in config.get("TRACEMALLOC_TASK_PATHS", ()):
+        _start_tracemalloc()
+        snapshot_before = tracemalloc.take_snapshot()
+
+    rss_before = get_rss()
+    try:
+        yield
+    finally:
+        rss_after = get_rss()
+        if rss_before is not None and rss_after is not None:
+            _record(config, task_path, rss_before, rss_after)
+
+        if snapshot_before is not None:
+            snapshot_after = tracemalloc.take_snapshot()
+            _stop_tracemalloc()
+            _log_top_allocations(
+                task_id,
+                task_path,
+                snapshot_before,
+                snapshot_after,
+                config.get("TRACEMALLOC_TOP", DEFAULT_TRACEMALLOC_TOP),
+            )
+
+
+def track_memory(task_id, task_path):
+    """
+    Context manager measuring the memory of a task call, if enabled.
+
+    Returns a shared no-op context manager when CLOUD_TASKS_MEMORY is not set.
+    """
+    from django.conf import settings
+
+    config = getattr(settings, "CLOUD_TASKS_MEMORY", None)
+    if not config:
+        return _NOT_TRACKED
+    return _track(config, task_id, task_path)
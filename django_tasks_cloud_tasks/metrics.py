@@ -0,0 +1,501 @@
+"""
+In-process metrics for enqueue and execution, in Prometheus text format.
+
+Counters and histograms are kept in memory and updated under a per-metric
+lock, so recording is cheap and needs no external dependency.
+
+With multiple worker processes (e.g. gunicorn), set
+CLOUD_TASKS_METRICS_MULTIPROC_DIR (or the PROMETHEUS_MULTIPROC_DIR
+environment variable) to a directory shared by the workers. Each process
+then writes a snapshot of its metrics there every few seconds, and the
+metrics view sums the snapshots of all processes. Snapshots of processes
+that have exited, or that have not been written for
+MULTIPROC_SNAPSHOT_TTL seconds, are deleted when read.
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+# Seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    900.0,
+)
+# Bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+MULTIPROC_FLUSH_INTERVAL = 5  # seconds
+# Snapshots not rewritten for this long belong to processes that are gone
+# (or unreachable, e.g. in another PID namespace sharing the directory)
+MULTIPROC_SNAPSHOT_TTL = 60  # seconds
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values, strict=True))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing counter with labels."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(samples):
+        merged = {}
+        for labels, value in samples:
+            key = tuple(labels)
+            merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self, merged):
+        for labels, value in sorted(merged.items()):
+            yield (
+                f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Gauge:
+    """
+    Value that can go up and down, with labels.
+
+    Across processes, the value set last is reported.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = (value, time.time())
+
+    def get(self, *labelvalues):
+        entry = self._values.get(labelvalues)
+        return entry[0] if entry else None
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                [list(labels), value, updated_at]
+                for labels, (value, updated_at) in self._values.items()
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(samples):
+        latest = {}
+        for labels, value, updated_at in samples:
+            key = tuple(labels)
+            if key not in latest or updated_at >= latest[key][1]:
+                latest[key] = (value, updated_at)
+        return {key: value for key, (value, _) in latest.items()}
+
+    def render(self, merged):
+        for labels, value in sorted(merged.items()):
+            yield (
+                f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Histogram:
+    """Histogram with fixed buckets and labels."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, +Inf last, then sum
+                entry = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [
+                    0.0
+                ]
+            entry[index] += 1
+            entry[-1] += value
+
+    def get_count(self, *labelvalues):
+        entry = self._values.get(labelvalues)
+        return sum(entry[:-1]) if entry else 0
+
+    def get_sum(self, *labelvalues):
+        entry = self._values.get(labelvalues)
+        return entry[-1] if entry else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                [list(labels), list(entry)] for labels, entry in self._values.items()
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(samples):
+        merged = {}
+        for labels, entry in samples:
+            key = tuple(labels)
+            if key in merged:
+                merged[key] = [a + b for a, b in zip(merged[key], entry, strict=True)]
+            else:
+                merged[key] = list(entry)
+        return merged
+
+    def render(self, merged):
+        for labels, entry in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(
+                (*self.buckets, float("inf")), entry[:-1], strict=True
+            ):
+                cumulative += count
+                label_str = _format_labels(
+                    self.labelnames, labels, ("le", _format_value(bound))
+                )
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(entry[-1])}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+
+class Registry:
+    """Collection of metrics, rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._flusher_pid = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def snapshot(self):
+        """Return the current values of all metrics (JSON-serializable)."""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, snapshots=None):
+        """
+        Render metrics in Prometheus text exposition format.
+
+        Args:
+            snapshots: List of snapshots to sum. Defaults to this process.
+
+        Returns:
+            str: Exposition text
+        """
+        if snapshots is None:
+            snapshots = [self.snapshot()]
+
+        lines = []
+        for name, metric in self._metrics.items():
+            samples = [
+                sample for snapshot in snapshots for sample in snapshot.get(name, [])
+            ]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.render(metric.merge(samples)))
+        return "\n".join(lines) + "\n"
+
+    # Multiprocess mode
+
+    def flush(self, directory):
+        """Write this process's snapshot into directory."""
+        with self._flush_lock:
+            path = os.path.join(directory, f"cloudtasks_{os.getpid()}.json")
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+
+    def read_snapshots(self, directory, ttl=MULTIPROC_SNAPSHOT_TTL):
+        """
+        Read the snapshots written by live processes into directory.
+
+        Snapshots of exited processes, and snapshots older than ttl seconds,
+        are deleted instead.
+        """
+        snapshots = []
+        now = time.time()
+        for filename in sorted(os.listdir(directory)):
+            if not (filename.startswith("cloudtasks_") and filename.endswith(".json")):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                pid = int(filename.removeprefix("cloudtasks_").removesuffix(".json"))
+                if not _is_alive(pid) or now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except FileNotFoundError:
+                # Removed by another reader
+                continue
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read metrics snapshot {filename}: {e}")
+        return snapshots
+
+    def start_flusher(self, directory, interval=MULTIPROC_FLUSH_INTERVAL):
+        """Periodically flush this process's snapshot in a background thread."""
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        self._flusher_pid = pid
+
+        def run():
+            stop = threading.Event()
+            while not stop.wait(interval):
+                try:
+                    self.flush(directory)
+                except OSError as e:
+                    logger.warning(f"Could not write metrics snapshot: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+        atexit.register(self.flush, directory)
+
+    def _after_fork(self):
+        # Values recorded before fork belong to the parent process
+        self._flusher_pid = None
+        self._flush_lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+        self.clear()
+
+
+def _is_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry._after_fork)
+
+
+def get_multiproc_dir():
+    """Return the multiprocess snapshot directory, or None."""
+    from django.conf import settings
+
+    return getattr(settings, "CLOUD_TASKS_METRICS_MULTIPROC_DIR", None) or (
+        os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    )
+
+
+def ensure_multiproc_flusher():
+    """Start the snapshot flusher of this process if multiprocess mode is on."""
+    directory = get_multiproc_dir()
+    if directory and registry._flusher_pid != os.getpid():
+        registry.start_flusher(directory)
+
+
+def render_metrics():
+    """Render the metrics of this process, or of all processes if configured."""
+    directory = get_multiproc_dir()
+    if not directory:
+        return registry.render()
+
+    registry.flush(directory)
+    return registry.render(registry.read_snapshots(directory))
+
+
+# Enqueue
+
+ENQUEUE_DURATION = registry.histogram(
+    "cloudtasks_enqueue_duration_seconds",
+    "Latency of the Cloud Tasks CreateTask RPC.",
+    ["queue"],
+)
+ENQUEUE_PAYLOAD_BYTES = registry.histogram(
+    "cloudtasks_enqueue_payload_bytes",
+    "Size of enqueued task payloads.",
+    ["queue"],
+    buckets=SIZE_BUCKETS,
+)
+ENQUEUED = registry.counter(
+    "cloudtasks_enqueued_total",
+    "Tasks enqueued.",
+    ["task", "queue"],
+)
+ENQUEUE_COLLAPSED = registry.counter(
+    "cloudtasks_enqueue_collapsed_total",
+    "Enqueues of debounced or throttled tasks collapsed into an existing task.",
+    ["task", "queue"],
+)
+ENQUEUE_ERRORS = registry.counter(
+    "cloudtasks_enqueue_errors_total",
+    "Failed CreateTask RPCs by gRPC status code.",
+    ["queue", "code"],
+)
+ENQUEUE_FAILOVERS = registry.counter(
+    "cloudtasks_enqueue_failovers_total",
+    "Enqueues sent to another location after a failure of the first one.",
+    ["location"],
+)
+ENQUEUE_HEDGES = registry.counter(
+    "cloudtasks_enqueue_hedges_total",
+    "Hedged CreateTask RPCs sent to a second location.",
+    ["location"],
+)
+LOCATION_LATENCY = registry.gauge(
+    "cloudtasks_location_latency_seconds",
+    "Moving average of CreateTask latency per location.",
+    ["location"],
+)
+LOCATION_ERROR_RATE = registry.gauge(
+    "cloudtasks_location_error_rate",
+    "Moving average of the CreateTask error rate per location.",
+    ["location"],
+)
+LOCATION_HEALTHY = registry.gauge(
+    "cloudtasks_location_healthy",
+    "Whether a location is considered healthy (1) or degraded (0).",
+    ["location"],
+)
+
+# Execution
+
+TASK_QUEUE_WAIT = registry.histogram(
+    "cloudtasks_task_queue_wait_seconds",
+    "Time from enqueue (or scheduled time) to start of execution.",
+    ["task", "queue"],
+)
+DISPATCH_LAG = registry.histogram(
+    "cloudtasks_dispatch_lag_seconds",
+    "Time from the scheduled time of a dispatch (X-CloudTasks-TaskETA) to receipt.",
+    ["task", "queue"],
+)
+TASK_DURATION = registry.histogram(
+    "cloudtasks_task_duration_seconds",
+    "Task execution duration.",
+    ["task", "queue"],
+)
+TASK_EXECUTIONS = registry.counter(
+    "cloudtasks_task_executions_total",
+    "Task executions by outcome.",
+    ["task", "queue", "status"],
+)
+INLINE_CONTINUATIONS = registry.counter(
+    "cloudtasks_inline_continuations_total",
+    "Follow-up tasks held back for inline execution, by outcome.",
+    ["task", "queue", "outcome"],
+)
+DISPATCH_RESPONSES = registry.counter(
+    "cloudtasks_dispatch_responses_total",
+    "Responses of the task handler by HTTP status code.",
+    ["queue", "code"],
+)
+DISPATCH_REJECTIONS = registry.counter(
+    "cloudtasks_dispatch_rejections_total",
+    "Dispatches rejected by load shedding.",
+    ["task", "queue"],
+)
+
+
+def error_code(exception):
+    """Return the gRPC status code name of an API error, or its class name."""
+    code = getattr(exception, "grpc_status_code", None)
+    if code is not None:
+        return getattr(code, "name", str(code))
+    return type(exception).__name__
@@ -0,0 +1,37 @@
+# Generated by Django 6.1.2 on 2026-10-19 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskExecution",
+            fields=[
+                (
+                    "task_id",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("RUNNING", "Running"), ("COMPLETED", "Completed")],
+                        max_length=16,
+                    ),
+                ),
+                ("lease_expires_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "completed_at",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+            ],
+            options={
+                "verbose_name": "task execution",
+                "verbose_name_plural": "task executions",
+            },
+        ),
+    ]
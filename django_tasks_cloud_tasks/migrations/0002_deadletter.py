@@ -0,0 +1,41 @@
+# Generated by Django 6.1.2 on 2026-10-19 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_tasks_cloud_tasks", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeadLetter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_id", models.CharField(db_index=True, max_length=255)),
+                ("task_path", models.CharField(db_index=True, max_length=255)),
+                ("queue_name", models.CharField(db_index=True, max_length=255)),
+                ("backend", models.CharField(max_length=255)),
+                ("payload", models.JSONField()),
+                ("errors", models.JSONField(default=list)),
+                ("attempts", models.PositiveIntegerField()),
+                ("failed_at", models.DateTimeField(db_index=True)),
+                ("replayed_at", models.DateTimeField(blank=True, null=True)),
+                ("replay_task_id", models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                "verbose_name": "dead letter",
+                "verbose_name_plural": "dead letters",
+                "ordering": ["failed_at", "id"],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+"""Models for optional execution-side bookkeeping."""
+
+from django.db import models
+
+
+class TaskExecution(models.Model):
+    """
+    Completion ledger entry of a task, used by DatabaseLedger.
+
+    Task parameters still live in the Cloud Tasks payload; this only
+    records whether a task ID is running or has completed.
+    """
+
+    STATUS_RUNNING = "RUNNING"
+    STATUS_COMPLETED = "COMPLETED"
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+    ]
+
+    task_id = models.CharField(max_length=255, primary_key=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "task execution"
+        verbose_name_plural = "task executions"
+
+    def __str__(self):
+        return f"{self.task_id} ({self.status})"
+
+
+class DeadLetter(models.Model):
+    """
+    Task that failed its final attempt, used by DatabaseDeadLetterStore.
+
+    Keeps the full payload so the task can be replayed.
+    """
+
+    task_id = models.CharField(max_length=255, db_index=True)
+    task_path = models.CharField(max_length=255, db_index=True)
+    queue_name = models.CharField(max_length=255, db_index=True)
+    backend = models.CharField(max_length=255)
+    payload = models.JSONField()
+    errors = models.JSONField(default=list)
+    attempts = models.PositiveIntegerField()
+    failed_at = models.DateTimeField(db_index=True)
+    replayed_at = models.DateTimeField(null=True, blank=True)
+    replay_task_id = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        verbose_name = "dead letter"
+        verbose_name_plural = "dead letters"
+        ordering = ["failed_at", "id"]
+
+    def __str__(self):
+        return f"{self.task_path} {self.task_id} ({self.failed_at})"
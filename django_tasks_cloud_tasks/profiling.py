@@ -0,0 +1,224 @@
+"""
+Sampled profiling of task executions.
+
+Disabled unless configured in Django settings:
+
+    CLOUD_TASKS_PROFILING = {
+        "SAMPLE_RATE": 0.01,  # fraction of all executions
+        "TASK_PATHS": ["myapp.tasks.generate_report"],  # always profiled
+        "PROFILER": "cprofile",  # or "sampler"
+        "OUTPUT_DIR": "/tmp/task-profiles",
+        # or: "SINK": "myapp.profiling.upload_profile",
+    }
+
+Profilers:
+
+- ``cprofile``: deterministic profile, written in pstats format
+- ``sampler``: wall-clock stack sampler of the task's thread, written as
+  collapsed stacks (input of flamegraph.pl / speedscope). Includes time
+  spent waiting on I/O, which cProfile attributes poorly.
+
+Each profile is passed to the sink as a TaskProfile with the task ID and
+duration. A sink is a callable taking a TaskProfile.
+"""
+
+import collections
+import contextlib
+import cProfile
+import json
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+DEFAULT_PROFILER = "cprofile"
+DEFAULT_SAMPLER_INTERVAL = 0.005  # seconds
+
+_NOT_PROFILED = contextlib.nullcontext()
+
+
+@dataclass(frozen=True, slots=True)
+class TaskProfile:
+    """Profile of one task execution."""
+
+    task_id: str
+    task_path: str
+    duration: float  # seconds
+    format: str  # "pstats" or "collapsed"
+    data: bytes
+
+
+class CProfileProfiler:
+    """Deterministic profiler, producing pstats data."""
+
+    format = "pstats"
+
+    def __init__(self, options):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def get_data(self):
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
+
+
+class StackSampler:
+    """Wall-clock sampler of the calling thread, producing collapsed stacks."""
+
+    format = "collapsed"
+
+    def __init__(self, options):
+        self.interval = options.get("SAMPLER_INTERVAL", DEFAULT_SAMPLER_INTERVAL)
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def get_data(self):
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self._stacks.most_common()
+        ).encode()
+
+
+PROFILERS = {
+    "cprofile": CProfileProfiler,
+    "sampler": StackSampler,
+}
+
+
+class DirectorySink:
+    """
+    Write profiles into a directory.
+
+    Each profile is written as ``<time>_<task path>_<task id>.prof`` (pstats)
+    or ``.collapsed``, with a ``.json`` file holding the task ID, task path
+    and duration.
+    """
+
+    extensions = {"pstats": "prof", "collapsed": "collapsed"}
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(
+            self.directory,
+            f"{time.time():.0f}_{profile.task_path}_{profile.task_id}",
+        )
+        with open(f"{base}.{self.extensions[profile.format]}", "wb") as f:
+            f.write(profile.data)
+        with open(f"{base}.json", "w") as f:
+            json.dump(
+                {
+                    "task_id": profile.task_id,
+                    "task_path": profile.task_path,
+                    "duration": profile.duration,
+                    "format": profile.format,
+                },
+                f,
+            )
+
+
+def _get_sink(config):
+    sink = config.get("SINK")
+    if sink:
+        return import_string(sink) if isinstance(sink, str) else sink
+    output_dir = config.get("OUTPUT_DIR")
+    if output_dir:
+        return DirectorySink(output_dir)
+    return None
+
+
+def _should_profile(config, task_path):
+    if task_path in config.get("TASK_PATHS", ()):
+        return True
+    sample_rate = config.get("SAMPLE_RATE", 0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+@contextlib.contextmanager
+def _profile(config, task_id, task_path):
+    profiler_name = config.get("PROFILER", DEFAULT_PROFILER)
+    profiler = PROFILERS[profiler_name](config)
+
+    try:
+        profiler.start()
+    except ValueError as e:
+        # cProfile: another profiler is active (e.g. a concurrent task)
+        logger.debug(f"Profiling skipped: id={task_id} reason={e}")
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        duration = time.perf_counter() - start
+        try:
+            sink = _get_sink(config)
+            if sink is None:
+                logger.warning("CLOUD_TASKS_PROFILING has no SINK or OUTPUT_DIR")
+            else:
+                sink(
+                    TaskProfile(
+                        task_id=task_id,
+                        task_path=task_path,
+                        duration=duration,
+                        format=profiler.format,
+                        data=profiler.get_data(),
+                    )
+                )
+        except Exception:
+            logger.exception(f"Could not write profile of task {task_id}")
+
+
+def profile_task(task_id, task_path):
+    """
+    Context manager profiling a task call if it is sampled.
+
+    Returns a shared no-op context manager when profiling is disabled or the
+    execution is not sampled.
+    """
+    from django.conf import settings
+
+    config = getattr(settings, "CLOUD_TASKS_PROFILING", None)
+    if not config or not _should_profile(config, task_path):
+        return _NOT_PROFILED
+    return _profile(config, task_id, task_path)
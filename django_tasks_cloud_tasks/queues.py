@@ -0,0 +1,318 @@
+"""
+Declarative Cloud Tasks queue definitions.
+
+Queues are defined per backend in OPTIONS, using the names of the
+``gcloud tasks queues`` flags; durations are in seconds:
+
+    "OPTIONS": {
+        "QUEUE_DEFINITIONS": {
+            "default": {
+                "max_dispatches_per_second": 50,
+                "max_concurrent_dispatches": 20,
+                "max_attempts": 10,
+                "min_backoff": 1,
+                "max_backoff": 300,
+                "max_doublings": 4,
+                "max_retry_duration": 3600,
+                "dispatch_deadline": 600,
+            },
+        },
+    }
+
+The ``cloudtasks_sync_queues`` management command creates missing queues
+and updates the fields that differ from their definitions (see
+sync_queues()). ``dispatch_deadline`` is a property of tasks rather than
+queues; the backend sets it on every task enqueued to the queue.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Definition key: field path of the Queue message
+QUEUE_FIELDS = {
+    "max_dispatches_per_second": "rate_limits.max_dispatches_per_second",
+    "max_concurrent_dispatches": "rate_limits.max_concurrent_dispatches",
+    "max_burst_size": "rate_limits.max_burst_size",
+    "max_attempts": "retry_config.max_attempts",
+    "max_retry_duration": "retry_config.max_retry_duration",
+    "min_backoff": "retry_config.min_backoff",
+    "max_backoff": "retry_config.max_backoff",
+    "max_doublings": "retry_config.max_doublings",
+}
+DURATION_KEYS = frozenset(
+    {"max_retry_duration", "min_backoff", "max_backoff", "dispatch_deadline"}
+)
+# Chosen by Cloud Tasks from max_dispatches_per_second; it can only be set
+# through queue.yaml, so differences are reported but not applied
+OUTPUT_ONLY_KEYS = frozenset({"max_burst_size"})
+TASK_KEYS = frozenset({"dispatch_deadline"})
+
+DEFAULT_CONCURRENCY = 8
+
+
+def parse_queue_definitions(definitions):
+    """
+    Validate queue definitions and convert durations to timedelta.
+
+    Args:
+        definitions: {queue name: {key: value}} from OPTIONS
+
+    Returns:
+        dict: {queue name: {key: value}}
+
+    Raises:
+        ImproperlyConfigured: On unknown keys or invalid values
+    """
+    parsed = {}
+    for queue_name, definition in definitions.items():
+        unknown = set(definition) - set(QUEUE_FIELDS) - TASK_KEYS
+        if unknown:
+            raise ImproperlyConfigured(
+                f"Unknown keys in QUEUE_DEFINITIONS[{queue_name!r}]: "
+                f"{', '.join(sorted(unknown))}"
+            )
+        values = {}
+        for key, value in definition.items():
+            if key in DURATION_KEYS and not isinstance(value, timedelta):
+                value = timedelta(seconds=value)
+            if isinstance(value, timedelta) and value < timedelta():
+                raise ImproperlyConfigured(
+                    f"QUEUE_DEFINITIONS[{queue_name!r}][{key!r}] must not be negative"
+                )
+            values[key] = value
+        parsed[queue_name] = values
+    return parsed
+
+
+@dataclass(slots=True)
+class QueueSyncResult:
+    """Outcome of syncing one queue."""
+
+    queue_name: str
+    action: str  # "created", "updated", "unchanged", "missing" or "error"
+    changes: dict = field(default_factory=dict)  # {field path: (current, desired)}
+    warnings: list = field(default_factory=list)
+    error: str | None = None
+    dry_run: bool = False
+    location: str | None = None
+
+    def as_dict(self):
+        return {
+            "queue": self.queue_name,
+            "location": self.location,
+            "action": self.action,
+            "changes": {
+                path: [_format_value(current), _format_value(desired)]
+                for path, (current, desired) in self.changes.items()
+            },
+            "warnings": self.warnings,
+            "error": self.error,
+            "dry_run": self.dry_run,
+        }
+
+
+def _format_value(value):
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+def _get_field(queue, path):
+    value = queue
+    for name in path.split("."):
+        value = getattr(value, name)
+    return value
+
+
+def _equal(current, desired):
+    if isinstance(desired, float) or isinstance(current, float):
+        return math.isclose(current, desired, rel_tol=1e-9)
+    return current == desired
+
+
+def diff_queue(queue, definition):
+    """
+    Compare a live queue with its definition.
+
+    Args:
+        queue: tasks_v2.Queue
+        definition: Parsed definition of the queue
+
+    Returns:
+        tuple: ({field path: (current, desired)} of updatable fields,
+               list of warnings for fields that cannot be updated)
+    """
+    changes = {}
+    warnings = []
+    for key, path in QUEUE_FIELDS.items():
+        if key not in definition:
+            continue
+        current = _get_field(queue, path)
+        desired = definition[key]
+        if _equal(current, desired):
+            continue
+        if key in OUTPUT_ONLY_KEYS:
+            warnings.append(
+                f"{path} is {current}, defined as {desired}; it is derived from "
+                "max_dispatches_per_second and cannot be set through the API"
+            )
+        else:
+            changes[path] = (current, desired)
+    return changes, warnings
+
+
+def build_queue(name, definition, paths=None):
+    """
+    Build the Queue message of a definition.
+
+    Args:
+        name: Full resource name of the queue
+        definition: Parsed definition of the queue
+        paths: Field paths to include (default: all defined fields)
+    """
+    from google.cloud import tasks_v2
+
+    queue = {"name": name, "rate_limits": {}, "retry_config": {}}
+    for key, path in QUEUE_FIELDS.items():
+        if key in OUTPUT_ONLY_KEYS or key not in definition:
+            continue
+        if paths is not None and path not in paths:
+            continue
+        message, attribute = path.split(".")
+        queue[message][attribute] = definition[key]
+    return tasks_v2.Queue(**{k: v for k, v in queue.items() if v})
+
+
+def sync_queue(
+    client, project_id, location, queue_name, definition, dry_run=False, create=True
+):
+    """
+    Create or update one queue to match its definition.
+
+    Returns:
+        QueueSyncResult
+    """
+    from google.api_core import exceptions
+
+    name = client.queue_path(project_id, location, queue_name)
+    result = QueueSyncResult(
+        queue_name=queue_name, action="unchanged", dry_run=dry_run, location=location
+    )
+    try:
+        try:
+            queue = client.get_queue(name=name)
+        except exceptions.NotFound:
+            queue = None
+
+        if queue is None:
+            result.action = "created" if create else "missing"
+            result.changes = {
+                QUEUE_FIELDS[key]: (None, value)
+                for key, value in definition.items()
+                if key in QUEUE_FIELDS and key not in OUTPUT_ONLY_KEYS
+            }
+            if create and not dry_run:
+                client.create_queue(
+                    parent=client.common_location_path(project_id, location),
+                    queue=build_queue(name, definition),
+                )
+            return result
+
+        result.changes, result.warnings = diff_queue(queue, definition)
+        if result.changes:
+            result.action = "updated"
+            if not dry_run:
+                client.update_queue(
+                    queue=build_queue(name, definition, paths=result.changes),
+                    update_mask={"paths": list(result.changes)},
+                )
+    except Exception as e:
+        result.action = "error"
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def sync_queues(
+    backend,
+    queue_names=None,
+    dry_run=False,
+    create=True,
+    concurrency=DEFAULT_CONCURRENCY,
+    client=None,
+):
+    """
+    Sync the defined queues of a backend, concurrently.
+
+    Queues are synced in every location of the backend (see locations.py).
+    Idempotent: queues already matching their definitions are left alone.
+
+    Args:
+        backend: CloudTasksBackend with QUEUE_DEFINITIONS
+        queue_names: Queues to sync (default: all defined queues)
+        dry_run: Only report the changes
+        create: Create missing queues
+        concurrency: Queues synced at once
+        client: Cloud Tasks client (default: create_tasks_client())
+
+    Returns:
+        list: QueueSyncResult per location and queue, in the order of the
+              locations, then of the definitions
+    """
+    from .backends import create_tasks_client
+
+    definitions = backend.queue_definitions
+    if queue_names is None:
+        queue_names = list(definitions)
+    unknown = [name for name in queue_names if name not in definitions]
+    if unknown:
+        raise ValueError(f"Queues not defined in {backend.alias}: {', '.join(unknown)}")
+
+    if client is None:
+        client = create_tasks_client()
+    targets = [
+        (location, queue_name)
+        for location in backend.locations
+        for queue_name in queue_names
+    ]
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        return list(
+            executor.map(
+                lambda target: sync_queue(
+                    client,
+                    backend.project_id,
+                    target[0],
+                    target[1],
+                    definitions[target[1]],
+                    dry_run=dry_run,
+                    create=create,
+                ),
+                targets,
+            )
+        )
+
+
+def format_results(results):
+    """Render sync results as text."""
+    lines = []
+    several_locations = len({result.location for result in results}) > 1
+    for result in results:
+        action = result.action
+        if result.dry_run and action in ("created", "updated"):
+            action = f"would be {action}"
+        queue_name = result.queue_name
+        if several_locations:
+            queue_name = f"{result.location}/{queue_name}"
+        lines.append(f"{queue_name}: {action}")
+        for path, (current, desired) in result.changes.items():
+            lines.append(
+                f"  {path}: {_format_value(current)} -> {_format_value(desired)}"
+            )
+        for warning in result.warnings:
+            lines.append(f"  warning: {warning}")
+        if result.error:
+            lines.append(f"  error: {result.error}")
+    return "\n".join(lines)
@@ -0,0 +1,196 @@
+"""
+Routing of tasks to dedicated handler services.
+
+By default every task is sent to TASK_HANDLER_HOST. Heavy tasks can be sent
+to worker services of their own, with their own CPU/memory profile and
+scaling, by routes in OPTIONS:
+
+    "OPTIONS": {
+        "ROUTES": {
+            "heavy": {
+                "TASK_HANDLER_HOST": "https://heavy-worker-xyz.a.run.app",
+                "TASK_HANDLER_PATH": "/cloudtasks/execute/",  # optional
+                "OIDC_AUDIENCE": "https://heavy-worker-xyz.a.run.app",  # optional
+                "OIDC_SERVICE_ACCOUNT_EMAIL": "...",  # optional
+                "TASKS": ["myapp.tasks.render_video"],
+                "QUEUES": ["reports"],
+            },
+        },
+    }
+
+Routes to another App Engine service use an App Engine target instead of a
+host, and need no OIDC token:
+
+    "batch": {
+        "APP_ENGINE_ROUTING": {"service": "batch", "version": "v2"},
+        "QUEUES": ["batch"],
+    },
+
+A task can also name its route, which takes precedence:
+
+    @task
+    @route("heavy")
+    def render_video(video_id):
+        ...
+
+The route of a task is, in order: the route named by the task, the route
+listing its task path, the route listing its queue, the default service.
+Lookups are dictionaries built when the backend is created.
+"""
+
+from dataclasses import dataclass
+
+from django.core.exceptions import ImproperlyConfigured
+
+ROUTE_KEYS = frozenset(
+    {
+        "TASK_HANDLER_HOST",
+        "TASK_HANDLER_PATH",
+        "OIDC_AUDIENCE",
+        "OIDC_SERVICE_ACCOUNT_EMAIL",
+        "APP_ENGINE_ROUTING",
+        "TASKS",
+        "QUEUES",
+    }
+)
+APP_ENGINE_ROUTING_KEYS = frozenset({"service", "version", "instance"})
+ROUTE_ATTRIBUTE = "cloudtasks_route"
+
+
+def parse_app_engine_routing(routing, setting):
+    """
+    Validate an App Engine routing option.
+
+    Args:
+        routing: {"service": ..., "version": ..., "instance": ...}
+        setting: Option name, for error messages
+
+    Returns:
+        dict: Routing with empty values removed
+
+    Raises:
+        ImproperlyConfigured: On unknown keys
+    """
+    unknown = set(routing) - APP_ENGINE_ROUTING_KEYS
+    if unknown:
+        raise ImproperlyConfigured(
+            f"Unknown keys in {setting}: {', '.join(sorted(unknown))}"
+        )
+    return {key: value for key, value in routing.items() if value}
+
+
+def route(name):
+    """
+    Decorator sending a task to a route of ROUTES.
+
+    Apply it below ``@task``, to the function itself.
+
+    Args:
+        name: Route name
+    """
+
+    def decorator(func):
+        setattr(func, ROUTE_ATTRIBUTE, name)
+        return func
+
+    return decorator
+
+
+@dataclass(frozen=True, slots=True)
+class Route:
+    """
+    Handler service a task is sent to.
+
+    With app_engine_routing set, the task uses an App Engine target and url
+    is the path relative to the service.
+    """
+
+    name: str | None
+    url: str
+    oidc_service_account_email: str | None = None
+    oidc_audience: str | None = None
+    app_engine_routing: dict | None = None
+
+
+class TaskRouter:
+    """
+    Resolve the Route of tasks.
+
+    Args:
+        default: Route of tasks matching no rule
+        routes: ROUTES option
+        oidc_service_account_email: Service account of HTTP routes without
+            their own OIDC_SERVICE_ACCOUNT_EMAIL (the default route has none
+            when it is an App Engine target)
+    """
+
+    def __init__(self, default, routes=None, oidc_service_account_email=None):
+        self.default = default
+        self.routes = {}
+        self.by_task = {}
+        self.by_queue = {}
+
+        for name, config in (routes or {}).items():
+            unknown = set(config) - ROUTE_KEYS
+            if unknown:
+                raise ImproperlyConfigured(
+                    f"Unknown keys in ROUTES[{name!r}]: {', '.join(sorted(unknown))}"
+                )
+            path = config.get("TASK_HANDLER_PATH", "/cloudtasks/execute/")
+            if "APP_ENGINE_ROUTING" in config:
+                self.routes[name] = Route(
+                    name=name,
+                    url=path,
+                    app_engine_routing=parse_app_engine_routing(
+                        config["APP_ENGINE_ROUTING"],
+                        f"ROUTES[{name!r}]['APP_ENGINE_ROUTING']",
+                    ),
+                )
+            else:
+                host = config.get("TASK_HANDLER_HOST")
+                if not host:
+                    raise ImproperlyConfigured(
+                        f"ROUTES[{name!r}] requires TASK_HANDLER_HOST or "
+                        "APP_ENGINE_ROUTING"
+                    )
+                service_account = config.get(
+                    "OIDC_SERVICE_ACCOUNT_EMAIL", oidc_service_account_email
+                )
+                self.routes[name] = Route(
+                    name=name,
+                    url=f"{host.rstrip('/')}{path}",
+                    oidc_service_account_email=service_account,
+                    oidc_audience=config.get("OIDC_AUDIENCE") or host,
+                )
+            self._add_rules(self.by_task, "TASKS", name, config.get("TASKS", ()))
+            self._add_rules(self.by_queue, "QUEUES", name, config.get("QUEUES", ()))
+
+    def _add_rules(self, rules, key, name, values):
+        for value in values:
+            if value in rules:
+                raise ImproperlyConfigured(
+                    f"{value!r} is in the {key} of both ROUTES[{rules[value].name!r}] "
+                    f"and ROUTES[{name!r}]"
+                )
+            rules[value] = self.routes[name]
+
+    def resolve(self, task):
+        """
+        Return the Route of a task.
+
+        Raises:
+            ImproperlyConfigured: If the task names an unknown route
+        """
+        name = getattr(task.func, ROUTE_ATTRIBUTE, None)
+        if name is not None:
+            try:
+                return self.routes[name]
+            except KeyError:
+                raise ImproperlyConfigured(
+                    f"Task {task.module_path} uses unknown route {name!r}"
+                ) from None
+        return (
+            self.by_task.get(task.module_path)
+            or self.by_queue.get(task.queue_name)
+            or self.default
+        )
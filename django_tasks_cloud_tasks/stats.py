@@ -0,0 +1,261 @@
+"""
+Queue depth and backlog statistics.
+
+Used by the ``cloudtasks_stats`` management command, or directly:
+
+    from django.tasks import task_backends
+    from django_tasks_cloud_tasks.stats import get_queue_stats
+
+    for stats in get_queue_stats(task_backends["default"]):
+        print(stats.queue_name, stats.tasks_count, stats.backlog_seconds)
+
+Two methods are available:
+
+- ``list`` (default): pages through ListTasks, up to MAX_TASKS tasks per
+  queue. Counts above the cap are reported as truncated. Gives the oldest
+  schedule time and the dispatch attempts of pending tasks. Works with the
+  emulator.
+- ``stats``: GetQueue of the v2beta3 API with the ``stats`` read mask. One
+  cheap call per queue with exact counts, the oldest estimated arrival time
+  and the execution rate, but no dispatch attempts.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+from django.utils import timezone
+
+METHODS = ("list", "stats")
+DEFAULT_PAGE_SIZE = 1000  # largest page ListTasks returns
+DEFAULT_MAX_TASKS = 10000
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass(slots=True)
+class QueueStats:
+    """Depth, backlog and limits of one queue."""
+
+    queue_name: str
+    state: str | None = None
+    max_dispatches_per_second: float | None = None
+    max_concurrent_dispatches: int | None = None
+    max_attempts: int | None = None
+    tasks_count: int | None = None
+    truncated: bool = False  # tasks_count is a lower bound
+    oldest_schedule_time: datetime | None = None
+    backlog_seconds: float | None = None  # age of the oldest due task
+    dispatch_attempts: int | None = None  # dispatches of pending tasks
+    retried_tasks: int | None = None  # pending tasks dispatched before
+    max_dispatch_count: int | None = None
+    executed_last_minute: int | None = None
+    concurrent_dispatches: int | None = None
+    effective_execution_rate: float | None = None
+    error: str | None = None
+    location: str | None = None
+
+    def as_dict(self):
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        if self.oldest_schedule_time is not None:
+            data["oldest_schedule_time"] = self.oldest_schedule_time.isoformat()
+        return data
+
+
+def _backlog_seconds(oldest, now):
+    if oldest is None:
+        return None
+    return max((now - oldest).total_seconds(), 0.0)
+
+
+def _list_tasks(stats, client, name, page_size, max_tasks, now):
+    count = dispatch_attempts = retried = max_dispatch_count = 0
+    oldest = None
+    for task in client.list_tasks(request={"parent": name, "page_size": page_size}):
+        if count >= max_tasks:
+            stats.truncated = True
+            break
+        count += 1
+        dispatch_attempts += task.dispatch_count
+        max_dispatch_count = max(max_dispatch_count, task.dispatch_count)
+        if task.dispatch_count:
+            retried += 1
+        schedule_time = task.schedule_time
+        if schedule_time and (oldest is None or schedule_time < oldest):
+            oldest = schedule_time
+
+    stats.tasks_count = count
+    stats.dispatch_attempts = dispatch_attempts
+    stats.retried_tasks = retried
+    stats.max_dispatch_count = max_dispatch_count
+    stats.oldest_schedule_time = oldest
+    stats.backlog_seconds = _backlog_seconds(oldest, now)
+
+
+def _read_stats(stats, client, name, now):
+    queue_stats = client.get_queue(request={"name": name, "read_mask": "stats"}).stats
+    oldest = queue_stats.oldest_estimated_arrival_time or None
+    stats.tasks_count = queue_stats.tasks_count
+    stats.oldest_schedule_time = oldest
+    stats.backlog_seconds = _backlog_seconds(oldest, now)
+    stats.executed_last_minute = queue_stats.executed_last_minute_count
+    stats.concurrent_dispatches = queue_stats.concurrent_dispatches_count
+    stats.effective_execution_rate = queue_stats.effective_execution_rate
+
+
+def fetch_queue_stats(
+    client,
+    project_id,
+    location,
+    queue_name,
+    method="list",
+    page_size=DEFAULT_PAGE_SIZE,
+    max_tasks=DEFAULT_MAX_TASKS,
+    stats_client=None,
+):
+    """
+    Fetch the statistics of one queue.
+
+    Args:
+        client: Cloud Tasks v2 client
+        project_id: GCP project of the queue
+        location: Cloud Tasks location of the queue
+        queue_name: Queue ID
+        method: "list" or "stats"
+        page_size: ListTasks page size
+        max_tasks: Tasks listed at most
+        stats_client: Cloud Tasks v2beta3 client, for the "stats" method
+
+    Returns:
+        QueueStats: With ``error`` set if the API call failed
+    """
+    stats = QueueStats(queue_name=queue_name, location=location)
+    now = timezone.now()
+    try:
+        name = client.queue_path(project_id, location, queue_name)
+        queue = client.get_queue(name=name)
+        stats.state = queue.state.name
+        stats.max_dispatches_per_second = queue.rate_limits.max_dispatches_per_second
+        stats.max_concurrent_dispatches = queue.rate_limits.max_concurrent_dispatches
+        stats.max_attempts = queue.retry_config.max_attempts
+
+        if method == "stats":
+            _read_stats(stats, stats_client, name, now)
+        else:
+            _list_tasks(stats, client, name, page_size, max_tasks, now)
+    except Exception as e:
+        stats.error = f"{type(e).__name__}: {e}"
+    return stats
+
+
+def get_queue_names(backend):
+    """Queues of a backend: its QUEUES, and queues in QUEUE_DEFINITIONS."""
+    names = set(backend.queues) | set(getattr(backend, "queue_definitions", {}))
+    return sorted(names) or ["default"]
+
+
+def get_queue_stats(
+    backend,
+    queue_names=None,
+    method="list",
+    page_size=DEFAULT_PAGE_SIZE,
+    max_tasks=DEFAULT_MAX_TASKS,
+    concurrency=DEFAULT_CONCURRENCY,
+    client=None,
+    stats_client=None,
+):
+    """
+    Fetch the statistics of a backend's queues in all its locations,
+    concurrently.
+
+    Args:
+        backend: CloudTasksBackend
+        queue_names: Queues to read (default: get_queue_names(backend))
+        method: "list" or "stats" (see module docstring)
+        page_size: ListTasks page size
+        max_tasks: Tasks listed at most per queue
+        concurrency: Queues read at once
+        client: Cloud Tasks v2 client (default: create_tasks_client())
+        stats_client: Cloud Tasks v2beta3 client
+
+    Returns:
+        list: QueueStats per location and queue, in the order of the
+              locations, then of the queues
+    """
+    from .backends import create_tasks_client
+
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    if queue_names is None:
+        queue_names = get_queue_names(backend)
+    if client is None:
+        client = create_tasks_client()
+    if method == "stats" and stats_client is None:
+        stats_client = create_tasks_client("v2beta3")
+
+    targets = [
+        (location, queue_name)
+        for location in backend.locations
+        for queue_name in queue_names
+    ]
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        return list(
+            executor.map(
+                lambda target: fetch_queue_stats(
+                    client,
+                    backend.project_id,
+                    target[0],
+                    target[1],
+                    method=method,
+                    page_size=page_size,
+                    max_tasks=max_tasks,
+                    stats_client=stats_client,
+                ),
+                targets,
+            )
+        )
+
+
+TABLE_COLUMNS = (
+    ("QUEUE", "queue_name"),
+    ("STATE", "state"),
+    ("TASKS", "tasks_count"),
+    ("BACKLOG(s)", "backlog_seconds"),
+    ("ATTEMPTS", "dispatch_attempts"),
+    ("RETRIED", "retried_tasks"),
+    ("RATE(/s)", "max_dispatches_per_second"),
+    ("CONCURRENT", "max_concurrent_dispatches"),
+    ("MAX_ATTEMPTS", "max_attempts"),
+)
+
+
+def _cell(stats, attribute):
+    value = getattr(stats, attribute)
+    if value is None:
+        return "-"
+    if attribute == "tasks_count" and stats.truncated:
+        return f">={value}"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+
+def format_table(stats_list):
+    """Render statistics as a text table."""
+    columns = TABLE_COLUMNS
+    if len({stats.location for stats in stats_list}) > 1:
+        columns = (("LOCATION", "location"), *columns)
+    rows = [[header for header, _ in columns]]
+    for stats in stats_list:
+        rows.append([_cell(stats, attribute) for _, attribute in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths, strict=True))
+        for row in rows
+    ]
+    for stats in stats_list:
+        if stats.error:
+            queue_name = stats.queue_name
+            if len(columns) > len(TABLE_COLUMNS):
+                queue_name = f"{stats.location}/{queue_name}"
+            lines.append(f"{queue_name}: {stats.error}")
+    return "\n".join(line.rstrip() for line in lines)
@@ -0,0 +1,242 @@
+"""
+Trace context propagation from enqueue to execution.
+
+Enqueue injects the W3C ``traceparent``/``tracestate`` headers into the
+Cloud Tasks HTTP request, and the task handler continues that trace with
+spans for authentication, deserialization and execution.
+
+Spans are recorded with the OpenTelemetry API if it is installed
+(``pip install django-tasks-cloud-tasks[tracing]``); otherwise spans are
+no-ops, and only the trace IDs from the request headers are kept for log
+correlation (see TraceLogFilter).
+"""
+
+import contextlib
+import contextvars
+import functools
+import logging
+import re
+from dataclasses import dataclass
+
+TRACEPARENT_HEADER = "traceparent"
+TRACESTATE_HEADER = "tracestate"
+CLOUD_TRACE_CONTEXT_HEADER = "X-Cloud-Trace-Context"
+
+TRACER_NAME = "django_tasks_cloud_tasks"
+
+_TRACEPARENT_RE = re.compile(
+    r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$"
+)
+_CLOUD_TRACE_CONTEXT_RE = re.compile(r"^([0-9a-fA-F]{32})(?:/(\d+))?(?:;o=(\d))?$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+# Trace of the task request being handled
+_current_trace = contextvars.ContextVar("cloud_tasks_trace", default=None)
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+@dataclass(frozen=True, slots=True)
+class TraceInfo:
+    """Trace context of one request."""
+
+    trace_id: str
+    span_id: str | None = None
+    sampled: bool = False
+    tracestate: str | None = None
+
+    @classmethod
+    def from_headers(cls, headers):
+        """
+        Parse the trace context of a request.
+
+        Uses ``traceparent``/``tracestate``, falling back to
+        ``X-Cloud-Trace-Context`` (TRACE_ID/SPAN_ID;o=OPTIONS).
+
+        Returns:
+            TraceInfo or None: None if the request carries no valid context
+        """
+        traceparent = headers.get(TRACEPARENT_HEADER)
+        if traceparent:
+            match = _TRACEPARENT_RE.match(traceparent.strip().lower())
+            if match:
+                trace_id, span_id, flags, _ = match.groups()
+                if trace_id != _INVALID_TRACE_ID and span_id != _INVALID_SPAN_ID:
+                    return cls(
+                        trace_id=trace_id,
+                        span_id=span_id,
+                        sampled=bool(int(flags, 16) & 1),
+                        tracestate=headers.get(TRACESTATE_HEADER) or None,
+                    )
+
+        cloud_trace_context = headers.get(CLOUD_TRACE_CONTEXT_HEADER)
+        if cloud_trace_context:
+            match = _CLOUD_TRACE_CONTEXT_RE.match(cloud_trace_context.strip())
+            if match:
+                trace_id, span_id, options = match.groups()
+                if trace_id != _INVALID_TRACE_ID:
+                    return cls(
+                        trace_id=trace_id.lower(),
+                        span_id=f"{int(span_id):016x}" if span_id else None,
+                        sampled=options == "1",
+                    )
+
+        return None
+
+    @property
+    def traceparent(self):
+        """W3C traceparent header value, or None without a span ID."""
+        if self.span_id is None:
+            return None
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @property
+    def cloud_trace_context(self):
+        """X-Cloud-Trace-Context header value."""
+        value = self.trace_id
+        if self.span_id is not None:
+            value += f"/{int(self.span_id, 16)}"
+        return f"{value};o={1 if self.sampled else 0}"
+
+
+@functools.cache
+def _get_otel():
+    """Return the OpenTelemetry API modules and tracer, or None."""
+    try:
+        from opentelemetry import propagate, trace
+    except ImportError:
+        return None
+
+    return propagate, trace, trace.get_tracer(TRACER_NAME)
+
+
+def get_current_trace():
+    """
+    Return the trace context of the code being run.
+
+    Uses the current OpenTelemetry span if there is one, otherwise the
+    context of the task request being handled.
+
+    Returns:
+        TraceInfo or None
+    """
+    otel = _get_otel()
+    if otel is not None:
+        _, trace, _ = otel
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            return TraceInfo(
+                trace_id=f"{span_context.trace_id:032x}",
+                span_id=f"{span_context.span_id:016x}",
+                sampled=span_context.trace_flags.sampled,
+            )
+    return _current_trace.get()
+
+
+def inject_trace_headers(headers):
+    """
+    Add the trace context of the current code to outgoing task headers.
+
+    Args:
+        headers: Dict of HTTP headers, modified in place
+    """
+    otel = _get_otel()
+    if otel is not None:
+        propagate, _, _ = otel
+        propagate.inject(headers)
+        if TRACEPARENT_HEADER in headers:
+            return
+
+    # Without OpenTelemetry, tasks enqueued by a task join its trace
+    trace_info = _current_trace.get()
+    if trace_info is not None and trace_info.traceparent:
+        headers[TRACEPARENT_HEADER] = trace_info.traceparent
+        if trace_info.tracestate:
+            headers[TRACESTATE_HEADER] = trace_info.tracestate
+
+
+def span(name, attributes=None):
+    """
+    Context manager recording a span, or doing nothing without OpenTelemetry.
+    """
+    otel = _get_otel()
+    if otel is None:
+        return _NOOP_SPAN
+    _, _, tracer = otel
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+@contextlib.contextmanager
+def continue_trace(headers, name="cloudtasks.dispatch", attributes=None):
+    """
+    Continue the trace of a task request while handling it.
+
+    If a span is already active (e.g. from Django instrumentation that
+    extracted the same headers), the dispatch span is nested inside it.
+    """
+    token = _current_trace.set(TraceInfo.from_headers(headers))
+    try:
+        otel = _get_otel()
+        if otel is None:
+            yield
+            return
+
+        propagate, trace, tracer = otel
+        context = None
+        if not trace.get_current_span().get_span_context().is_valid:
+            context = propagate.extract(headers)
+        with tracer.start_as_current_span(
+            name,
+            context=context,
+            kind=trace.SpanKind.CONSUMER,
+            attributes=attributes,
+        ):
+            yield
+    finally:
+        _current_trace.reset(token)
+
+
+class TraceLogFilter(logging.Filter):
+    """
+    Logging filter adding the current trace to log records.
+
+    Sets ``trace`` (``projects/PROJECT/traces/TRACE_ID``, as expected by
+    Cloud Logging), ``span_id``, ``trace_sampled`` and
+    ``cloud_trace_context`` (X-Cloud-Trace-Context format). Attributes are
+    None outside of a trace.
+
+    Usage (settings.LOGGING):
+        "filters": {
+            "trace": {"()": "django_tasks_cloud_tasks.tracing.TraceLogFilter"},
+        },
+    """
+
+    def __init__(self, name="", project_id=None):
+        super().__init__(name)
+        self.project_id = project_id
+
+    def get_project_id(self):
+        if self.project_id is None:
+            from .detection import detect_gcp_project
+
+            self.project_id = detect_gcp_project() or ""
+        return self.project_id
+
+    def filter(self, record):
+        trace_info = get_current_trace()
+        if trace_info is None:
+            record.trace = record.span_id = record.cloud_trace_context = None
+            record.trace_sampled = False
+            return True
+
+        project_id = self.get_project_id()
+        record.trace = (
+            f"projects/{project_id}/traces/{trace_info.trace_id}"
+            if project_id
+            else trace_info.trace_id
+        )
+        record.span_id = trace_info.span_id
+        record.trace_sampled = trace_info.sampled
+        record.cloud_trace_context = trace_info.cloud_trace_context
+        return True
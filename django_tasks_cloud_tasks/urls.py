@@ -2,10 +2,12 @@
 
 from django.urls import path
 
-from .views import ExecuteTaskView
+from .views import ExecuteTaskView, MetricsView, WarmupView
 
 app_name = "django_tasks_cloud_tasks"
 
 urlpatterns = [
     path("execute/", ExecuteTaskView.as_view(), name="execute_task"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("warmup/", WarmupView.as_view(), name="warmup"),
 ]
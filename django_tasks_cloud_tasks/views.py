@@ -1,15 +1,13 @@
 """Views for receiving requests from Cloud Tasks and executing tasks."""
 
-import json
 import logging
 
-from django.http import JsonResponse
-from django.utils.crypto import get_random_string
+from django.http import Http404, HttpResponse, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
-from .executor import execute_task_from_payload
+from .handler import get_default_auth_handler, handle_task_request
 
 logger = logging.getLogger("django_tasks_cloud_tasks")
 
@@ -24,72 +22,56 @@ class ExecuteTaskView(View):
         """
         Get authentication handler.
 
+        Uses HMAC signatures if CLOUD_TASKS_HMAC_KEYS is set, otherwise
+        OIDC tokens if CLOUD_TASKS_OIDC_AUDIENCE is set.
         Can be overridden in subclasses.
         """
-        from django.conf import settings
+        return get_default_auth_handler()
 
-        audience = getattr(settings, "CLOUD_TASKS_OIDC_AUDIENCE", None)
-        if audience:
-            from .auth import create_oidc_auth_handler
+    def post(self, request):
+        status, data, headers = handle_task_request(request, self.get_auth_handler())
+        return JsonResponse(data, status=status, headers=headers)
 
-            return create_oidc_auth_handler(audience)
 
-        return None
+class WarmupView(View):
+    """
+    View for warming up the process before it receives tasks.
 
-    def post(self, request):
-        # Authentication
-        auth_handler = self.get_auth_handler()
-        if auth_handler:
-            is_valid, error_message = auth_handler(request)
-            if not is_valid:
-                logger.warning(f"Authentication failed: {error_message}")
-                return JsonResponse(
-                    {"error": "Unauthorized", "detail": error_message},
-                    status=401,
-                )
-
-        # Parse request body
-        try:
-            payload = json.loads(request.body)
-        except json.JSONDecodeError as e:
-            return JsonResponse(
-                {"error": "Invalid JSON", "detail": str(e)},
-                status=400,
-            )
-
-        # Generate worker ID
-        worker_id = get_random_string(32)
-
-        # Execute task
-        try:
-            task_result, success = execute_task_from_payload(payload, worker_id)
-        except Exception as e:
-            logger.exception("Task execution failed")
-            return JsonResponse(
-                {"error": "Task execution failed", "detail": str(e)},
-                status=500,
-            )
-
-        if success:
-            return JsonResponse(
-                {
-                    "status": "success",
-                    "task_id": task_result.id,
-                }
-            )
-        else:
-            # Return 500 to enable Cloud Tasks retry
-            return JsonResponse(
-                {
-                    "status": "failed",
-                    "task_id": task_result.id,
-                    "errors": [
-                        {
-                            "exception": err.exception_class_path,
-                            "traceback": err.traceback,
-                        }
-                        for err in task_result.errors
-                    ],
-                },
-                status=500,
-            )
+    Can be used as an App Engine warmup request handler or a Cloud Run
+    startup probe. Returns 503 if any warm-up stage failed.
+    """
+
+    def get(self, request):
+        from .warmup import warmup
+
+        stages = warmup()
+        failed = any("error" in stage for stage in stages)
+
+        return JsonResponse(
+            {
+                "status": "error" if failed else "ok",
+                "total_ms": round(sum(stage["duration_ms"] for stage in stages), 3),
+                "stages": stages,
+            },
+            status=503 if failed else 200,
+        )
+
+
+class MetricsView(View):
+    """
+    View exposing enqueue and execution metrics in Prometheus text format.
+
+    Disabled (404) unless CLOUD_TASKS_METRICS_ENABLED is True.
+    """
+
+    def get(self, request):
+        from django.conf import settings
+
+        from .metrics import render_metrics
+
+        if not getattr(settings, "CLOUD_TASKS_METRICS_ENABLED", False):
+            raise Http404("Metrics are disabled")
+
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
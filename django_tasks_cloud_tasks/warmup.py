@@ -0,0 +1,115 @@
+"""Warm-up of lazily initialized resources to reduce cold start latency."""
+
+import logging
+import time
+
+logger = logging.getLogger("django_tasks_cloud_tasks")
+
+
+def _import_tasks_client():
+    """Import the Cloud Tasks client library (used by enqueue)."""
+    from google.cloud import tasks_v2  # noqa: F401
+
+
+def _import_oidc():
+    """Import the OIDC verification stack (used by the task handler)."""
+    import requests  # noqa: F401
+    from google.auth import crypt, jwt  # noqa: F401
+
+
+def _fetch_oidc_certs():
+    """Fetch Google's OIDC certificates if OIDC verification is enabled."""
+    from django.conf import settings
+
+    if not getattr(settings, "CLOUD_TASKS_OIDC_AUDIENCE", None):
+        return
+
+    from .auth import prefetch_oidc_certs
+
+    prefetch_oidc_certs()
+
+
+def _detect_environment():
+    """Run GCP environment detection and initialize configured backends."""
+    from django.tasks import task_backends
+
+    from .detection import (
+        detect_default_service_account,
+        detect_gcp_location,
+        detect_gcp_project,
+        detect_task_handler_host,
+    )
+
+    detect_gcp_project()
+    detect_gcp_location()
+    detect_task_handler_host()
+    detect_default_service_account()
+
+    # Accessing each alias instantiates the backend for this thread
+    for alias in task_backends.settings:
+        task_backends[alias]
+
+
+def _import_task_modules():
+    """
+    Import task modules.
+
+    Uses CLOUD_TASKS_WARMUP_TASK_MODULES if set, otherwise imports the
+    ``tasks`` module of every installed app.
+    """
+    from importlib import import_module
+
+    from django.conf import settings
+    from django.utils.module_loading import autodiscover_modules
+
+    modules = getattr(settings, "CLOUD_TASKS_WARMUP_TASK_MODULES", None)
+    if modules is None:
+        autodiscover_modules("tasks")
+        return
+
+    for module in modules:
+        import_module(module)
+
+
+WARMUP_STAGES = [
+    ("import_tasks_client", _import_tasks_client),
+    ("import_oidc", _import_oidc),
+    ("fetch_oidc_certs", _fetch_oidc_certs),
+    ("detect_environment", _detect_environment),
+    ("import_task_modules", _import_task_modules),
+]
+
+
+def warmup(stages=None):
+    """
+    Run warm-up stages and measure how long each one takes.
+
+    A failing stage is recorded and does not stop the remaining stages.
+
+    Args:
+        stages: List of (name, callable) pairs. Defaults to WARMUP_STAGES.
+
+    Returns:
+        list: One dict per stage with "name", "duration_ms" and, if the
+              stage raised, "error"
+    """
+    if stages is None:
+        stages = WARMUP_STAGES
+
+    results = []
+    for name, func in stages:
+        started = time.perf_counter()
+        result = {"name": name}
+        try:
+            func()
+        except Exception as e:
+            logger.warning("Warm-up stage failed: stage=%s error=%s", name, e)
+            result["error"] = str(e)
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        results.append(result)
+
+    logger.info(
+        "Warm-up finished: %s",
+        " ".join(f"{r['name']}={r['duration_ms']}ms" for r in results),
+    )
+    return results
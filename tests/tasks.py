@@ -2,6 +2,10 @@
 
 from django.tasks import task
 
+from django_tasks_cloud_tasks.debounce import debounce, throttle
+from django_tasks_cloud_tasks.inline import inline
+from django_tasks_cloud_tasks.routes import route
+
 
 @task
 def add_numbers(x, y):
@@ -37,3 +41,77 @@ def failing_view_task():
 def task_with_context(context, message):
     """Task that receives context."""
     return f"Task {context.task_result.id}: {message}"
+
+
+@task
+def sleeping_task(seconds):
+    """Task that sleeps, for profiling tests."""
+    import time
+
+    time.sleep(seconds)
+    return seconds
+
+
+@task
+def chain_task(x):
+    """Task that enqueues simple_task."""
+    simple_task.enqueue(x)
+    return x
+
+
+@task
+def flaky_task(x, succeed=False):
+    """Task that fails unless told to succeed, for dead-letter tests."""
+    if not succeed:
+        raise ValueError(f"Cannot process {x}")
+    return x
+
+
+@task
+@route("heavy")
+def heavy_task(x):
+    """Task sent to the "heavy" route, for routing tests."""
+    return x
+
+
+@task
+@debounce(60)
+def debounced_task(doc_id):
+    """Task collapsed per document and minute, for debounce tests."""
+    return doc_id
+
+
+@task
+@throttle(60, key=lambda doc_id, **kwargs: doc_id)
+def throttled_task(doc_id, reason=""):
+    """Task run at most once per document and minute, for throttle tests."""
+    return doc_id
+
+
+@task
+@inline
+def inline_step(n):
+    """Inline-eligible task enqueueing the next step until n is 0."""
+    if n > 0:
+        inline_step.enqueue(n - 1)
+    return n
+
+
+@task
+@inline
+def failing_inline_task():
+    """Inline-eligible task that always fails."""
+    raise ValueError("Inline task failed")
+
+
+@task
+def enqueue_then_fail():
+    """Task enqueueing an inline-eligible task, then failing."""
+    inline_step.enqueue(0)
+    raise ValueError("Parent failed")
+
+
+@task
+def enqueue_failing_inline():
+    """Task enqueueing an inline-eligible task that fails."""
+    failing_inline_task.enqueue()
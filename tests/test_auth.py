@@ -0,0 +1,621 @@
+"""Tests for auth.py"""
+
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.test import RequestFactory
+
+AUDIENCE = "https://test.example.com"
+
+
+def make_key_material(key_id="test-key"):
+    """
+    Create an RSA key pair.
+
+    Returns:
+        (signer, {key_id: PEM certificate}, JWKS document)
+    """
+    pytest.importorskip("cryptography")
+    import base64
+    import datetime
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    from google.auth import crypt
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.datetime.now(datetime.UTC)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(1)
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    signer = crypt.RSASigner.from_string(private_pem, key_id=key_id)
+    certs = {key_id: cert.public_bytes(serialization.Encoding.PEM).decode()}
+
+    def b64url_int(value):
+        data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+    numbers = key.public_key().public_numbers()
+    jwks = {
+        "keys": [
+            {
+                "kty": "RSA",
+                "alg": "RS256",
+                "use": "sig",
+                "kid": key_id,
+                "n": b64url_int(numbers.n),
+                "e": b64url_int(numbers.e),
+            }
+        ]
+    }
+    return signer, certs, jwks
+
+
+def make_signing_key(key_id="test-key"):
+    """Create an RSA key pair and return (signer, {key_id: PEM certificate})."""
+    signer, certs, _ = make_key_material(key_id)
+    return signer, certs
+
+
+def make_token(signer, **claims):
+    from google.auth import jwt
+
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": AUDIENCE,
+        "iat": now,
+        "exp": now + 3600,
+        "email": "invoker@test-project.iam.gserviceaccount.com",
+        "email_verified": True,
+    }
+    payload.update(claims)
+    return jwt.encode(signer, payload).decode()
+
+
+def make_response(certs, cache_control="public, max-age=600", age=None):
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = certs
+    response.headers = {"Cache-Control": cache_control}
+    if age is not None:
+        response.headers["Age"] = str(age)
+    return response
+
+
+def make_cache(response, cache_class=None, **kwargs):
+    from django_tasks_cloud_tasks.auth import GoogleCertCache
+
+    cache_class = cache_class or GoogleCertCache
+    cache = cache_class(url="https://certs.example.com", **kwargs)
+    session = MagicMock()
+    session.get.return_value = response
+    cache._session = session
+    return cache, session
+
+
+class TestGoogleCertCache:
+    def test_fetches_once_within_max_age(self):
+        cache, session = make_cache(make_response({"k1": "cert"}))
+
+        assert cache.get() == {"k1": "cert"}
+        assert cache.get("k1") == {"k1": "cert"}
+        assert session.get.call_count == 1
+
+    def test_honours_max_age_and_age_headers(self):
+        cache, _ = make_cache(make_response({}, "public, max-age=600", age=100))
+
+        before = time.monotonic()
+        cache.refresh()
+
+        assert 499 <= cache._expires_at - before <= 501
+
+    def test_refetches_after_expiry(self):
+        cache, session = make_cache(make_response({"k1": "cert"}))
+        cache.get()
+        cache._expires_at = time.monotonic() - 1
+
+        cache.get()
+
+        assert session.get.call_count == 2
+
+    def test_refreshes_in_background_before_expiry(self):
+        cache, session = make_cache(make_response({"k1": "cert"}), refresh_margin=60)
+        cache.get()
+        cache._expires_at = time.monotonic() + 30
+
+        with patch("threading.Thread") as mock_thread:
+            assert cache.get() == {"k1": "cert"}
+            assert cache.get() == {"k1": "cert"}
+
+        # Only one refresh thread is started, and the caller is not blocked
+        mock_thread.assert_called_once()
+        mock_thread.return_value.start.assert_called_once()
+        assert session.get.call_count == 1
+
+    def test_refetches_for_unknown_key_id(self):
+        cache, session = make_cache(
+            make_response({"k1": "cert"}), min_refresh_interval=0
+        )
+        cache.get()
+        session.get.return_value = make_response({"k1": "cert", "k2": "cert"})
+
+        assert "k2" in cache.get("k2")
+        assert session.get.call_count == 2
+
+    def test_unknown_key_id_refetch_is_rate_limited(self):
+        cache, session = make_cache(
+            make_response({"k1": "cert"}), min_refresh_interval=30
+        )
+        cache.get()
+
+        cache.get("unknown")
+
+        assert session.get.call_count == 1
+
+    def test_raises_on_error_status(self):
+        from google.auth import exceptions
+
+        response = make_response({})
+        response.status_code = 500
+        cache, _ = make_cache(response)
+
+        with pytest.raises(exceptions.TransportError):
+            cache.get()
+
+
+class TestVerifiedTokenCache:
+    def test_counts_hits_and_misses(self):
+        from django_tasks_cloud_tasks.auth import VerifiedTokenCache
+
+        cache = VerifiedTokenCache()
+        claims = {"exp": time.time() + 3600}
+
+        assert cache.get("token") is None
+        cache.set("token", claims)
+        assert cache.get("token") == claims
+
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_expires_entries_skew_seconds_before_exp(self):
+        from django_tasks_cloud_tasks.auth import VerifiedTokenCache
+
+        cache = VerifiedTokenCache(skew=30)
+        cache.set("expiring", {"exp": time.time() + 10})
+        cache.set("valid", {"exp": time.time() + 60})
+
+        assert cache.get("expiring") is None
+        assert cache.get("valid") is not None
+
+    def test_evicts_least_recently_used(self):
+        from django_tasks_cloud_tasks.auth import VerifiedTokenCache
+
+        cache = VerifiedTokenCache(maxsize=2)
+        exp = time.time() + 3600
+        cache.set("a", {"exp": exp})
+        cache.set("b", {"exp": exp})
+        cache.get("a")
+        cache.set("c", {"exp": exp})
+
+        assert len(cache) == 2
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_does_not_keep_raw_tokens(self):
+        from django_tasks_cloud_tasks.auth import VerifiedTokenCache
+
+        cache = VerifiedTokenCache()
+        cache.set("secret-token", {"exp": time.time() + 3600})
+
+        assert "secret-token" not in cache._entries
+
+
+class TestCreateOidcAuthHandler:
+    def test_accepts_valid_token_using_cached_certs(self):
+        from django_tasks_cloud_tasks.auth import create_oidc_auth_handler
+
+        signer, certs = make_signing_key()
+        cache, session = make_cache(make_response(certs))
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            HTTP_AUTHORIZATION=f"Bearer {make_token(signer)}",
+        )
+
+        with patch("django_tasks_cloud_tasks.auth._cert_cache", cache):
+            handler = create_oidc_auth_handler(AUDIENCE)
+            assert handler(request) == (True, None)
+            assert handler(request) == (True, None)
+
+        assert session.get.call_count == 1
+        assert handler.token_cache.hits == 1
+
+    def test_cached_token_skips_signature_verification(self):
+        from django_tasks_cloud_tasks.auth import create_oidc_auth_handler
+
+        signer, certs = make_signing_key()
+        cache, _ = make_cache(make_response(certs))
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            HTTP_AUTHORIZATION=f"Bearer {make_token(signer)}",
+        )
+
+        with patch("django_tasks_cloud_tasks.auth._cert_cache", cache):
+            handler = create_oidc_auth_handler(AUDIENCE)
+            handler(request)
+            with patch("google.auth.jwt.decode") as mock_decode:
+                assert handler(request) == (True, None)
+
+        mock_decode.assert_not_called()
+
+    def test_rejects_wrong_audience(self):
+        from django_tasks_cloud_tasks.auth import create_oidc_auth_handler
+
+        signer, certs = make_signing_key()
+        cache, _ = make_cache(make_response(certs))
+        token = make_token(signer, aud="https://other.example.com")
+        request = RequestFactory().post(
+            "/cloudtasks/execute/", HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+        with patch("django_tasks_cloud_tasks.auth._cert_cache", cache):
+            is_valid, error_message = create_oidc_auth_handler(AUDIENCE)(request)
+
+        assert is_valid is False
+        assert "audience" in error_message.lower()
+
+    def test_rejects_missing_authorization_header(self):
+        from django_tasks_cloud_tasks.auth import create_oidc_auth_handler
+
+        request = RequestFactory().post("/cloudtasks/execute/")
+
+        is_valid, error_message = create_oidc_auth_handler(AUDIENCE)(request)
+
+        assert is_valid is False
+        assert error_message == "Missing or invalid Authorization header"
+
+
+class TestGetOidcAuthHandler:
+    def test_memoizes_handler_per_audience(self):
+        from django_tasks_cloud_tasks.auth import get_oidc_auth_handler
+
+        handler = get_oidc_auth_handler("https://memo.example.com")
+
+        assert get_oidc_auth_handler("https://memo.example.com") is handler
+        assert get_oidc_auth_handler("https://other.example.com") is not handler
+
+
+class TestVerifyJwksToken:
+    def setup_method(self):
+        from django_tasks_cloud_tasks.auth import GoogleJWKSCache
+
+        self.signer, _, jwks = make_key_material()
+        self.keys = GoogleJWKSCache().parse(jwks)
+
+    def verify(self, token, **kwargs):
+        from django_tasks_cloud_tasks.auth import verify_jwks_token
+
+        return verify_jwks_token(token, self.keys, AUDIENCE, **kwargs)
+
+    def test_returns_claims_of_valid_token(self):
+        claims = self.verify(make_token(self.signer))
+
+        assert claims["aud"] == AUDIENCE
+
+    def test_rejects_tampered_signature(self):
+        token = make_token(self.signer)
+        header, payload, signature = token.split(".")
+        other = make_token(self.signer, email="attacker@example.com").split(".")[1]
+
+        with pytest.raises(ValueError, match="signature"):
+            self.verify(f"{header}.{other}.{signature}")
+
+    def test_rejects_unknown_key_id(self):
+        signer, _, _ = make_key_material(key_id="other-key")
+
+        with pytest.raises(ValueError, match="other-key"):
+            self.verify(make_token(signer))
+
+    @pytest.mark.parametrize(
+        "claims,message",
+        [
+            ({"iss": "https://evil.example.com"}, "issuer"),
+            ({"aud": "https://other.example.com"}, "audience"),
+            ({"exp": int(time.time()) - 3600}, "expired"),
+        ],
+    )
+    def test_rejects_invalid_claims(self, claims, message):
+        with pytest.raises(ValueError, match=message):
+            self.verify(make_token(self.signer, **claims))
+
+    def test_checks_service_account_allowlist(self):
+        token = make_token(self.signer)
+
+        self.verify(
+            token,
+            allowed_service_accounts={"invoker@test-project.iam.gserviceaccount.com"},
+        )
+        with pytest.raises(ValueError, match="not allowed"):
+            self.verify(token, allowed_service_accounts={"other@example.com"})
+
+    def test_rejects_malformed_token(self):
+        with pytest.raises(ValueError, match="Malformed"):
+            self.verify("not-a-jwt")
+
+
+class TestCreateJwksAuthHandler:
+    def test_accepts_valid_token_and_caches_it(self):
+        from django_tasks_cloud_tasks.auth import (
+            GoogleJWKSCache,
+            create_jwks_auth_handler,
+        )
+
+        signer, _, jwks = make_key_material()
+        cache, session = make_cache(make_response(jwks), cache_class=GoogleJWKSCache)
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            HTTP_AUTHORIZATION=f"Bearer {make_token(signer)}",
+        )
+
+        with patch("django_tasks_cloud_tasks.auth._jwks_cache", cache):
+            handler = create_jwks_auth_handler(AUDIENCE)
+            assert handler(request) == (True, None)
+            assert handler(request) == (True, None)
+
+        assert session.get.call_count == 1
+        assert handler.token_cache.hits == 1
+
+
+class TestGetConfiguredAuthHandler:
+    def test_defaults_to_google_auth_handler(self):
+        from django_tasks_cloud_tasks.auth import (
+            get_configured_auth_handler,
+            get_oidc_auth_handler,
+        )
+
+        handler = get_configured_auth_handler(AUDIENCE)
+
+        assert handler is get_oidc_auth_handler(AUDIENCE)
+
+    def test_selects_jwks_handler(self):
+        from django.test import override_settings
+
+        from django_tasks_cloud_tasks.auth import (
+            get_configured_auth_handler,
+            get_jwks_auth_handler,
+        )
+
+        with override_settings(
+            CLOUD_TASKS_OIDC_VERIFIER="jwks",
+            CLOUD_TASKS_OIDC_ALLOWED_SERVICE_ACCOUNTS=["a@example.com"],
+        ):
+            handler = get_configured_auth_handler(AUDIENCE)
+
+        assert handler is get_jwks_auth_handler(AUDIENCE, ("a@example.com",))
+
+
+@pytest.mark.benchmark
+class TestVerifierBenchmark:
+    """
+    Compare the google-auth and JWKS verifiers (run with -m benchmark).
+
+    Both fetch keys from a local server over a real pooled session, with the
+    verified token cache disabled so every call checks the signature.
+    Timings are reported as test properties, not asserted.
+    """
+
+    iterations = 200
+
+    @pytest.fixture
+    def key_server(self):
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        signer, certs, jwks = make_key_material()
+        documents = {"/certs": certs, "/jwks": jwks}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(documents[self.path]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", "public, max-age=3600")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield signer, f"http://127.0.0.1:{server.server_port}"
+        server.shutdown()
+        server.server_close()
+
+    def run(self, handler, request):
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            assert handler(request) == (True, None)
+        return (time.perf_counter() - started) / self.iterations
+
+    def test_compare_verifiers(self, key_server, record_property):
+        from django_tasks_cloud_tasks.auth import (
+            GoogleCertCache,
+            GoogleJWKSCache,
+            create_jwks_auth_handler,
+            create_oidc_auth_handler,
+        )
+
+        signer, base_url = key_server
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            HTTP_AUTHORIZATION=f"Bearer {make_token(signer)}",
+        )
+
+        with patch(
+            "django_tasks_cloud_tasks.auth._cert_cache",
+            GoogleCertCache(url=f"{base_url}/certs"),
+        ):
+            google_auth = self.run(
+                create_oidc_auth_handler(AUDIENCE, token_cache_size=0), request
+            )
+        with patch(
+            "django_tasks_cloud_tasks.auth._jwks_cache",
+            GoogleJWKSCache(url=f"{base_url}/jwks"),
+        ):
+            jwks = self.run(
+                create_jwks_auth_handler(AUDIENCE, token_cache_size=0), request
+            )
+
+        record_property("google_auth_us_per_verify", round(google_auth * 1e6, 1))
+        record_property("jwks_us_per_verify", round(jwks * 1e6, 1))
+
+
+class TestRequireCryptography:
+    def test_jwks_handler_without_cryptography(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from django_tasks_cloud_tasks.auth import create_jwks_auth_handler
+
+        with patch.dict("sys.modules", {"cryptography": None}):
+            with pytest.raises(ImproperlyConfigured, match=r"\[jwks\]"):
+                create_jwks_auth_handler(AUDIENCE)
+
+
+class TestHmacAuthHandler:
+    def make_request(self, body, signature=None):
+        from django_tasks_cloud_tasks.auth import HMAC_SIGNATURE_HEADER
+
+        headers = {HMAC_SIGNATURE_HEADER: signature} if signature else {}
+        return RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=body,
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_accepts_valid_signature(self):
+        from django_tasks_cloud_tasks.auth import create_hmac_auth_handler, sign_payload
+
+        body = b'{"task_id": "abc"}'
+        request = self.make_request(body, sign_payload(body, "k1", "secret"))
+
+        assert create_hmac_auth_handler({"k1": "secret"})(request) == (True, None)
+
+    def test_accepts_any_active_key_for_rotation(self):
+        from django_tasks_cloud_tasks.auth import create_hmac_auth_handler, sign_payload
+
+        body = b"{}"
+        handler = create_hmac_auth_handler({"new": "secret-2", "old": "secret-1"})
+        old_request = self.make_request(body, sign_payload(body, "old", "secret-1"))
+        new_request = self.make_request(body, sign_payload(body, "new", "secret-2"))
+
+        assert handler(old_request) == (True, None)
+        assert handler(new_request) == (True, None)
+
+    def test_rejects_tampered_body(self):
+        from django_tasks_cloud_tasks.auth import create_hmac_auth_handler, sign_payload
+
+        signature = sign_payload(b'{"args": [1]}', "k1", "secret")
+        request = self.make_request(b'{"args": [2]}', signature)
+
+        assert create_hmac_auth_handler({"k1": "secret"})(request) == (
+            False,
+            "Invalid signature",
+        )
+
+    @pytest.mark.parametrize(
+        "offset,message",
+        [(-7200, "expired"), (600, "future")],
+    )
+    def test_rejects_timestamp_outside_window(self, offset, message):
+        from django_tasks_cloud_tasks.auth import create_hmac_auth_handler, sign_payload
+
+        body = b"{}"
+        signature = sign_payload(body, "k1", "secret", timestamp=time.time() + offset)
+
+        is_valid, error_message = create_hmac_auth_handler(
+            {"k1": "secret"}, max_age=3600
+        )(self.make_request(body, signature))
+
+        assert is_valid is False
+        assert message in error_message
+
+    def test_rejects_unknown_key_and_missing_header(self):
+        from django_tasks_cloud_tasks.auth import create_hmac_auth_handler, sign_payload
+
+        handler = create_hmac_auth_handler({"k1": "secret"})
+        body = b"{}"
+
+        assert handler(self.make_request(body, sign_payload(body, "k2", "secret"))) == (
+            False,
+            "Unknown signing key: k2",
+        )
+        assert handler(self.make_request(body))[0] is False
+
+
+class TestAppEngineAuthHandler:
+    def make_request(self, headers):
+        return RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=b"{}",
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_accepts_app_engine_queue_header(self):
+        from django_tasks_cloud_tasks.auth import create_app_engine_auth_handler
+
+        handler = create_app_engine_auth_handler()
+
+        assert handler(self.make_request({"X-AppEngine-QueueName": "default"})) == (
+            True,
+            None,
+        )
+        assert handler(self.make_request({})) == (
+            False,
+            "Missing X-AppEngine-QueueName header",
+        )
+
+    def test_defers_to_fallback_without_header(self):
+        from django_tasks_cloud_tasks.auth import create_app_engine_auth_handler
+
+        fallback = MagicMock(return_value=(False, "Invalid token"))
+        handler = create_app_engine_auth_handler(fallback)
+
+        assert handler(self.make_request({})) == (False, "Invalid token")
+        assert handler(self.make_request({"X-AppEngine-QueueName": "default"})) == (
+            True,
+            None,
+        )
+        fallback.assert_called_once()
+
+    def test_default_handler_on_app_engine(self):
+        from django.test import override_settings
+
+        from django_tasks_cloud_tasks.handler import get_default_auth_handler
+
+        request = self.make_request({"X-AppEngine-QueueName": "default"})
+        with patch.dict("os.environ", {"GAE_APPLICATION": "s~my-project"}):
+            with override_settings(CLOUD_TASKS_HMAC_KEYS={"k1": "secret"}):
+                assert get_default_auth_handler()(request) == (True, None)
+            with override_settings(CLOUD_TASKS_APP_ENGINE_AUTH=False):
+                assert get_default_auth_handler() is None
@@ -0,0 +1,246 @@
+"""Tests for autotune.py and the cloudtasks_autotune command"""
+
+import json
+from io import StringIO
+from unittest.mock import MagicMock
+
+import pytest
+from django.core.management import call_command
+from google.cloud import tasks_v2
+
+from django_tasks_cloud_tasks import metrics
+from django_tasks_cloud_tasks.autotune import (
+    AutoTuner,
+    QueueWindow,
+    SimulatedService,
+    collect_queue_windows,
+    decide,
+    get_policy,
+    parse_metrics_text,
+    simulate,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def make_window(dispatches=100, errors=0, rejections=0, duration=0.1):
+    window = QueueWindow(dispatches=dispatches, errors=errors, rejections=rejections)
+    for i, bound in enumerate(metrics.TASK_DURATION.buckets):
+        if duration <= bound:
+            window.duration_buckets[i] = dispatches
+            break
+    return window
+
+
+def record_dispatches(count, code="200", duration=0.1, queue="default"):
+    for _ in range(count):
+        metrics.DISPATCH_RESPONSES.inc(queue, code)
+        metrics.TASK_DURATION.observe(duration, "tests.tasks.simple_task", queue)
+
+
+def make_client(rate=10.0, concurrency=10):
+    client = MagicMock()
+    client.queue_path.return_value = "projects/p/locations/l/queues/default"
+    client.get_queue.return_value = tasks_v2.Queue(
+        rate_limits={
+            "max_dispatches_per_second": rate,
+            "max_concurrent_dispatches": concurrency,
+        }
+    )
+    return client
+
+
+class TestDecide:
+    def test_increases_additively_when_healthy(self):
+        decision = decide("default", get_policy(), 10.0, 10, make_window())
+
+        assert decision.action == "increase"
+        assert decision.target == (15.0, 15)
+
+    def test_decreases_multiplicatively_on_slow_p95(self):
+        decision = decide(
+            "default",
+            get_policy({"TARGET_P95": 1.0}),
+            40.0,
+            20,
+            make_window(duration=3),
+        )
+
+        assert decision.action == "decrease"
+        assert decision.target == (20.0, 10)
+        assert "p95" in decision.reason
+
+    def test_decreases_on_errors_and_rejections(self):
+        errors = decide("q", get_policy(), 40.0, 20, make_window(errors=10))
+        rejections = decide("q", get_policy(), 40.0, 20, make_window(rejections=5))
+
+        assert errors.action == "decrease"
+        assert rejections.action == "decrease"
+
+    def test_respects_floors_and_ceilings(self):
+        policy = get_policy(
+            {"MIN_DISPATCHES_PER_SECOND": 5, "MAX_DISPATCHES_PER_SECOND": 12}
+        )
+
+        assert decide("q", policy, 10.0, 10, make_window()).target[0] == 12
+        assert decide("q", policy, 6.0, 10, make_window(errors=50)).target[0] == 5
+        held = decide("q", policy, 12.0, 1000, make_window())
+        assert held.action == "hold"
+        assert not held.changed
+
+    def test_holds_with_few_samples(self):
+        decision = decide("q", get_policy(), 10.0, 10, make_window(dispatches=5))
+
+        assert decision.action == "hold"
+        assert not decision.changed
+
+    def test_rejects_unknown_policy_keys(self):
+        with pytest.raises(ValueError, match="TARGET_P99"):
+            get_policy({"TARGET_P99": 1})
+
+
+class TestMetricsSources:
+    def test_parses_rendered_metrics(self):
+        record_dispatches(3)
+        record_dispatches(1, code="500", duration=2)
+        metrics.DISPATCH_REJECTIONS.inc("tests.tasks.simple_task", "default")
+
+        snapshot = parse_metrics_text(metrics.registry.render())
+        windows = collect_queue_windows([snapshot])
+
+        assert windows == collect_queue_windows([metrics.registry.snapshot()])
+        window = windows["default"]
+        assert window.dispatches == 4
+        assert window.errors == 1
+        assert window.rejections == 1
+        assert window.p95 == 2.5
+
+    def test_window_since_previous_sample(self):
+        previous = make_window(dispatches=100)
+        current = make_window(dispatches=150, errors=5)
+
+        window = current.since(previous)
+
+        assert window.dispatches == 50
+        assert window.errors == 5
+        # Reset counters: the whole sample is the window
+        assert previous.since(current) is previous
+
+
+class TestAutoTuner:
+    def test_first_step_records_sample(self):
+        record_dispatches(50)
+        client = make_client()
+        tuner = AutoTuner("p", "l", {"default": {}}, client=client)
+
+        (decision,) = tuner.step()
+
+        assert decision.action == "hold"
+        client.update_queue.assert_not_called()
+
+    def test_applies_decisions(self):
+        client = make_client(rate=40.0, concurrency=20)
+        tuner = AutoTuner("p", "l", {"default": {"TARGET_P95": 1.0}}, client=client)
+        tuner.step()
+        record_dispatches(50, duration=3)
+
+        (decision,) = tuner.step()
+
+        assert decision.action == "decrease"
+        assert decision.applied
+        queue = client.update_queue.call_args.kwargs["queue"]
+        assert queue.rate_limits.max_dispatches_per_second == 20.0
+        assert queue.rate_limits.max_concurrent_dispatches == 10
+
+    def test_applies_decisions_in_every_location(self):
+        client = make_client(rate=40.0, concurrency=20)
+        client.queue_path.side_effect = lambda project, location, queue_name: (
+            f"projects/{project}/locations/{location}/queues/{queue_name}"
+        )
+        tuner = AutoTuner(
+            "p",
+            ["primary", "secondary"],
+            {"default": {"TARGET_P95": 1.0}},
+            client=client,
+        )
+        tuner.step()
+        record_dispatches(50, duration=3)
+
+        (decision,) = tuner.step()
+
+        assert decision.applied
+        assert [
+            call.kwargs["queue"].name for call in client.update_queue.call_args_list
+        ] == [
+            "projects/p/locations/primary/queues/default",
+            "projects/p/locations/secondary/queues/default",
+        ]
+
+    def test_from_backend_uses_all_locations(self):
+        from django.test import override_settings
+
+        tasks = {
+            "default": {
+                "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+                "QUEUES": ["default"],
+                "OPTIONS": {
+                    "CLOUD_TASKS_PROJECT": "test-project",
+                    "CLOUD_TASKS_LOCATIONS": ["us-central1", "us-east1"],
+                    "TASK_HANDLER_HOST": "https://test.example.com",
+                    "AUTOTUNE": {"QUEUES": {"default": {}}},
+                },
+            },
+        }
+        with override_settings(TASKS=tasks):
+            from django.tasks import task_backends
+
+            tuner = AutoTuner.from_backend(task_backends["default"])
+
+        assert tuner.locations == ("us-central1", "us-east1")
+
+    def test_dry_run_does_not_apply(self):
+        client = make_client()
+        tuner = AutoTuner("p", "l", {"default": {}}, client=client)
+        tuner.step()
+        record_dispatches(50)
+
+        (decision,) = tuner.step(dry_run=True)
+
+        assert decision.action == "increase"
+        assert not decision.applied
+        client.update_queue.assert_not_called()
+
+
+class TestSimulation:
+    def test_converges_below_capacity(self):
+        history = simulate(
+            SimulatedService(capacity=100),
+            {"TARGET_P95": 1.0, "INCREASE_DISPATCHES_PER_SECOND": 10},
+            steps=40,
+        )
+
+        assert {"increase", "decrease"} <= {row["action"] for row in history}
+        assert max(row["rate"] for row in history) <= 100
+        assert history[-1]["rate"] >= 40
+
+    def test_command_runs_simulation(self):
+        out = StringIO()
+
+        call_command(
+            "cloudtasks_autotune",
+            "--simulate",
+            "--capacity",
+            "50",
+            "--steps",
+            "5",
+            "--json",
+            stdout=out,
+        )
+
+        history = json.loads(out.getvalue())
+        assert [row["step"] for row in history] == [1, 2, 3, 4, 5]
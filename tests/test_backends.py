@@ -163,3 +163,116 @@ class TestCloudTasksBackendEnqueue:
         assert result.args == ["hello"]
         assert result.kwargs == {"count": 3}
         mock_client.create_task.assert_called_once()
+
+    @override_settings(
+        TASKS={
+            "default": {
+                "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+                "QUEUES": ["default"],
+                "OPTIONS": {
+                    "CLOUD_TASKS_PROJECT": "test-project",
+                    "CLOUD_TASKS_LOCATION": "us-central1",
+                    "TASK_HANDLER_HOST": "https://test.example.com",
+                    "HMAC_SIGNING_KEY_ID": "2024-06",
+                    "HMAC_SIGNING_KEY": "secret",
+                },
+            },
+        }
+    )
+    @patch("google.cloud.tasks_v2.CloudTasksClient")
+    def test_enqueue_task_signs_payload(self, mock_client_class):
+        from django.test import RequestFactory
+
+        from django_tasks_cloud_tasks.auth import (
+            HMAC_SIGNATURE_HEADER,
+            create_hmac_auth_handler,
+        )
+        from tests.tasks import add_numbers
+
+        mock_client = MagicMock()
+        mock_client_class.return_value = mock_client
+
+        add_numbers.enqueue(1, 2)
+
+        http_request = mock_client.create_task.call_args.kwargs["task"]["http_request"]
+        signature = http_request["headers"][HMAC_SIGNATURE_HEADER]
+        assert "kid=2024-06" in signature
+
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=http_request["body"],
+            content_type="application/json",
+            headers={HMAC_SIGNATURE_HEADER: signature},
+        )
+        assert create_hmac_auth_handler({"2024-06": "secret"})(request) == (
+            True,
+            None,
+        )
+
+    @override_settings(
+        TASKS={
+            "default": {
+                "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+                "QUEUES": ["default"],
+                "OPTIONS": {
+                    "CLOUD_TASKS_PROJECT": "test-project",
+                    "CLOUD_TASKS_LOCATION": "us-central1",
+                    "TASK_HANDLER_HOST": "https://test.example.com",
+                    "QUEUE_DEFINITIONS": {"default": {"dispatch_deadline": 600}},
+                },
+            },
+        }
+    )
+    @patch("google.cloud.tasks_v2.CloudTasksClient")
+    def test_enqueue_task_sets_dispatch_deadline(self, mock_client_class):
+        from tests.tasks import add_numbers
+
+        mock_client = MagicMock()
+        mock_client_class.return_value = mock_client
+
+        add_numbers.enqueue(1, 2)
+
+        task_request = mock_client.create_task.call_args.kwargs["task"]
+        assert task_request["dispatch_deadline"].seconds == 600
+
+    @override_settings(
+        TASKS={
+            "default": {
+                "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+                "QUEUES": ["default"],
+                "OPTIONS": {
+                    "CLOUD_TASKS_PROJECT": "test-project",
+                    "CLOUD_TASKS_LOCATION": "us-central1",
+                },
+            },
+        }
+    )
+    @patch.dict(
+        "os.environ",
+        {
+            "GAE_APPLICATION": "s~test-project",
+            "GAE_SERVICE": "worker",
+            "GAE_VERSION": "v2",
+        },
+    )
+    @patch("google.cloud.tasks_v2.CloudTasksClient")
+    def test_enqueue_task_uses_app_engine_target(self, mock_client_class):
+        from tests.tasks import add_numbers
+
+        mock_client = MagicMock()
+        mock_client_class.return_value = mock_client
+
+        with patch(
+            "django_tasks_cloud_tasks.detection.detect_default_service_account",
+            return_value="app@test-project.iam.gserviceaccount.com",
+        ):
+            add_numbers.enqueue(1, 2)
+
+        task_request = mock_client.create_task.call_args.kwargs["task"]
+        assert "http_request" not in task_request
+        app_engine_request = task_request["app_engine_http_request"]
+        assert app_engine_request["relative_uri"] == "/cloudtasks/execute/"
+        assert app_engine_request["app_engine_routing"] == {
+            "service": "worker",
+            "version": "v2",
+        }
@@ -0,0 +1,120 @@
+"""Tests for cloud_logging.py"""
+
+import json
+import logging
+import sys
+from unittest.mock import patch
+
+import pytest
+from django.test import override_settings
+
+from django_tasks_cloud_tasks import tracing
+from django_tasks_cloud_tasks.cloud_logging import (
+    CloudLoggingFormatter,
+    get_success_log_sample_rate,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+
+
+def make_payload(task_path, args):
+    return {
+        "task_id": "logged-task-id",
+        "task_path": task_path,
+        "args": args,
+        "kwargs": {},
+        "queue_name": "default",
+        "backend": "default",
+    }
+
+
+def execute(task, *args):
+    from django_tasks_cloud_tasks.executor import execute_task_from_payload
+
+    return execute_task_from_payload(make_payload(task.module_path, args), "worker")
+
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    return logging.getLogger("test").makeRecord(
+        "test", level, __file__, 1, msg, args, None, extra=extra
+    )
+
+
+class TestCloudLoggingFormatter:
+    def test_formats_structured_entry(self):
+        formatter = CloudLoggingFormatter(project_id="my-project")
+        record = make_record(
+            "Task done: %s",
+            "abc",
+            level=logging.WARNING,
+            task_id="abc",
+            task_path="myapp.tasks.run",
+            queue="default",
+            duration=0.25,
+        )
+
+        with patch("django_tasks_cloud_tasks.tracing._get_otel", return_value=None):
+            with tracing.continue_trace({"traceparent": f"00-{TRACE_ID}-{SPAN_ID}-01"}):
+                entry = json.loads(formatter.format(record))
+
+        assert entry["severity"] == "WARNING"
+        assert entry["message"] == "Task done: abc"
+        assert entry["logging.googleapis.com/labels"] == {
+            "task_id": "abc",
+            "task_path": "myapp.tasks.run",
+            "queue": "default",
+            "duration": "0.25",
+        }
+        assert entry["logging.googleapis.com/trace"] == (
+            f"projects/my-project/traces/{TRACE_ID}"
+        )
+        assert entry["logging.googleapis.com/spanId"] == SPAN_ID
+        assert entry["logging.googleapis.com/trace_sampled"] is True
+
+    def test_appends_traceback_to_message(self):
+        formatter = CloudLoggingFormatter(project_id="my-project")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.getLogger("test").makeRecord(
+                "test",
+                logging.ERROR,
+                __file__,
+                1,
+                "Task failed",
+                (),
+                sys.exc_info(),
+            )
+
+        entry = json.loads(formatter.format(record))
+
+        assert entry["message"].startswith("Task failed\nTraceback")
+        assert "ValueError: boom" in entry["message"]
+        assert "logging.googleapis.com/trace" not in entry
+
+
+class TestSuccessLogSampling:
+    @override_settings(
+        CLOUD_TASKS_SUCCESS_LOG_SAMPLE_RATE={"*": 0.1, "myapp.tasks.rare": 1.0}
+    )
+    def test_rate_per_task_path(self):
+        assert get_success_log_sample_rate("myapp.tasks.rare") == 1.0
+        assert get_success_log_sample_rate("myapp.tasks.other") == 0.1
+
+    def test_defaults_to_logging_every_success(self):
+        assert get_success_log_sample_rate("myapp.tasks.other") == 1.0
+
+    @pytest.mark.django_db
+    @override_settings(CLOUD_TASKS_SUCCESS_LOG_SAMPLE_RATE=0)
+    def test_success_not_logged_but_failure_is(self, caplog):
+        from tests.tasks import add_numbers, failing_task
+
+        with caplog.at_level(logging.INFO, logger="django_tasks_cloud_tasks"):
+            execute(add_numbers, 1, 2)
+            execute(failing_task)
+
+        messages = [r for r in caplog.records if r.name == "django_tasks_cloud_tasks"]
+        assert [r.levelname for r in messages] == ["ERROR"]
+        assert messages[0].task_path == failing_task.module_path
+        assert messages[0].duration >= 0
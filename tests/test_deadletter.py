@@ -0,0 +1,196 @@
+"""Tests for deadletter.py and the cloudtasks_replay command"""
+
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.tasks import task_backends
+from django.test import override_settings
+
+from django_tasks_cloud_tasks.deadletter import (
+    BaseDeadLetterStore,
+    DatabaseDeadLetterStore,
+    FileDeadLetterStore,
+    get_final_attempt,
+)
+
+LOCAL_TASKS = {
+    "default": {
+        "BACKEND": "django_tasks_cloud_tasks.CloudTasksLocalBackend",
+        "QUEUES": [],
+        "OPTIONS": {"MAX_ATTEMPTS": 3},
+    },
+}
+
+
+@pytest.fixture
+def backend():
+    with override_settings(TASKS=LOCAL_TASKS):
+        backend = task_backends["default"]
+        backend.reset()
+        yield backend
+        backend.reset()
+
+
+@pytest.fixture(params=["database", "file"])
+def dead_letter_settings(request, settings, tmp_path):
+    if request.param == "database":
+        settings.CLOUD_TASKS_DEAD_LETTER = {"MAX_ATTEMPTS": {"*": 3}}
+    else:
+        settings.CLOUD_TASKS_DEAD_LETTER = {
+            "BACKEND": "django_tasks_cloud_tasks.deadletter.FileDeadLetterStore",
+            "OPTIONS": {"DIRECTORY": str(tmp_path)},
+            "MAX_ATTEMPTS": 3,
+        }
+    return settings
+
+
+def get_store():
+    from django_tasks_cloud_tasks.deadletter import get_dead_letter_store
+
+    return get_dead_letter_store()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDeadLettering:
+    def test_stores_task_after_final_attempt(self, backend, dead_letter_settings):
+        from tests.tasks import flaky_task
+
+        result = flaky_task.enqueue(7)
+
+        assert [d.attempt for d in backend.dispatches] == [1, 2, 3]
+        (record,) = get_store().list()
+        assert record.task_id == result.id
+        assert record.task_path == "tests.tasks.flaky_task"
+        assert record.payload["args"] == [7]
+        assert record.attempts == 3
+        assert record.errors[0]["exception"] == "builtins.ValueError"
+        assert "Cannot process 7" in record.errors[0]["traceback"]
+
+    def test_incomplete_store_fails_when_created(self):
+        class AddOnlyStore(BaseDeadLetterStore):
+            def add(self, payload, errors, attempts):
+                pass
+
+        with pytest.raises(TypeError):
+            AddOnlyStore()
+
+    def test_earlier_attempts_are_not_stored(self, settings):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo
+        from django_tasks_cloud_tasks.executor import execute_task_from_payload
+
+        settings.CLOUD_TASKS_DEAD_LETTER = {"MAX_ATTEMPTS": 3}
+        payload = {
+            "task_id": "dl-task",
+            "task_path": "tests.tasks.flaky_task",
+            "args": [1],
+            "kwargs": {},
+            "queue_name": "default",
+            "backend": "default",
+        }
+
+        execute_task_from_payload(
+            payload,
+            "worker",
+            DispatchInfo.from_headers({"X-CloudTasks-TaskRetryCount": "1"}),
+        )
+
+        assert DatabaseDeadLetterStore().list() == []
+
+    def test_final_attempt_from_queue_definitions(self, settings):
+        settings.CLOUD_TASKS_DEAD_LETTER = {}
+        settings.TASKS = {
+            "default": {
+                **LOCAL_TASKS["default"],
+                "OPTIONS": {
+                    "QUEUE_DEFINITIONS": {
+                        "default": {"max_attempts": 5},
+                        "unlimited": {"max_attempts": -1},
+                    }
+                },
+            },
+        }
+
+        assert get_final_attempt({"backend": "default", "queue_name": "default"}) == 5
+        assert (
+            get_final_attempt({"backend": "default", "queue_name": "unlimited"}) is None
+        )
+        assert get_final_attempt({"backend": "default", "queue_name": "other"}) is None
+
+
+@pytest.mark.django_db(transaction=True)
+class TestReplayCommand:
+    def test_replays_with_patched_arguments(self, backend, dead_letter_settings):
+        from tests.tasks import flaky_task
+
+        flaky_task.enqueue(1)
+        flaky_task.enqueue(2)
+        backend.reset()
+        out = StringIO()
+
+        call_command(
+            "cloudtasks_replay", "--set", "succeed=true", "--rate", "100", stdout=out
+        )
+
+        assert "Replayed 2 of 2" in out.getvalue()
+        assert [d.response["status"] for d in backend.dispatches] == [
+            "success",
+            "success",
+        ]
+        store = get_store()
+        assert store.list() == []
+        replayed = store.list(include_replayed=True)
+        assert {r.replay_task_id for r in replayed} == {
+            d.task_id for d in backend.dispatches
+        }
+
+    def test_lists_selection(self, backend, dead_letter_settings):
+        from tests.tasks import flaky_task
+
+        flaky_task.enqueue(1)
+        out = StringIO()
+
+        call_command(
+            "cloudtasks_replay",
+            "--list",
+            "--json",
+            "--task",
+            "tests.tasks.flaky_task",
+            stdout=out,
+        )
+
+        (record,) = json.loads(out.getvalue())
+        assert record["payload"]["args"] == [1]
+
+    def test_failed_replays_stay_in_store(self, backend, dead_letter_settings):
+        from tests.tasks import flaky_task
+
+        flaky_task.enqueue(1)
+
+        with pytest.raises(CommandError):
+            call_command(
+                "cloudtasks_replay", "--to-backend", "missing", stdout=StringIO()
+            )
+
+        assert len(get_store().list()) == 1
+
+    def test_requires_configuration(self):
+        with pytest.raises(CommandError, match="not configured"):
+            call_command("cloudtasks_replay", stdout=StringIO())
+
+
+def test_file_store_filters(tmp_path):
+    store = FileDeadLetterStore({"DIRECTORY": str(tmp_path)})
+    first = store.add({"task_id": "a", "task_path": "x.a", "queue_name": "q1"}, [], 3)
+    store.add({"task_id": "b", "task_path": "x.b", "queue_name": "q2"}, [], 3)
+
+    assert [r.task_id for r in store.list(queue_name="q2")] == ["b"]
+    assert [r.task_id for r in store.list(ids=[first.id])] == ["a"]
+    assert [r.task_id for r in store.list(limit=1)] == ["a"]
+
+    store.mark_replayed(first.id, "new-id")
+    assert [r.task_id for r in store.list()] == ["b"]
+    assert store.list(ids=[first.id], include_replayed=True)[0].replay_task_id == (
+        "new-id"
+    )
@@ -0,0 +1,158 @@
+"""Tests for debounce.py and collapsed enqueues"""
+
+from datetime import UTC, datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from django.tasks import task_backends
+from django.test import override_settings
+from google.api_core import exceptions
+
+from django_tasks_cloud_tasks import metrics
+from django_tasks_cloud_tasks.debounce import created_tasks, debounce
+from tests.tasks import debounced_task, throttled_task
+
+NOW = datetime(2024, 1, 1, 12, 0, 10, tzinfo=UTC)
+WINDOW_END = datetime(2024, 1, 1, 12, 1, 0, tzinfo=UTC)
+
+TASKS = {
+    "default": {
+        "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+        "QUEUES": ["default"],
+        "OPTIONS": {
+            "CLOUD_TASKS_PROJECT": "test-project",
+            "CLOUD_TASKS_LOCATION": "us-central1",
+            "TASK_HANDLER_HOST": "https://test.example.com",
+        },
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    created_tasks.clear()
+    metrics.registry.clear()
+    yield
+    created_tasks.clear()
+    metrics.registry.clear()
+
+
+@pytest.fixture
+def now():
+    with patch("django_tasks_cloud_tasks.backends.timezone.now", return_value=NOW):
+        yield NOW
+
+
+class TestCollapsePolicy:
+    def test_name_is_stable_within_window(self):
+        policy = debounced_task.func.cloudtasks_collapse
+
+        name, window_end = policy.task_name(debounced_task, [1], {}, NOW)
+        later, _ = policy.task_name(
+            debounced_task, [1], {}, NOW + timedelta(seconds=40)
+        )
+        next_window, _ = policy.task_name(
+            debounced_task, [1], {}, NOW + timedelta(seconds=50)
+        )
+        other, _ = policy.task_name(debounced_task, [2], {}, NOW)
+
+        assert later == name
+        assert next_window != name
+        assert other != name
+        assert window_end == WINDOW_END
+
+    def test_custom_key(self):
+        policy = throttled_task.func.cloudtasks_collapse
+
+        first, _ = policy.task_name(throttled_task, [1], {"reason": "a"}, NOW)
+        second, _ = policy.task_name(throttled_task, [1], {"reason": "b"}, NOW)
+
+        assert first == second
+
+    def test_rejects_empty_window(self):
+        with pytest.raises(ValueError, match="positive"):
+            debounce(timedelta())
+
+
+@patch("google.cloud.tasks_v2.CloudTasksClient")
+class TestCollapsedEnqueue:
+    @override_settings(TASKS=TASKS)
+    def test_debounce_schedules_named_task_at_window_end(self, mock_client_class, now):
+        mock_client = mock_client_class.return_value
+
+        result = debounced_task.enqueue(1)
+
+        task_request = mock_client.create_task.call_args.kwargs["task"]
+        assert task_request["name"] == (
+            "projects/test-project/locations/us-central1/queues/default/tasks/"
+            + result.id
+        )
+        assert task_request["schedule_time"].ToDatetime(UTC) == WINDOW_END
+        assert result.task.run_after == WINDOW_END
+
+    @override_settings(TASKS=TASKS)
+    def test_repeat_enqueue_skips_rpc(self, mock_client_class, now):
+        mock_client = mock_client_class.return_value
+
+        results = [throttled_task.enqueue(1, reason=str(i)) for i in range(5)]
+
+        assert mock_client.create_task.call_count == 1
+        assert len({result.id for result in results}) == 1
+        assert "schedule_time" not in mock_client.create_task.call_args.kwargs["task"]
+        assert metrics.ENQUEUED.get("tests.tasks.throttled_task", "default") == 1
+        assert (
+            metrics.ENQUEUE_COLLAPSED.get("tests.tasks.throttled_task", "default") == 4
+        )
+
+    @override_settings(TASKS=TASKS)
+    def test_existing_task_is_not_an_error(self, mock_client_class, now):
+        mock_client = mock_client_class.return_value
+        mock_client.create_task.side_effect = exceptions.AlreadyExists("exists")
+
+        assert (
+            task_backends["default"].create_task(
+                debounced_task, "id", b"{}", {}, name="id"
+            )
+            is False
+        )
+
+        debounced_task.enqueue(1)
+
+        assert (
+            metrics.ENQUEUE_COLLAPSED.get("tests.tasks.debounced_task", "default") == 2
+        )
+        assert metrics.ENQUEUE_ERRORS.get("default", "ALREADY_EXISTS") == 0
+
+    @override_settings(TASKS=TASKS)
+    def test_unnamed_task_raises_already_exists(self, mock_client_class):
+        mock_client = mock_client_class.return_value
+        mock_client.create_task.side_effect = exceptions.AlreadyExists("exists")
+
+        with pytest.raises(exceptions.AlreadyExists):
+            task_backends["default"].create_task(debounced_task, "id", b"{}", {})
+
+
+@pytest.mark.django_db(transaction=True)
+def test_local_backend_runs_debounced_task_once():
+    options = {"MODE": "deferred"}
+    tasks = {
+        "default": {
+            "BACKEND": "django_tasks_cloud_tasks.CloudTasksLocalBackend",
+            "QUEUES": ["default"],
+            "OPTIONS": options,
+        },
+    }
+    with override_settings(TASKS=tasks):
+        backend = task_backends["default"]
+        backend.reset()
+        for _ in range(3):
+            debounced_task.enqueue(1)
+        created_tasks.clear()  # as if enqueued by other processes
+        debounced_task.enqueue(1)
+
+        backend.drain(include_scheduled=True)
+
+        assert [d.task_path for d in backend.dispatches] == [
+            "tests.tasks.debounced_task"
+        ]
+        backend.reset()
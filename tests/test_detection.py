@@ -123,3 +123,60 @@ class TestDetectTaskHandlerHost:
 
         with patch.dict("os.environ", {}, clear=True):
             assert detect_task_handler_host() is None
+
+
+class TestDetectAppEngineRouting:
+    def test_routes_to_own_service_and_version(self):
+        from django_tasks_cloud_tasks.detection import detect_app_engine_routing
+
+        with patch.dict(
+            "os.environ",
+            {"GAE_SERVICE": "default", "GAE_VERSION": "20240101t123456"},
+            clear=True,
+        ):
+            assert detect_app_engine_routing() == {
+                "service": "default",
+                "version": "20240101t123456",
+            }
+
+    def test_empty_outside_app_engine(self):
+        from django_tasks_cloud_tasks.detection import detect_app_engine_routing
+
+        with patch.dict("os.environ", {}, clear=True):
+            assert detect_app_engine_routing() == {}
+
+
+class TestGetMetadata:
+    def test_caches_successful_lookups(self):
+        from django_tasks_cloud_tasks import detection
+
+        class Response:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def read(self):
+                return b"my-project"
+
+        with patch.dict(detection._metadata_cache, clear=True):
+            with patch("urllib.request.urlopen", return_value=Response()) as mock:
+                assert detection._get_metadata("project/project-id") == "my-project"
+                assert detection._get_metadata("project/project-id") == "my-project"
+
+        assert mock.call_count == 1
+
+    def test_does_not_cache_failures(self):
+        import urllib.error
+
+        from django_tasks_cloud_tasks import detection
+
+        with patch.dict(detection._metadata_cache, clear=True):
+            with patch(
+                "urllib.request.urlopen", side_effect=urllib.error.URLError("down")
+            ) as mock:
+                assert detection._get_metadata("project/project-id") is None
+                assert detection._get_metadata("project/project-id") is None
+
+        assert mock.call_count == 2
@@ -0,0 +1,220 @@
+"""Tests for dispatch.py"""
+
+import json
+import time
+from datetime import UTC, datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+DEAD_LETTER = {"BACKEND": "django_tasks_cloud_tasks.deadletter.DatabaseDeadLetterStore"}
+
+
+class TestDispatchInfo:
+    def test_parses_cloud_tasks_headers(self):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo
+
+        now = datetime(2024, 1, 1, 0, 0, 10, tzinfo=UTC)
+        dispatch = DispatchInfo.from_headers(
+            {
+                "X-CloudTasks-QueueName": "default",
+                "X-CloudTasks-TaskName": "123",
+                "X-CloudTasks-TaskRetryCount": "2",
+                "X-CloudTasks-TaskExecutionCount": "1",
+                "X-CloudTasks-TaskETA": str(now.timestamp() - 2.5),
+            },
+            now=now,
+        )
+
+        assert dispatch.queue_name == "default"
+        assert dispatch.retry_count == 2
+        assert dispatch.execution_count == 1
+        assert dispatch.attempt == 3
+        assert dispatch.dispatch_lag == pytest.approx(2.5)
+
+    def test_parses_app_engine_headers(self):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo
+
+        dispatch = DispatchInfo.from_headers(
+            {
+                "X-AppEngine-QueueName": "default",
+                "X-AppEngine-TaskName": "123",
+                "X-AppEngine-TaskRetryCount": "4",
+            }
+        )
+
+        assert dispatch.queue_name == "default"
+        assert dispatch.task_name == "123"
+        assert dispatch.attempt == 5
+
+    def test_defaults_without_headers(self):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo
+
+        dispatch = DispatchInfo.from_headers({"X-CloudTasks-TaskRetryCount": "x"})
+
+        assert dispatch.attempt == 1
+        assert dispatch.dispatch_lag is None
+
+
+class TestGetExpiryReason:
+    def make_payload(self, age):
+        enqueued_at = timezone.now() - timedelta(seconds=age)
+        return {
+            "task_path": "tests.tasks.simple_task",
+            "enqueued_at": enqueued_at.isoformat(),
+        }
+
+    @override_settings(CLOUD_TASKS_TASK_TTL={"tests.tasks.simple_task": 60})
+    def test_expires_deliveries_older_than_ttl(self):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo, get_expiry_reason
+
+        dispatch = DispatchInfo.from_headers({})
+
+        assert get_expiry_reason(self.make_payload(30), dispatch) is None
+        assert "TTL" in get_expiry_reason(self.make_payload(120), dispatch)
+
+    @override_settings(CLOUD_TASKS_TASK_TTL={"*": 60})
+    def test_ttl_counts_from_run_after(self):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo, get_expiry_reason
+
+        payload = self.make_payload(3600)
+        payload["run_after"] = timezone.now().isoformat()
+
+        assert get_expiry_reason(payload, DispatchInfo.from_headers({})) is None
+
+    @override_settings(CLOUD_TASKS_MAX_ATTEMPTS={"*": 3})
+    def test_expires_after_max_attempts(self):
+        from django_tasks_cloud_tasks.dispatch import DispatchInfo, get_expiry_reason
+
+        third = DispatchInfo.from_headers({"X-CloudTasks-TaskRetryCount": "2"})
+        fourth = DispatchInfo.from_headers({"X-CloudTasks-TaskRetryCount": "3"})
+
+        assert get_expiry_reason(self.make_payload(0), third) is None
+        assert "max attempts" in get_expiry_reason(self.make_payload(0), fourth)
+
+
+@pytest.mark.django_db
+class TestDispatchHeadersInView:
+    def make_request(self, task, args, **headers):
+        payload = {
+            "task_id": "dispatch-test-task",
+            "task_path": task.module_path,
+            "args": args,
+            "kwargs": {},
+            "queue_name": "default",
+            "backend": "default",
+            "takes_context": task.takes_context,
+            "enqueued_at": timezone.now().isoformat(),
+        }
+        return RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=json.dumps(payload),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_task_context_attempt_uses_retry_count(self):
+        from django.tasks.signals import task_finished
+
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import task_with_context
+
+        results = []
+
+        def receiver(sender, task_result, **kwargs):
+            results.append(task_result)
+
+        task_finished.connect(receiver)
+        try:
+            response = ExecuteTaskView.as_view()(
+                self.make_request(
+                    task_with_context,
+                    ["hi"],
+                    **{
+                        "X-CloudTasks-TaskRetryCount": "4",
+                        "X-CloudTasks-TaskETA": str(time.time()),
+                    },
+                )
+            )
+        finally:
+            task_finished.disconnect(receiver)
+
+        assert response.status_code == 200
+        assert results[0].attempts == 5
+        assert results[0].worker_ids[:4] == ["", "", "", ""]
+        assert results[0].worker_ids[4]
+
+    def test_dispatch_lag_is_recorded(self):
+        from django_tasks_cloud_tasks import metrics
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        metrics.registry.clear()
+        request = self.make_request(
+            simple_task, [1], **{"X-CloudTasks-TaskETA": str(time.time() - 2)}
+        )
+
+        assert ExecuteTaskView.as_view()(request).status_code == 200
+        assert metrics.DISPATCH_LAG.get_count(simple_task.module_path, "default") == 1
+        assert metrics.DISPATCH_LAG.get_sum(simple_task.module_path, "default") >= 2
+        metrics.registry.clear()
+
+    @override_settings(CLOUD_TASKS_MAX_ATTEMPTS={"*": 2})
+    def test_stale_delivery_is_acknowledged_without_running(self):
+        from unittest.mock import patch
+
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        request = self.make_request(
+            simple_task, [1], **{"X-CloudTasks-TaskRetryCount": "5"}
+        )
+        with patch(
+            "django_tasks_cloud_tasks.handler.execute_task_from_payload"
+        ) as mock_execute:
+            response = ExecuteTaskView.as_view()(request)
+
+        assert response.status_code == 200
+        assert json.loads(response.content)["status"] == "expired"
+        mock_execute.assert_not_called()
+
+    @override_settings(
+        CLOUD_TASKS_MAX_ATTEMPTS={"*": 2}, CLOUD_TASKS_DEAD_LETTER=DEAD_LETTER
+    )
+    def test_max_attempts_expiry_is_dead_lettered(self):
+        from django_tasks_cloud_tasks.deadletter import (
+            EXPIRED_EXCEPTION,
+            DatabaseDeadLetterStore,
+        )
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        request = self.make_request(
+            simple_task, [1], **{"X-CloudTasks-TaskRetryCount": "2"}
+        )
+
+        assert ExecuteTaskView.as_view()(request).status_code == 200
+        (record,) = DatabaseDeadLetterStore().list()
+        assert record.task_id == "dispatch-test-task"
+        assert record.attempts == 3
+        assert record.errors[0]["exception"] == EXPIRED_EXCEPTION
+
+    @override_settings(
+        CLOUD_TASKS_TASK_TTL={"*": 60}, CLOUD_TASKS_DEAD_LETTER=DEAD_LETTER
+    )
+    def test_ttl_expiry_is_not_dead_lettered(self):
+        from django_tasks_cloud_tasks.deadletter import DatabaseDeadLetterStore
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        request = self.make_request(simple_task, [1])
+        with patch(
+            "django_tasks_cloud_tasks.dispatch.timezone.now",
+            return_value=timezone.now() + timedelta(seconds=120),
+        ):
+            response = ExecuteTaskView.as_view()(request)
+
+        assert json.loads(response.content)["status"] == "expired"
+        assert DatabaseDeadLetterStore().list() == []
@@ -0,0 +1,203 @@
+"""Tests for endpoint.py"""
+
+import asyncio
+import io
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from django.test import override_settings
+
+
+def make_payload(task, args, task_id="endpoint-test-task"):
+    return json.dumps(
+        {
+            "task_id": task_id,
+            "task_path": task.module_path,
+            "args": args,
+            "kwargs": {},
+            "queue_name": "default",
+            "backend": "default",
+            "priority": 0,
+            "takes_context": False,
+            "enqueued_at": "2024-01-01T00:00:00+00:00",
+        }
+    ).encode()
+
+
+def make_environ(path, body=b"", method="POST", **extra):
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "SCRIPT_NAME": "",
+        "QUERY_STRING": "",
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.url_scheme": "http",
+        "wsgi.version": (1, 0),
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    environ.update(extra)
+    return environ
+
+
+def call_wsgi(app, environ):
+    start_response = MagicMock()
+    body = b"".join(app(environ, start_response))
+    status, headers = start_response.call_args.args
+    return int(status.split()[0]), dict(headers), body
+
+
+# request_finished closes database connections, as in a real request
+@pytest.mark.django_db(transaction=True)
+class TestTaskEndpointWSGI:
+    def test_executes_task_without_django(self):
+        from django_tasks_cloud_tasks.endpoint import TaskEndpointWSGI
+        from tests.tasks import simple_task
+
+        django_app = MagicMock()
+        app = TaskEndpointWSGI(django_app)
+
+        status, headers, body = call_wsgi(
+            app, make_environ("/cloudtasks/execute/", make_payload(simple_task, [4]))
+        )
+
+        assert status == 200
+        assert headers["Content-Type"] == "application/json"
+        assert json.loads(body) == {
+            "status": "success",
+            "task_id": "endpoint-test-task",
+        }
+        django_app.assert_not_called()
+
+    def test_falls_through_for_other_paths(self):
+        from django_tasks_cloud_tasks.endpoint import TaskEndpointWSGI
+
+        django_app = MagicMock(return_value=[b"django"])
+        app = TaskEndpointWSGI(django_app)
+        environ = make_environ("/admin/", method="GET")
+
+        assert app(environ, MagicMock()) == [b"django"]
+        django_app.assert_called_once()
+
+    def test_rejects_non_post(self):
+        from django_tasks_cloud_tasks.endpoint import TaskEndpointWSGI
+
+        app = TaskEndpointWSGI(MagicMock())
+
+        status, headers, _ = call_wsgi(
+            app, make_environ("/cloudtasks/execute/", method="GET")
+        )
+
+        assert status == 405
+        assert headers["Allow"] == "POST"
+
+    def test_uses_auth_handler(self):
+        from django_tasks_cloud_tasks.endpoint import TaskEndpointWSGI
+        from tests.tasks import simple_task
+
+        auth_handler = MagicMock(return_value=(False, "Invalid signature"))
+        app = TaskEndpointWSGI(MagicMock(), auth_handler=auth_handler)
+
+        status, _, body = call_wsgi(
+            app,
+            make_environ(
+                "/cloudtasks/execute/",
+                make_payload(simple_task, [4]),
+                HTTP_AUTHORIZATION="Bearer token",
+            ),
+        )
+
+        assert status == 401
+        assert json.loads(body)["detail"] == "Invalid signature"
+        request = auth_handler.call_args.args[0]
+        assert request.headers["Authorization"] == "Bearer token"
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTaskEndpointASGI:
+    def test_executes_task_without_django(self):
+        from django_tasks_cloud_tasks.endpoint import TaskEndpointASGI
+        from tests.tasks import simple_task
+
+        body = make_payload(simple_task, [21])
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/cloudtasks/execute/",
+            "headers": [(b"content-type", b"application/json")],
+        }
+        messages = [
+            {"type": "http.request", "body": body[:10], "more_body": True},
+            {"type": "http.request", "body": body[10:]},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        django_app = MagicMock()
+        asyncio.run(TaskEndpointASGI(django_app)(scope, receive, send))
+
+        assert sent[0]["status"] == 200
+        assert json.loads(sent[1]["body"])["status"] == "success"
+        django_app.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.benchmark
+class TestEndpointBenchmark:
+    """
+    Per-dispatch overhead of the raw endpoint compared with the view (run
+    with -m benchmark).
+
+    Timings are reported as test properties, not asserted.
+    """
+
+    iterations = 300
+
+    def run(self, app, body):
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            status, _, _ = call_wsgi(app, make_environ("/cloudtasks/execute/", body))
+            assert status == 200
+        return (time.perf_counter() - started) / self.iterations
+
+    @override_settings(
+        ROOT_URLCONF="tests.urls",
+        ALLOWED_HOSTS=["testserver"],
+        MIDDLEWARE=[
+            "django.middleware.security.SecurityMiddleware",
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.middleware.locale.LocaleMiddleware",
+            "django.middleware.common.CommonMiddleware",
+            "django.middleware.csrf.CsrfViewMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django.middleware.clickjacking.XFrameOptionsMiddleware",
+        ],
+    )
+    def test_compare_endpoint_and_view(self, record_property):
+        from django.core.handlers.wsgi import WSGIHandler
+
+        from django_tasks_cloud_tasks.endpoint import TaskEndpointWSGI
+        from tests.tasks import simple_task
+
+        django_app = WSGIHandler()
+        body = make_payload(simple_task, [1])
+
+        view = self.run(django_app, body)
+        raw = self.run(TaskEndpointWSGI(django_app), body)
+
+        record_property("view_us_per_dispatch", round(view * 1e6, 1))
+        record_property("raw_endpoint_us_per_dispatch", round(raw * 1e6, 1))
@@ -0,0 +1,254 @@
+"""Tests for inline.py and inline continuation in the executor"""
+
+import json
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from django.tasks.signals import task_started
+from django.test import override_settings
+from google.api_core.exceptions import ServiceUnavailable
+
+from django_tasks_cloud_tasks import metrics
+from django_tasks_cloud_tasks.executor import execute_task_from_payload
+from django_tasks_cloud_tasks.inline import collect_continuations, run_continuations
+from django_tasks_cloud_tasks.ledger import COMPLETED
+from tests.tasks import inline_step
+
+TASKS = {
+    "default": {
+        "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+        "QUEUES": ["default"],
+        "OPTIONS": {
+            "CLOUD_TASKS_PROJECT": "test-project",
+            "CLOUD_TASKS_LOCATION": "us-central1",
+            "TASK_HANDLER_HOST": "https://test.example.com",
+        },
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+@pytest.fixture
+def mock_client():
+    with patch("google.cloud.tasks_v2.CloudTasksClient") as mock_client_class:
+        yield mock_client_class.return_value
+
+
+def make_payload(task_path, *args):
+    return {
+        "task_id": "parent-task-id",
+        "task_path": task_path,
+        "args": list(args),
+        "kwargs": {},
+        "queue_name": "default",
+        "backend": "default",
+        "enqueued_at": "2024-01-01T00:00:00+00:00",
+    }
+
+
+def sent_payloads(mock_client):
+    return [
+        json.loads(call.kwargs["task"]["http_request"]["body"])
+        for call in mock_client.create_task.call_args_list
+    ]
+
+
+def executions(task_path, status="success"):
+    return metrics.TASK_EXECUTIONS.get(task_path, "default", status)
+
+
+class TestInlineContinuation:
+    @pytest.fixture(autouse=True)
+    def inline_budget(self):
+        with override_settings(TASKS=TASKS, CLOUD_TASKS_INLINE_BUDGET=5):
+            yield
+
+    def test_chain_runs_in_one_dispatch(self, mock_client):
+        _, success = execute_task_from_payload(
+            make_payload("tests.tasks.inline_step", 3), "worker"
+        )
+
+        assert success
+        mock_client.create_task.assert_not_called()
+        assert executions("tests.tasks.inline_step") == 4
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.inline_step", "default", "executed"
+            )
+            == 3
+        )
+
+    @override_settings(CLOUD_TASKS_INLINE_BUDGET=0)
+    def test_enqueued_when_budget_runs_out(self, mock_client):
+        execute_task_from_payload(make_payload("tests.tasks.inline_step", 3), "worker")
+
+        [payload] = sent_payloads(mock_client)
+        assert payload["task_path"] == "tests.tasks.inline_step"
+        assert payload["args"] == [2]
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.inline_step", "default", "budget_exhausted"
+            )
+            == 1
+        )
+
+    def test_children_of_failed_parent_are_enqueued(self, mock_client):
+        _, success = execute_task_from_payload(
+            make_payload("tests.tasks.enqueue_then_fail"), "worker"
+        )
+
+        assert not success
+        [payload] = sent_payloads(mock_client)
+        assert payload["task_path"] == "tests.tasks.inline_step"
+        assert executions("tests.tasks.inline_step") == 0
+
+    def test_failed_continuation_is_enqueued_for_retry(self, mock_client):
+        _, success = execute_task_from_payload(
+            make_payload("tests.tasks.enqueue_failing_inline"), "worker"
+        )
+
+        assert success
+        [payload] = sent_payloads(mock_client)
+        assert payload["task_path"] == "tests.tasks.failing_inline_task"
+        assert executions("tests.tasks.failing_inline_task", "failure") == 1
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.failing_inline_task", "default", "failed"
+            )
+            == 1
+        )
+
+    def test_enqueue_failure_does_not_fail_parent(self, mock_client):
+        mock_client.create_task.side_effect = ServiceUnavailable("down")
+
+        _, success = execute_task_from_payload(
+            make_payload("tests.tasks.enqueue_failing_inline"), "worker"
+        )
+
+        assert success
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.failing_inline_task", "default", "enqueue_failed"
+            )
+            == 1
+        )
+
+    def test_raising_continuation_is_enqueued_and_parent_succeeds(self, mock_client):
+        def receiver(sender, task_result, **kwargs):
+            if task_result.args == [1]:
+                raise RuntimeError("receiver failed")
+
+        task_started.connect(receiver)
+        try:
+            _, success = execute_task_from_payload(
+                make_payload("tests.tasks.inline_step", 3), "worker"
+            )
+        finally:
+            task_started.disconnect(receiver)
+
+        assert success
+        [payload] = sent_payloads(mock_client)
+        assert payload["args"] == [1]
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.inline_step", "default", "failed"
+            )
+            == 1
+        )
+
+    def test_remaining_continuations_are_enqueued_when_interrupted(self, mock_client):
+        with collect_continuations() as continuations:
+            inline_step.enqueue(1)
+            inline_step.enqueue(0)
+
+        with pytest.raises(KeyboardInterrupt):
+            run_continuations(
+                continuations,
+                Mock(side_effect=KeyboardInterrupt),
+                True,
+                time.monotonic() + 5,
+            )
+
+        assert [payload["args"] for payload in sent_payloads(mock_client)] == [[0]]
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.inline_step", "default", "aborted"
+            )
+            == 1
+        )
+
+    @override_settings(
+        CLOUD_TASKS_TASK_CONCURRENCY={"tests.tasks.failing_inline_task": 0}
+    )
+    def test_continuation_over_concurrency_limit_is_enqueued(self, mock_client):
+        execute_task_from_payload(
+            make_payload("tests.tasks.enqueue_failing_inline"), "worker"
+        )
+
+        [payload] = sent_payloads(mock_client)
+        assert payload["task_path"] == "tests.tasks.failing_inline_task"
+        assert executions("tests.tasks.failing_inline_task", "failure") == 0
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.failing_inline_task", "default", "concurrency_limited"
+            )
+            == 1
+        )
+
+    def test_completed_continuation_is_dropped(self, mock_client):
+        with patch(
+            "django_tasks_cloud_tasks.executor.claim_task",
+            return_value=(None, COMPLETED, None),
+        ) as mock_claim:
+            execute_task_from_payload(
+                make_payload("tests.tasks.inline_step", 1), "worker"
+            )
+
+        mock_claim.assert_called_once()
+        mock_client.create_task.assert_not_called()
+        assert executions("tests.tasks.inline_step") == 1
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.inline_step", "default", "duplicate"
+            )
+            == 1
+        )
+
+    def test_expired_continuation_is_dropped(self, mock_client):
+        with patch(
+            "django_tasks_cloud_tasks.executor.get_expiry_reason",
+            return_value="age 120s exceeds TTL 60s",
+        ):
+            execute_task_from_payload(
+                make_payload("tests.tasks.inline_step", 1), "worker"
+            )
+
+        mock_client.create_task.assert_not_called()
+        assert executions("tests.tasks.inline_step") == 1
+        assert (
+            metrics.INLINE_CONTINUATIONS.get(
+                "tests.tasks.inline_step", "default", "expired"
+            )
+            == 1
+        )
+
+    def test_tasks_not_marked_inline_are_enqueued(self, mock_client):
+        execute_task_from_payload(make_payload("tests.tasks.chain_task", 1), "worker")
+
+        [payload] = sent_payloads(mock_client)
+        assert payload["task_path"] == "tests.tasks.simple_task"
+
+
+@override_settings(TASKS=TASKS)
+def test_disabled_without_budget(mock_client):
+    execute_task_from_payload(make_payload("tests.tasks.inline_step", 1), "worker")
+
+    [payload] = sent_payloads(mock_client)
+    assert payload["args"] == [0]
@@ -0,0 +1,207 @@
+"""Tests for ledger.py"""
+
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.test import RequestFactory
+from django.utils import timezone
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = LOCMEM_CACHES
+    from django.core.cache import cache
+
+    cache.clear()
+
+
+@pytest.mark.usefixtures("locmem_cache")
+class TestCacheLedger:
+    def test_claim_complete_and_duplicate(self):
+        from django_tasks_cloud_tasks.ledger import (
+            CLAIMED,
+            COMPLETED,
+            IN_PROGRESS,
+            CacheLedger,
+        )
+
+        ledger = CacheLedger()
+
+        status, token = ledger.claim("cache-task-1")
+        assert status == CLAIMED
+        assert token is not None
+        assert ledger.claim("cache-task-1") == (IN_PROGRESS, None)
+        ledger.complete("cache-task-1")
+        assert ledger.claim("cache-task-1") == (COMPLETED, None)
+
+    def test_release_allows_retry(self):
+        from django_tasks_cloud_tasks.ledger import CLAIMED, CacheLedger
+
+        ledger = CacheLedger()
+        _, token = ledger.claim("cache-task-2")
+        ledger.release("cache-task-2", token)
+
+        assert ledger.claim("cache-task-2")[0] == CLAIMED
+
+    def test_release_keeps_lease_taken_over(self):
+        from django.core.cache import cache
+
+        from django_tasks_cloud_tasks.ledger import IN_PROGRESS, CacheLedger
+
+        ledger = CacheLedger()
+        _, stale_token = ledger.claim("cache-task-3")
+        # The lease expired and another dispatch claimed the task
+        cache.delete(ledger.key_prefix + "cache-task-3")
+        ledger.claim("cache-task-3")
+
+        ledger.release("cache-task-3", stale_token)
+
+        assert ledger.claim("cache-task-3") == (IN_PROGRESS, None)
+
+    def test_base_ledger_is_abstract(self):
+        from django_tasks_cloud_tasks.ledger import BaseLedger
+
+        with pytest.raises(TypeError):
+            BaseLedger()
+
+
+@pytest.mark.django_db
+class TestDatabaseLedger:
+    def test_claim_complete_and_duplicate(self):
+        from django_tasks_cloud_tasks.ledger import (
+            CLAIMED,
+            COMPLETED,
+            IN_PROGRESS,
+            DatabaseLedger,
+        )
+
+        ledger = DatabaseLedger()
+
+        status, token = ledger.claim("db-task-1")
+        assert status == CLAIMED
+        assert token is not None
+        assert ledger.claim("db-task-1") == (IN_PROGRESS, None)
+        ledger.complete("db-task-1")
+        assert ledger.claim("db-task-1") == (COMPLETED, None)
+
+    def test_expired_lease_can_be_taken_over(self):
+        from django_tasks_cloud_tasks.ledger import CLAIMED, DatabaseLedger
+        from django_tasks_cloud_tasks.models import TaskExecution
+
+        ledger = DatabaseLedger()
+        ledger.claim("db-task-2")
+        TaskExecution.objects.filter(task_id="db-task-2").update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        assert ledger.claim("db-task-2")[0] == CLAIMED
+
+    def test_release_keeps_lease_taken_over(self):
+        from django_tasks_cloud_tasks.ledger import IN_PROGRESS, DatabaseLedger
+        from django_tasks_cloud_tasks.models import TaskExecution
+
+        ledger = DatabaseLedger()
+        _, stale_token = ledger.claim("db-task-4")
+        TaskExecution.objects.filter(task_id="db-task-4").update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        ledger.claim("db-task-4")
+
+        ledger.release("db-task-4", stale_token)
+
+        assert ledger.claim("db-task-4") == (IN_PROGRESS, None)
+
+    def test_release_allows_retry(self):
+        from django_tasks_cloud_tasks.ledger import CLAIMED, DatabaseLedger
+
+        ledger = DatabaseLedger()
+        _, token = ledger.claim("db-task-3")
+        ledger.release("db-task-3", token)
+
+        assert ledger.claim("db-task-3")[0] == CLAIMED
+
+    def test_prune_deletes_old_completions(self):
+        from django_tasks_cloud_tasks.ledger import DatabaseLedger
+        from django_tasks_cloud_tasks.models import TaskExecution
+
+        ledger = DatabaseLedger({"COMPLETED_TIMEOUT": 60})
+        ledger.complete("db-task-old")
+        ledger.complete("db-task-new")
+        TaskExecution.objects.filter(task_id="db-task-old").update(
+            completed_at=timezone.now() - timedelta(seconds=120)
+        )
+
+        assert ledger.prune() == 1
+        assert TaskExecution.objects.filter(task_id="db-task-new").exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("locmem_cache")
+class TestDuplicateDeliverySuppression:
+    @pytest.fixture(autouse=True)
+    def enable_deduplication(self, settings):
+        settings.CLOUD_TASKS_DEDUPLICATION = {
+            "BACKEND": "django_tasks_cloud_tasks.ledger.CacheLedger",
+        }
+
+    def make_request(self, task, task_id):
+        payload = {
+            "task_id": task_id,
+            "task_path": task.module_path,
+            "args": [3],
+            "kwargs": {},
+            "queue_name": "default",
+            "backend": "default",
+        }
+        return RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+
+    def test_completed_task_is_not_executed_again(self):
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        view = ExecuteTaskView.as_view()
+        request = self.make_request(simple_task, "dedup-task-1")
+
+        assert view(request).status_code == 200
+        with patch(
+            "django_tasks_cloud_tasks.handler.execute_task_from_payload"
+        ) as mock_execute:
+            response = view(request)
+
+        assert response.status_code == 200
+        assert json.loads(response.content)["status"] == "duplicate"
+        mock_execute.assert_not_called()
+
+    def test_running_task_is_rejected_with_409(self):
+        from django_tasks_cloud_tasks.ledger import get_ledger
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        get_ledger().claim("dedup-task-2")
+
+        response = ExecuteTaskView.as_view()(
+            self.make_request(simple_task, "dedup-task-2")
+        )
+
+        assert response.status_code == 409
+        assert "Retry-After" in response
+
+    def test_failed_task_can_be_retried(self):
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import failing_view_task
+
+        view = ExecuteTaskView.as_view()
+        request = self.make_request(failing_view_task, "dedup-task-3")
+
+        assert view(request).status_code == 500
+        assert view(request).status_code == 500
@@ -0,0 +1,209 @@
+"""Tests for limits.py"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from django.test import RequestFactory, override_settings
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_limiters():
+    from django_tasks_cloud_tasks.limits import get_limiter
+
+    get_limiter.cache_clear()
+    yield
+    get_limiter.cache_clear()
+
+
+class TestConcurrencyLimiter:
+    def test_rejects_when_limit_reached(self):
+        from django_tasks_cloud_tasks.limits import ConcurrencyLimiter
+
+        limiter = ConcurrencyLimiter("task", "tests.tasks.simple_task", 2)
+
+        first = limiter.acquire()
+        assert first is not None
+        assert limiter.acquire() is not None
+        assert limiter.acquire() is None
+        first.release()
+        assert limiter.acquire() is not None
+        assert limiter.rejections == 1
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_shared_counter_limits_across_instances(self):
+        from django_tasks_cloud_tasks.limits import ConcurrencyLimiter
+
+        # Two limiters sharing a cache key act like two instances
+        instance_a = ConcurrencyLimiter("queue", "reports", 1, cache_alias="default")
+        instance_b = ConcurrencyLimiter("queue", "reports", 1, cache_alias="default")
+
+        slot = instance_a.acquire()
+        assert slot.shared is True
+        assert instance_b.acquire() is None
+        slot.release()
+        assert instance_b.acquire() is not None
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_shared_counter_outlives_timeout_under_load(self):
+        from django.core.cache import cache
+
+        from django_tasks_cloud_tasks.limits import ConcurrencyLimiter
+
+        instance_a = ConcurrencyLimiter(
+            "queue", "reports", 1, cache_alias="default", cache_timeout=10
+        )
+        instance_b = ConcurrencyLimiter(
+            "queue", "reports", 1, cache_alias="default", cache_timeout=10
+        )
+        cache.delete(instance_a.cache_key)
+
+        with (
+            patch("django.core.cache.backends.locmem.time") as locmem_time,
+            patch("django.core.cache.backends.base.time") as base_time,
+        ):
+            locmem_time.time.return_value = base_time.time.return_value = 1000
+            held = instance_a.acquire()
+            locmem_time.time.return_value = base_time.time.return_value = 1006
+            assert instance_b.acquire() is None
+            # Past the timeout of the first acquire, with the slot still held
+            locmem_time.time.return_value = base_time.time.return_value = 1012
+            assert instance_b.acquire() is None
+
+            held.release()
+            assert cache.get(instance_a.cache_key) == 0
+            assert instance_b.acquire() is not None
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_shared_counter_does_not_go_below_zero(self):
+        from django.core.cache import cache
+
+        from django_tasks_cloud_tasks.limits import ConcurrencyLimiter
+
+        limiter = ConcurrencyLimiter("queue", "reports", 1, cache_alias="default")
+        cache.delete(limiter.cache_key)
+        held = limiter.acquire()
+        # The key expired and was created again while the slot was held
+        cache.set(limiter.cache_key, 0)
+
+        held.release()
+
+        assert cache.get(limiter.cache_key) == 0
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_slot_taken_without_cache_leaves_shared_counter(self):
+        from django.core.cache import cache
+
+        from django_tasks_cloud_tasks.limits import ConcurrencyLimiter
+
+        limiter = ConcurrencyLimiter("queue", "reports", 2, cache_alias="default")
+        cache.delete(limiter.cache_key)
+        held = limiter.acquire()
+
+        with patch.object(
+            ConcurrencyLimiter, "_incr_shared", side_effect=ConnectionError("down")
+        ):
+            slot = limiter.acquire()
+        assert slot.shared is False
+        slot.release()
+
+        # The slot held by the first dispatch is still counted
+        assert cache.get(limiter.cache_key) == 1
+        held.release()
+        assert cache.get(limiter.cache_key) == 0
+
+
+class TestAcquireConcurrencySlots:
+    def test_no_limits_configured(self):
+        from django_tasks_cloud_tasks.limits import acquire_concurrency_slots
+
+        slots = acquire_concurrency_slots("tests.tasks.simple_task", "default")
+
+        assert slots.slots == ()
+
+    @override_settings(
+        CLOUD_TASKS_TASK_CONCURRENCY={"tests.tasks.simple_task": 5},
+        CLOUD_TASKS_QUEUE_CONCURRENCY={"default": 1},
+    )
+    def test_releases_taken_slots_when_rejected(self):
+        from django_tasks_cloud_tasks.limits import (
+            ConcurrencyLimitExceeded,
+            acquire_concurrency_slots,
+            get_limiter,
+        )
+
+        held = acquire_concurrency_slots("tests.tasks.simple_task", "default")
+
+        with pytest.raises(ConcurrencyLimitExceeded) as exc_info:
+            acquire_concurrency_slots("tests.tasks.simple_task", "default")
+
+        assert exc_info.value.scope == "queue"
+        task_limiter = get_limiter("task", "tests.tasks.simple_task", 5, None, None)
+        assert task_limiter._semaphore._value == 4
+        held.release()
+        assert task_limiter._semaphore._value == 5
+
+
+@pytest.mark.django_db
+class TestLoadShedding:
+    @override_settings(
+        CLOUD_TASKS_TASK_CONCURRENCY={"tests.tasks.simple_task": 1},
+        CLOUD_TASKS_SHED_RETRY_AFTER=30,
+    )
+    def test_view_returns_429_with_retry_after(self):
+        from django_tasks_cloud_tasks.limits import acquire_concurrency_slots
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        payload = {
+            "task_id": "shed-test-task",
+            "task_path": simple_task.module_path,
+            "args": [1],
+            "kwargs": {},
+            "queue_name": "default",
+            "backend": "default",
+        }
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+        view = ExecuteTaskView.as_view()
+
+        held = acquire_concurrency_slots(simple_task.module_path, "default")
+        response = view(request)
+        held.release()
+
+        assert response.status_code == 429
+        assert response["Retry-After"] == "30"
+        assert view(request).status_code == 200
+
+    @override_settings(
+        CLOUD_TASKS_QUEUE_CONCURRENCY={"default": 1},
+        CLOUD_TASKS_SHED_STATUS=503,
+    )
+    def test_slot_is_released_after_failed_task(self):
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import failing_view_task
+
+        payload = {
+            "task_id": "shed-test-failing",
+            "task_path": failing_view_task.module_path,
+            "args": [],
+            "kwargs": {},
+            "queue_name": "default",
+            "backend": "default",
+        }
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+        view = ExecuteTaskView.as_view()
+
+        assert view(request).status_code == 500
+        assert view(request).status_code == 500
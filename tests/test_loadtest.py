@@ -0,0 +1,97 @@
+"""Tests for loadtest.py and the cloudtasks_loadtest command"""
+
+import json
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from django_tasks_cloud_tasks.loadtest import histogram, percentile, summarize
+
+
+class TestStatistics:
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+        assert percentile([], 50) is None
+
+    def test_summarize(self):
+        summary = summarize([0.3, 0.1, 0.2])
+
+        assert summary["count"] == 3
+        assert summary["min"] == 0.1
+        assert summary["max"] == 0.3
+        assert summary["p50"] == 0.2
+
+    def test_histogram(self):
+        assert histogram([0.01, 0.2, 0.2, 5.0], buckets=(0.1, 1, float("inf"))) == [
+            (0.1, 1),
+            (1, 2),
+            (float("inf"), 1),
+        ]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestLoadtestCommand:
+    def run(self, *args):
+        out = StringIO()
+        call_command(
+            "cloudtasks_loadtest",
+            "--stand-in",
+            "--rate",
+            "1000",
+            "--timeout",
+            "5",
+            *args,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_reports_latencies_with_stand_in(self):
+        report = json.loads(self.run("--count", "20", "--sleep-ms", "5", "--json"))
+
+        assert report["enqueued"] == 20
+        assert report["completed"] == 20
+        assert report["missing"] == 0
+        assert report["enqueue_to_finish"]["p50"] >= 0.005
+        assert report["enqueue_to_start"]["p99"] <= report["enqueue_to_finish"]["max"]
+        assert sum(count for _, count in report["histogram"]) == 20
+
+    def test_reports_task_errors(self):
+        report = json.loads(
+            self.run("--count", "10", "--failure-rate", "1.0", "--json")
+        )
+
+        assert report["failed"] == 10
+        assert report["task_error_rate"] == 1.0
+
+    def test_text_report(self):
+        output = self.run("--count", "5")
+
+        assert "Enqueue to finish:" in output
+        assert "histogram" in output
+
+    def test_stand_in_without_configured_default_backend(self):
+        import importlib
+
+        from django_tasks_cloud_tasks import loadtest
+
+        unconfigured = {
+            "default": {"BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend"}
+        }
+        with (
+            override_settings(TASKS=unconfigured),
+            patch.dict("os.environ", clear=True),
+            patch(
+                "django_tasks_cloud_tasks.detection._get_metadata", return_value=None
+            ),
+        ):
+            importlib.reload(loadtest)
+            report = json.loads(self.run("--count", "3", "--json"))
+
+        assert report["completed"] == 3
@@ -0,0 +1,206 @@
+"""Tests for local.py"""
+
+import json
+from datetime import timedelta
+
+import pytest
+from django.tasks import task_backends
+from django.test import override_settings
+from django.utils import timezone
+
+from django_tasks_cloud_tasks.local import VirtualClock
+
+
+def local_tasks(**options):
+    return {
+        "default": {
+            "BACKEND": "django_tasks_cloud_tasks.CloudTasksLocalBackend",
+            "QUEUES": ["default"],
+            "OPTIONS": options,
+        },
+    }
+
+
+@pytest.fixture
+def backend(request):
+    options = getattr(request, "param", {})
+    with override_settings(TASKS=local_tasks(**options)):
+        backend = task_backends["default"]
+        backend.reset()
+        yield backend
+        backend.reset()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCloudTasksLocalBackend:
+    def test_sync_mode_runs_task_through_handler(self, backend):
+        from tests.tasks import add_numbers
+
+        result = add_numbers.enqueue(1, 2)
+
+        [dispatch] = backend.dispatches
+        assert dispatch.task_id == result.id
+        assert dispatch.status_code == 200
+        assert dispatch.response == {"status": "success", "task_id": result.id}
+
+    @pytest.mark.parametrize("backend", [{"MODE": "deferred"}], indirect=True)
+    def test_deferred_mode_runs_on_drain(self, backend):
+        from tests.tasks import chain_task
+
+        chain_task.enqueue(5)
+        assert backend.dispatches == []
+        assert len(backend.queue) == 1
+
+        backend.drain()
+
+        # Tasks enqueued while draining run in the same drain
+        assert [d.task_path for d in backend.dispatches] == [
+            "tests.tasks.chain_task",
+            "tests.tasks.simple_task",
+        ]
+
+    @pytest.mark.parametrize(
+        "backend", [{"MODE": "thread", "MAX_WORKERS": 2}], indirect=True
+    )
+    def test_thread_mode_waits_on_drain(self, backend):
+        from tests.tasks import chain_task
+
+        for x in range(4):
+            chain_task.enqueue(x)
+        backend.drain()
+
+        assert len(backend.dispatches) == 8
+        assert all(d.succeeded for d in backend.dispatches)
+
+    def test_run_after_waits_for_virtual_clock(self, backend):
+        from tests.tasks import add_numbers
+
+        add_numbers.using(run_after=timezone.now() + timedelta(hours=1)).enqueue(1, 2)
+        assert backend.dispatches == []
+
+        backend.advance(timedelta(minutes=30))
+        assert backend.dispatches == []
+
+        backend.advance(timedelta(minutes=31))
+        assert len(backend.dispatches) == 1
+
+    @pytest.mark.parametrize("backend", [{"MODE": "deferred"}], indirect=True)
+    def test_drain_include_scheduled_advances_clock(self, backend):
+        from tests.tasks import add_numbers
+
+        add_numbers.using(run_after=timezone.now() + timedelta(days=1)).enqueue(1, 2)
+        backend.drain(include_scheduled=True)
+
+        assert len(backend.dispatches) == 1
+        assert backend.clock.offset >= timedelta(hours=23)
+
+    @pytest.mark.parametrize("backend", [{"MAX_ATTEMPTS": 3}], indirect=True)
+    def test_failed_task_is_retried_with_attempt_headers(self, backend):
+        from tests.tasks import failing_task
+
+        failing_task.enqueue()
+
+        assert [(d.attempt, d.status_code) for d in backend.dispatches] == [
+            (1, 500),
+            (2, 500),
+            (3, 500),
+        ]
+
+    @pytest.mark.parametrize(
+        "backend",
+        [{"AUTHENTICATE": True, "HMAC_SIGNING_KEY": "secret"}],
+        indirect=True,
+    )
+    def test_authenticates_signed_payload(self, backend):
+        from tests.tasks import add_numbers
+
+        with override_settings(CLOUD_TASKS_HMAC_KEYS={"default": "secret"}):
+            add_numbers.enqueue(1, 2)
+        with override_settings(CLOUD_TASKS_HMAC_KEYS={"default": "other"}):
+            add_numbers.enqueue(1, 2)
+
+        assert [d.status_code for d in backend.dispatches] == [200, 401]
+
+    @pytest.mark.parametrize(
+        "backend",
+        [{"MODE": "deferred", "AUTHENTICATE": True, "HMAC_SIGNING_KEY": "secret"}],
+        indirect=True,
+    )
+    def test_authenticates_scheduled_tasks_at_virtual_time(self, backend):
+        from tests.tasks import add_numbers
+
+        with override_settings(CLOUD_TASKS_HMAC_KEYS={"default": "secret"}):
+            add_numbers.using(run_after=timezone.now() + timedelta(hours=2)).enqueue(
+                1, 2
+            )
+            backend.drain(include_scheduled=True)
+            add_numbers.enqueue(3, 4)
+            backend.drain()
+
+        assert [d.status_code for d in backend.dispatches] == [200, 200]
+
+    @pytest.mark.parametrize("backend", [{"MODE": "deferred"}], indirect=True)
+    def test_task_ttl_uses_virtual_clock(self, backend):
+        from tests.tasks import add_numbers
+
+        add_numbers.enqueue(1, 2)
+        backend.advance(timedelta(minutes=2))
+        with override_settings(CLOUD_TASKS_TASK_TTL={"*": 60}):
+            backend.drain()
+
+        [dispatch] = backend.dispatches
+        assert dispatch.response["status"] == "expired"
+
+    @pytest.mark.parametrize(
+        "backend",
+        [
+            {
+                "ROUTES": {
+                    "heavy": {
+                        "TASK_HANDLER_HOST": "https://heavy.example.com",
+                        "TASKS": ["tests.tasks.add_numbers"],
+                    }
+                }
+            }
+        ],
+        indirect=True,
+    )
+    def test_shares_option_parsing_without_detection(self, backend):
+        from tests.tasks import add_numbers
+
+        assert backend.project_id == "local"
+        assert backend.locations == ("local",)
+        assert backend.app_engine_target is False
+        assert backend.oidc_service_account_email is None
+        route = backend.task_router.resolve(add_numbers)
+        assert route.url == "https://heavy.example.com/cloudtasks/execute/"
+        assert backend.get_queue_path("default") == (
+            "projects/local/locations/local/queues/default"
+        )
+
+    def test_payload_matches_cloud_tasks_backend(self, backend):
+        from tests.tasks import add_numbers
+
+        now = timezone.now()
+        payload = backend.build_payload(add_numbers, [1], {"y": 2}, "abc", now)
+
+        assert json.loads(json.dumps(payload)) == {
+            "task_id": "abc",
+            "task_path": add_numbers.module_path,
+            "args": [1],
+            "kwargs": {"y": 2},
+            "queue_name": "default",
+            "backend": "default",
+            "priority": 0,
+            "takes_context": False,
+            "enqueued_at": now.isoformat(),
+            "run_after": None,
+        }
+
+
+class TestVirtualClock:
+    def test_advance_shifts_real_time(self):
+        clock = VirtualClock()
+        clock.advance(timedelta(hours=2))
+
+        assert clock.now() - timezone.now() > timedelta(hours=1, minutes=59)
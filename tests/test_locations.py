@@ -0,0 +1,270 @@
+"""Tests for locations.py and multi-location enqueue"""
+
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.tasks import task_backends
+from django.test import override_settings
+from google.api_core import exceptions
+
+from django_tasks_cloud_tasks import metrics
+from django_tasks_cloud_tasks.backends import CloudTasksBackend
+from django_tasks_cloud_tasks.locations import (
+    LocationRouter,
+    reset_location_health,
+    should_fail_over,
+)
+from tests.tasks import add_numbers
+
+PRIMARY = "us-central1"
+SECONDARY = "us-east1"
+
+
+def make_tasks(**routing):
+    options = {
+        "CLOUD_TASKS_PROJECT": "test-project",
+        "CLOUD_TASKS_LOCATIONS": [PRIMARY, SECONDARY],
+        "TASK_HANDLER_HOST": "https://test.example.com",
+    }
+    if routing:
+        options["LOCATION_ROUTING"] = routing
+    return {
+        "default": {
+            "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+            "QUEUES": ["default"],
+            "OPTIONS": options,
+        },
+    }
+
+
+def parent_location(call):
+    return call.kwargs["parent"].split("/")[3]
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    reset_location_health()
+    metrics.registry.clear()
+    yield
+    reset_location_health()
+    metrics.registry.clear()
+
+
+class TestShouldFailOver:
+    def test_retryable_codes(self):
+        assert should_fail_over(exceptions.ServiceUnavailable("down"))
+        assert should_fail_over(exceptions.DeadlineExceeded("slow"))
+        assert should_fail_over(ConnectionError("reset"))
+
+    def test_request_errors(self):
+        assert not should_fail_over(exceptions.InvalidArgument("bad"))
+        assert not should_fail_over(exceptions.NotFound("no queue"))
+
+    def test_programming_errors(self):
+        assert not should_fail_over(ValueError("bad deadline"))
+        assert not should_fail_over(TypeError("not serializable"))
+
+
+class TestBackendLocations:
+    @override_settings(TASKS=make_tasks())
+    def test_primary_is_first_location(self):
+        backend = task_backends["default"]
+
+        assert backend.location == PRIMARY
+        assert backend.locations == (PRIMARY, SECONDARY)
+        assert backend.get_queue_path("default", SECONDARY) == (
+            f"projects/test-project/locations/{SECONDARY}/queues/default"
+        )
+
+    def test_invalid_strategy(self):
+        with pytest.raises(ImproperlyConfigured, match="STRATEGY"):
+            CloudTasksBackend("default", make_tasks(STRATEGY="random")["default"])
+
+
+@patch("google.cloud.tasks_v2.CloudTasksClient")
+class TestFailover:
+    @override_settings(TASKS=make_tasks())
+    def test_fails_over_on_unavailable(self, mock_client_class):
+        mock_client = mock_client_class.return_value
+        mock_client.create_task.side_effect = [
+            exceptions.ServiceUnavailable("down"),
+            MagicMock(),
+        ]
+
+        add_numbers.enqueue(1, 2)
+
+        calls = mock_client.create_task.call_args_list
+        assert [parent_location(call) for call in calls] == [PRIMARY, SECONDARY]
+        assert metrics.ENQUEUE_FAILOVERS.get(SECONDARY) == 1
+        assert metrics.ENQUEUED.get("tests.tasks.add_numbers", "default") == 1
+
+    @override_settings(TASKS=make_tasks())
+    def test_no_failover_on_invalid_argument(self, mock_client_class):
+        mock_client = mock_client_class.return_value
+        mock_client.create_task.side_effect = exceptions.InvalidArgument("bad")
+
+        with pytest.raises(exceptions.InvalidArgument):
+            add_numbers.enqueue(1, 2)
+
+        assert mock_client.create_task.call_count == 1
+
+    @override_settings(TASKS=make_tasks())
+    def test_raises_when_all_locations_fail(self, mock_client_class):
+        mock_client = mock_client_class.return_value
+        mock_client.create_task.side_effect = exceptions.ServiceUnavailable("down")
+
+        with pytest.raises(exceptions.ServiceUnavailable):
+            add_numbers.enqueue(1, 2)
+
+        assert mock_client.create_task.call_count == 2
+
+    @override_settings(TASKS=make_tasks(ERROR_RATE_THRESHOLD=0.1, PROBE_INTERVAL=30))
+    def test_degraded_primary_is_skipped_and_probed(self, mock_client_class):
+        mock_client = mock_client_class.return_value
+        mock_client.create_task.side_effect = [
+            exceptions.ServiceUnavailable("down"),
+            MagicMock(),  # failover
+            MagicMock(),  # probe of the primary
+            MagicMock(),  # primary not probed again yet
+        ]
+        router = task_backends["default"].router
+
+        with patch("django_tasks_cloud_tasks.locations.time.monotonic") as now:
+            now.return_value = 1000.0
+            add_numbers.enqueue(1, 2)
+            assert router.is_degraded(PRIMARY)
+
+            add_numbers.enqueue(1, 2)
+            now.return_value = 1010.0
+            add_numbers.enqueue(1, 2)
+
+        calls = mock_client.create_task.call_args_list
+        assert [parent_location(call) for call in calls] == [
+            PRIMARY,
+            SECONDARY,
+            PRIMARY,
+            SECONDARY,
+        ]
+        assert metrics.LOCATION_HEALTHY.get(PRIMARY) == 0
+        assert metrics.LOCATION_HEALTHY.get(SECONDARY) == 1
+
+    @override_settings(TASKS=make_tasks())
+    def test_records_location_health(self, mock_client_class):
+        add_numbers.enqueue(1, 2)
+
+        health = task_backends["default"].router.health[PRIMARY]
+        assert health.error_rate == 0.0
+        assert metrics.LOCATION_LATENCY.get(PRIMARY) == health.latency
+        assert metrics.LOCATION_ERROR_RATE.get(PRIMARY) == 0.0
+
+
+class TestProgrammingErrors:
+    def test_value_error_is_raised_without_failover(self):
+        calls = []
+
+        def create(location):
+            calls.append(location)
+            raise ValueError("bad dispatch_deadline")
+
+        router = LocationRouter(
+            "test-project", [PRIMARY, SECONDARY], {"ERROR_RATE_THRESHOLD": 0.1}
+        )
+
+        with pytest.raises(ValueError):
+            router.create(create)
+
+        assert calls == [PRIMARY]
+        assert metrics.ENQUEUE_FAILOVERS.get(SECONDARY) == 0
+        assert router.health[PRIMARY].error_rate == 0.0
+        assert not router.is_degraded(PRIMARY)
+
+    def test_value_error_is_raised_when_hedging(self):
+        def create(location):
+            raise ValueError("bad dispatch_deadline")
+
+        router = LocationRouter(
+            "test-project",
+            [PRIMARY, SECONDARY],
+            {"STRATEGY": "hedge", "HEDGE_DELAY": 5, "ERROR_RATE_THRESHOLD": 0.1},
+        )
+
+        with pytest.raises(ValueError):
+            router.create(create)
+
+        assert metrics.ENQUEUE_FAILOVERS.get(SECONDARY) == 0
+        assert not router.is_degraded(PRIMARY)
+
+
+class TestHealthGauge:
+    def test_set_only_when_health_changes(self):
+        router = LocationRouter(
+            "test-project", [PRIMARY, SECONDARY], {"ERROR_RATE_THRESHOLD": 0.1}
+        )
+
+        with patch.object(
+            metrics.LOCATION_HEALTHY, "set", wraps=metrics.LOCATION_HEALTHY.set
+        ) as mock_set:
+            router.order()
+            router.order()
+            router.health[PRIMARY].record(0.01, False)
+            router.order()
+            router.order()
+
+        assert [call.args for call in mock_set.call_args_list] == [
+            (1, PRIMARY),
+            (1, SECONDARY),
+            (0, PRIMARY),
+        ]
+
+
+class TestHedging:
+    def test_hedges_slow_primary(self):
+        release = threading.Event()
+        created = []
+
+        def create(location):
+            if location == PRIMARY:
+                release.wait(5)
+            created.append(location)
+
+        router = LocationRouter(
+            "test-project",
+            [PRIMARY, SECONDARY],
+            {"STRATEGY": "hedge", "HEDGE_DELAY": 0},
+        )
+        try:
+            assert router.create(create) == SECONDARY
+        finally:
+            release.set()
+
+        assert created[0] == SECONDARY
+        assert metrics.ENQUEUE_HEDGES.get(SECONDARY) == 1
+
+    def test_fast_primary_is_not_hedged(self):
+        created = []
+        router = LocationRouter(
+            "test-project",
+            [PRIMARY, SECONDARY],
+            {"STRATEGY": "hedge", "HEDGE_DELAY": 5},
+        )
+
+        assert router.create(created.append) == PRIMARY
+
+        assert created == [PRIMARY]
+        assert metrics.ENQUEUE_HEDGES.get(SECONDARY) == 0
+
+    def test_fails_over_when_hedged_primary_fails(self):
+        def create(location):
+            if location == PRIMARY:
+                raise exceptions.ServiceUnavailable("down")
+
+        router = LocationRouter(
+            "test-project",
+            [PRIMARY, SECONDARY],
+            {"STRATEGY": "hedge", "HEDGE_DELAY": 5},
+        )
+
+        assert router.create(create) == SECONDARY
+        assert metrics.ENQUEUE_FAILOVERS.get(SECONDARY) == 1
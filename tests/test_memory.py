@@ -0,0 +1,113 @@
+"""Tests for memory.py"""
+
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from django.test import RequestFactory, override_settings
+
+from django_tasks_cloud_tasks import memory
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    memory.reset_memory_stats()
+    yield
+    memory.reset_memory_stats()
+
+
+def make_payload(task_path, args):
+    return {
+        "task_id": "memory-task-id",
+        "task_path": task_path,
+        "args": args,
+        "kwargs": {},
+        "queue_name": "default",
+        "backend": "default",
+    }
+
+
+def execute(task, *args):
+    from django_tasks_cloud_tasks.executor import execute_task_from_payload
+
+    return execute_task_from_payload(make_payload(task.module_path, args), "worker")
+
+
+@pytest.mark.django_db
+class TestTrackMemory:
+    def test_noop_when_disabled(self):
+        from tests.tasks import add_numbers
+
+        assert memory.track_memory("id", "path") is memory._NOT_TRACKED
+        execute(add_numbers, 1, 2)
+        assert memory.get_memory_stats() == {}
+
+    @override_settings(CLOUD_TASKS_MEMORY={"RSS_WATERMARK": None})
+    def test_records_stats_per_task_path(self):
+        from tests.tasks import add_numbers
+
+        execute(add_numbers, 1, 2)
+        execute(add_numbers, 3, 4)
+
+        stats = memory.get_memory_stats()[add_numbers.module_path]
+        assert stats["executions"] == 2
+        assert stats["peak_rss"] > 0
+        assert memory.recycle_requested() is None
+
+    def test_logs_top_allocations_of_selected_paths(self, caplog):
+        from tests.tasks import message_task
+
+        config = {"TRACEMALLOC_TASK_PATHS": [message_task.module_path]}
+        with override_settings(CLOUD_TASKS_MEMORY=config):
+            with caplog.at_level("INFO", logger="django_tasks_cloud_tasks"):
+                execute(message_task, "x", 100000)
+
+        assert any("Top allocations" in r.getMessage() for r in caplog.records)
+        assert memory._tracemalloc_users == 0
+
+    def test_watermark_calls_hook_once(self):
+        from tests.tasks import add_numbers
+
+        hook = MagicMock()
+        config = {"RSS_WATERMARK": 1, "ON_WATERMARK": hook}
+        with override_settings(CLOUD_TASKS_MEMORY=config):
+            execute(add_numbers, 1, 2)
+            execute(add_numbers, 1, 2)
+
+        hook.assert_called_once()
+        assert hook.call_args.args[1] == add_numbers.module_path
+        assert memory.recycle_requested() > 1
+
+
+@pytest.mark.django_db
+class TestRecycleResponse:
+    def post(self):
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import add_numbers
+
+        request = RequestFactory().post(
+            "/cloudtasks/execute/",
+            data=json.dumps(make_payload(add_numbers.module_path, [1, 2])),
+            content_type="application/json",
+        )
+        return ExecuteTaskView.as_view()(request)
+
+    @override_settings(CLOUD_TASKS_MEMORY={"RSS_WATERMARK": 1})
+    def test_header_action_marks_responses(self):
+        first = self.post()
+        second = self.post()
+
+        assert first.status_code == 200
+        assert first[memory.RECYCLE_HEADER].startswith("rss=")
+        assert second.status_code == 200
+
+    @override_settings(
+        CLOUD_TASKS_MEMORY={"RSS_WATERMARK": 1, "RECYCLE_ACTION": "reject"}
+    )
+    def test_reject_action_refuses_new_dispatches(self):
+        first = self.post()
+        second = self.post()
+
+        assert first.status_code == 200
+        assert second.status_code == 503
+        assert second["Retry-After"] == "1"
@@ -0,0 +1,217 @@
+"""Tests for metrics.py"""
+
+import os
+import subprocess
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.test import RequestFactory, override_settings
+
+from django_tasks_cloud_tasks import metrics
+
+TASKS = {
+    "default": {
+        "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+        "QUEUES": ["default"],
+        "OPTIONS": {
+            "CLOUD_TASKS_PROJECT": "test-project",
+            "CLOUD_TASKS_LOCATION": "us-central1",
+            "TASK_HANDLER_HOST": "https://test.example.com",
+        },
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def make_payload(task_path, **overrides):
+    payload = {
+        "task_id": "metrics-task-id",
+        "task_path": task_path,
+        "args": [1, 2],
+        "kwargs": {},
+        "queue_name": "default",
+        "backend": "default",
+        "enqueued_at": "2024-01-01T00:00:00+00:00",
+    }
+    payload.update(overrides)
+    return payload
+
+
+class TestMetricTypes:
+    def test_counter_renders_labels(self):
+        counter = metrics.Counter("test_total", "Test counter.", ["queue"])
+        counter.inc("default")
+        counter.inc("default", amount=2)
+        counter.inc('quo"te')
+
+        text = "\n".join(counter.render(counter.merge(counter.snapshot())))
+
+        assert 'test_total{queue="default"} 3' in text
+        assert 'test_total{queue="quo\\"te"} 1' in text
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram(
+            "test_seconds", "Test histogram.", ["queue"], buckets=(0.1, 1.0)
+        )
+        histogram.observe(0.05, "default")
+        histogram.observe(0.5, "default")
+        histogram.observe(5.0, "default")
+
+        lines = list(histogram.render(histogram.merge(histogram.snapshot())))
+
+        assert lines == [
+            'test_seconds_bucket{queue="default",le="0.1"} 1',
+            'test_seconds_bucket{queue="default",le="1"} 2',
+            'test_seconds_bucket{queue="default",le="+Inf"} 3',
+            'test_seconds_sum{queue="default"} 5.55',
+            'test_seconds_count{queue="default"} 3',
+        ]
+
+    def test_gauge_reports_last_value_set_by_any_process(self):
+        registry = metrics.Registry()
+        gauge = registry.gauge("test_seconds", "Test gauge.", ["location"])
+        gauge.set(0.5, "us-central1")
+        first = registry.snapshot()
+        gauge.set(0.25, "us-central1")
+
+        text = registry.render([registry.snapshot(), first])
+
+        assert "# TYPE test_seconds gauge" in text
+        assert 'test_seconds{location="us-central1"} 0.25' in text
+
+    def test_render_sums_snapshots_of_processes(self):
+        registry = metrics.Registry()
+        counter = registry.counter("test_total", "Test counter.", ["queue"])
+        counter.inc("default")
+        snapshot = registry.snapshot()
+
+        text = registry.render([snapshot, snapshot])
+
+        assert "# TYPE test_total counter" in text
+        assert 'test_total{queue="default"} 2' in text
+
+
+class TestMultiprocess:
+    def test_view_process_reads_snapshots_of_all_processes(self, tmp_path):
+        metrics.TASK_EXECUTIONS.inc("tests.tasks.add_numbers", "default", "success")
+        # Snapshot written by another worker process
+        (tmp_path / f"cloudtasks_{os.getppid()}.json").write_text(
+            '{"cloudtasks_task_executions_total": '
+            '[[["tests.tasks.add_numbers", "default", "success"], 4]]}'
+        )
+
+        with override_settings(CLOUD_TASKS_METRICS_MULTIPROC_DIR=str(tmp_path)):
+            text = metrics.render_metrics()
+
+        assert (tmp_path / f"cloudtasks_{os.getpid()}.json").exists()
+        assert (
+            "cloudtasks_task_executions_total{"
+            'task="tests.tasks.add_numbers",queue="default",status="success"} 5'
+        ) in text
+
+    def test_snapshots_of_exited_processes_are_deleted(self, tmp_path):
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        path = tmp_path / f"cloudtasks_{exited.pid}.json"
+        path.write_text("{}")
+
+        assert metrics.registry.read_snapshots(str(tmp_path)) == []
+        assert not path.exists()
+
+    def test_stale_snapshots_are_deleted(self, tmp_path):
+        path = tmp_path / f"cloudtasks_{os.getppid()}.json"
+        path.write_text("{}")
+        stale = time.time() - metrics.MULTIPROC_SNAPSHOT_TTL - 1
+        os.utime(path, (stale, stale))
+
+        assert metrics.registry.read_snapshots(str(tmp_path)) == []
+        assert not path.exists()
+
+
+@pytest.mark.django_db
+class TestInstrumentation:
+    @override_settings(TASKS=TASKS)
+    @patch("google.cloud.tasks_v2.CloudTasksClient")
+    def test_enqueue_records_latency_and_payload_size(self, mock_client_class):
+        from tests.tasks import add_numbers
+
+        mock_client_class.return_value = MagicMock()
+
+        add_numbers.enqueue(1, 2)
+
+        assert metrics.ENQUEUED.get(add_numbers.module_path, "default") == 1
+        assert metrics.ENQUEUE_DURATION.get_count("default") == 1
+        assert metrics.ENQUEUE_PAYLOAD_BYTES.get_sum("default") > 0
+
+    @override_settings(TASKS=TASKS)
+    @patch("google.cloud.tasks_v2.CloudTasksClient")
+    def test_enqueue_error_counted_by_grpc_code(self, mock_client_class):
+        from google.api_core.exceptions import ServiceUnavailable
+
+        from tests.tasks import add_numbers
+
+        mock_client = MagicMock()
+        mock_client.create_task.side_effect = ServiceUnavailable("unavailable")
+        mock_client_class.return_value = mock_client
+
+        with pytest.raises(ServiceUnavailable):
+            add_numbers.enqueue(1, 2)
+
+        assert metrics.ENQUEUE_ERRORS.get("default", "UNAVAILABLE") == 1
+        assert metrics.ENQUEUED.get(add_numbers.module_path, "default") == 0
+
+    @override_settings(TASKS=TASKS)
+    def test_execution_records_outcome_duration_and_queue_wait(self):
+        from django_tasks_cloud_tasks.executor import execute_task_from_payload
+        from tests.tasks import add_numbers, failing_task
+
+        execute_task_from_payload(make_payload(add_numbers.module_path), "worker")
+        execute_task_from_payload(make_payload(failing_task.module_path), "worker")
+
+        assert (
+            metrics.TASK_EXECUTIONS.get(add_numbers.module_path, "default", "success")
+            == 1
+        )
+        assert (
+            metrics.TASK_EXECUTIONS.get(failing_task.module_path, "default", "failure")
+            == 1
+        )
+        assert metrics.TASK_DURATION.get_count(add_numbers.module_path, "default") == 1
+        # Enqueued long ago: lands in the +Inf bucket
+        assert metrics.TASK_QUEUE_WAIT.get_sum(add_numbers.module_path, "default") > 900
+
+
+class TestMetricsView:
+    def test_disabled_by_default(self):
+        from django.http import Http404
+
+        from django_tasks_cloud_tasks.views import MetricsView
+
+        request = RequestFactory().get("/cloudtasks/metrics/")
+
+        with pytest.raises(Http404):
+            MetricsView.as_view()(request)
+
+    @override_settings(CLOUD_TASKS_METRICS_ENABLED=True)
+    def test_renders_prometheus_text(self):
+        from django_tasks_cloud_tasks.views import MetricsView
+
+        metrics.DISPATCH_RESPONSES.inc("default", "200")
+        request = RequestFactory().get("/cloudtasks/metrics/")
+
+        response = MetricsView.as_view()(request)
+
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+        body = response.content.decode()
+        assert "# TYPE cloudtasks_enqueue_duration_seconds histogram" in body
+        assert (
+            'cloudtasks_dispatch_responses_total{queue="default",code="200"} 1' in body
+        )
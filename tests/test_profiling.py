@@ -0,0 +1,99 @@
+"""Tests for profiling.py"""
+
+import json
+import marshal
+
+import pytest
+from django.test import override_settings
+
+from django_tasks_cloud_tasks import profiling
+
+
+def make_payload(task_path, args):
+    return {
+        "task_id": "profiled-task-id",
+        "task_path": task_path,
+        "args": args,
+        "kwargs": {},
+        "queue_name": "default",
+        "backend": "default",
+    }
+
+
+class CollectingSink:
+    def __init__(self):
+        self.profiles = []
+
+    def __call__(self, profile):
+        self.profiles.append(profile)
+
+
+class TestProfileTask:
+    def test_noop_when_disabled(self):
+        assert profiling.profile_task("id", "tests.tasks.add_numbers") is (
+            profiling._NOT_PROFILED
+        )
+
+    @override_settings(CLOUD_TASKS_PROFILING={"SAMPLE_RATE": 0})
+    def test_noop_when_not_sampled(self):
+        assert profiling.profile_task("id", "tests.tasks.add_numbers") is (
+            profiling._NOT_PROFILED
+        )
+
+    @pytest.mark.django_db
+    def test_cprofile_profile_of_listed_task_path(self):
+        from django_tasks_cloud_tasks.executor import execute_task_from_payload
+        from tests.tasks import add_numbers
+
+        sink = CollectingSink()
+        config = {"TASK_PATHS": [add_numbers.module_path], "SINK": sink}
+        with override_settings(CLOUD_TASKS_PROFILING=config):
+            execute_task_from_payload(
+                make_payload(add_numbers.module_path, [1, 2]), "worker"
+            )
+
+        [profile] = sink.profiles
+        assert profile.task_id == "profiled-task-id"
+        assert profile.format == "pstats"
+        assert profile.duration >= 0
+        stats = marshal.loads(profile.data)
+        assert any(func[2] == "add_numbers" for func in stats)
+
+    @pytest.mark.django_db
+    def test_sampler_writes_collapsed_stacks_to_directory(self, tmp_path):
+        from django_tasks_cloud_tasks.executor import execute_task_from_payload
+        from tests.tasks import sleeping_task
+
+        config = {
+            "SAMPLE_RATE": 1.0,
+            "PROFILER": "sampler",
+            "SAMPLER_INTERVAL": 0.001,
+            "OUTPUT_DIR": str(tmp_path),
+        }
+        with override_settings(CLOUD_TASKS_PROFILING=config):
+            execute_task_from_payload(
+                make_payload(sleeping_task.module_path, [0.05]), "worker"
+            )
+
+        [collapsed] = tmp_path.glob("*.collapsed")
+        assert "sleeping_task" in collapsed.read_text()
+        [metadata] = tmp_path.glob("*.json")
+        data = json.loads(metadata.read_text())
+        assert data["task_id"] == "profiled-task-id"
+        assert data["duration"] >= 0.05
+
+    @pytest.mark.django_db
+    def test_sink_errors_do_not_fail_task(self):
+        from django_tasks_cloud_tasks.executor import execute_task_from_payload
+        from tests.tasks import add_numbers
+
+        def broken_sink(profile):
+            raise OSError("disk full")
+
+        config = {"SAMPLE_RATE": 1.0, "SINK": broken_sink}
+        with override_settings(CLOUD_TASKS_PROFILING=config):
+            _, success = execute_task_from_payload(
+                make_payload(add_numbers.module_path, [1, 2]), "worker"
+            )
+
+        assert success is True
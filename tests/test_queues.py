@@ -0,0 +1,232 @@
+"""Tests for queues.py and the cloudtasks_sync_queues command"""
+
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from google.api_core import exceptions
+from google.cloud import tasks_v2
+
+from django_tasks_cloud_tasks.queues import (
+    diff_queue,
+    parse_queue_definitions,
+    sync_queues,
+)
+
+QUEUE_PATH = "projects/test-project/locations/us-central1/queues/default"
+
+
+def make_queue(**rate_limits):
+    return tasks_v2.Queue(
+        name=QUEUE_PATH,
+        rate_limits={
+            "max_dispatches_per_second": 500.0,
+            "max_concurrent_dispatches": 1000,
+            "max_burst_size": 100,
+            **rate_limits,
+        },
+        retry_config={"max_attempts": 100, "min_backoff": timedelta(seconds=0.1)},
+    )
+
+
+def make_client(queue=None):
+    client = MagicMock()
+    client.queue_path.side_effect = lambda project, location, queue_name: (
+        f"projects/{project}/locations/{location}/queues/{queue_name}"
+    )
+    client.common_location_path.side_effect = lambda project, location: (
+        f"projects/{project}/locations/{location}"
+    )
+    if queue is None:
+        client.get_queue.side_effect = exceptions.NotFound("queue")
+    else:
+        client.get_queue.return_value = queue
+    return client
+
+
+@pytest.fixture
+def backend(settings):
+    from django.tasks import task_backends
+
+    settings.TASKS = {
+        "default": {
+            "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+            "QUEUES": [],
+            "OPTIONS": {
+                "CLOUD_TASKS_PROJECT": "test-project",
+                "CLOUD_TASKS_LOCATION": "us-central1",
+                "TASK_HANDLER_HOST": "https://test.example.com",
+                "QUEUE_DEFINITIONS": {
+                    "default": {
+                        "max_dispatches_per_second": 50,
+                        "max_concurrent_dispatches": 1000,
+                        "min_backoff": 0.1,
+                        "dispatch_deadline": 600,
+                    },
+                },
+            },
+        },
+    }
+    return task_backends["default"]
+
+
+class TestParseQueueDefinitions:
+    def test_converts_durations(self):
+        definitions = parse_queue_definitions(
+            {"default": {"min_backoff": 0.5, "max_retry_duration": timedelta(hours=1)}}
+        )
+
+        assert definitions["default"] == {
+            "min_backoff": timedelta(seconds=0.5),
+            "max_retry_duration": timedelta(hours=1),
+        }
+
+    def test_rejects_unknown_keys(self):
+        with pytest.raises(ImproperlyConfigured, match="max_rate"):
+            parse_queue_definitions({"default": {"max_rate": 10}})
+
+    def test_rejects_negative_durations(self):
+        with pytest.raises(ImproperlyConfigured, match="must not be negative"):
+            parse_queue_definitions({"default": {"max_backoff": -1}})
+
+
+class TestDiffQueue:
+    def test_reports_only_differences(self):
+        definition = parse_queue_definitions(
+            {"q": {"max_dispatches_per_second": 50, "min_backoff": 0.1}}
+        )["q"]
+
+        changes, warnings = diff_queue(make_queue(), definition)
+
+        assert changes == {"rate_limits.max_dispatches_per_second": (500.0, 50)}
+        assert warnings == []
+
+    def test_max_burst_size_is_reported_as_warning(self):
+        changes, warnings = diff_queue(make_queue(), {"max_burst_size": 10})
+
+        assert changes == {}
+        assert "max_burst_size" in warnings[0]
+
+
+class TestSyncQueues:
+    def test_updates_changed_fields(self, backend):
+        client = make_client(make_queue())
+
+        (result,) = sync_queues(backend, client=client)
+
+        assert result.action == "updated"
+        client.update_queue.assert_called_once()
+        kwargs = client.update_queue.call_args.kwargs
+        assert kwargs["update_mask"] == {
+            "paths": ["rate_limits.max_dispatches_per_second"]
+        }
+        assert kwargs["queue"].rate_limits.max_dispatches_per_second == 50
+        assert kwargs["queue"].name == QUEUE_PATH
+
+    def test_is_idempotent(self, backend):
+        client = make_client(make_queue(max_dispatches_per_second=50.0))
+
+        (result,) = sync_queues(backend, client=client)
+
+        assert result.action == "unchanged"
+        client.update_queue.assert_not_called()
+
+    def test_creates_missing_queue(self, backend):
+        client = make_client()
+
+        (result,) = sync_queues(backend, client=client)
+
+        assert result.action == "created"
+        kwargs = client.create_queue.call_args.kwargs
+        assert kwargs["parent"] == "projects/test-project/locations/us-central1"
+        assert kwargs["queue"].retry_config.min_backoff == timedelta(seconds=0.1)
+
+    def test_dry_run_does_not_apply(self, backend):
+        client = make_client(make_queue())
+
+        (result,) = sync_queues(backend, client=client, dry_run=True)
+
+        assert result.action == "updated"
+        client.update_queue.assert_not_called()
+
+    def test_errors_are_reported_per_queue(self, backend):
+        client = make_client(make_queue())
+        client.update_queue.side_effect = exceptions.PermissionDenied("denied")
+
+        (result,) = sync_queues(backend, client=client)
+
+        assert result.action == "error"
+        assert "PermissionDenied" in result.error
+
+    def test_syncs_every_location(self, backend, settings):
+        from django.tasks import task_backends
+
+        default = settings.TASKS["default"]
+        options = {
+            **default["OPTIONS"],
+            "CLOUD_TASKS_LOCATIONS": ["us-central1", "us-east1"],
+        }
+        del options["CLOUD_TASKS_LOCATION"]
+        settings.TASKS = {"default": {**default, "OPTIONS": options}}
+        client = make_client(make_queue())
+
+        results = sync_queues(task_backends["default"], client=client)
+
+        assert [(r.location, r.queue_name) for r in results] == [
+            ("us-central1", "default"),
+            ("us-east1", "default"),
+        ]
+        assert [
+            call.kwargs["queue"].name for call in client.update_queue.call_args_list
+        ] == [QUEUE_PATH, QUEUE_PATH.replace("us-central1", "us-east1")]
+
+    def test_rejects_undefined_queues(self, backend):
+        with pytest.raises(ValueError, match="other"):
+            sync_queues(backend, queue_names=["other"], client=make_client())
+
+
+class TestSyncQueuesCommand:
+    def test_outputs_json(self, backend):
+        client = make_client(make_queue())
+        out = StringIO()
+
+        with patch(
+            "django_tasks_cloud_tasks.backends.create_tasks_client",
+            return_value=client,
+        ):
+            call_command("cloudtasks_sync_queues", "--dry-run", "--json", stdout=out)
+
+        output = json.loads(out.getvalue())
+        assert output["default"][0]["action"] == "updated"
+        assert output["default"][0]["changes"] == {
+            "rate_limits.max_dispatches_per_second": [500.0, 50]
+        }
+
+    def test_fails_on_errors(self, backend):
+        client = make_client(make_queue())
+        client.update_queue.side_effect = exceptions.PermissionDenied("denied")
+
+        with patch(
+            "django_tasks_cloud_tasks.backends.create_tasks_client",
+            return_value=client,
+        ):
+            with pytest.raises(CommandError):
+                call_command("cloudtasks_sync_queues", stdout=StringIO())
+
+    def test_rejects_undefined_queue_option(self, backend):
+        client = make_client(make_queue())
+
+        with patch(
+            "django_tasks_cloud_tasks.backends.create_tasks_client",
+            return_value=client,
+        ):
+            with pytest.raises(CommandError, match="typo"):
+                call_command(
+                    "cloudtasks_sync_queues", "--queue", "typo", stdout=StringIO()
+                )
+
+        client.get_queue.assert_not_called()
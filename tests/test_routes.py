@@ -0,0 +1,160 @@
+"""Tests for routes.py and per-task handler routing"""
+
+from unittest.mock import patch
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.tasks import task_backends
+from django.test import override_settings
+
+from django_tasks_cloud_tasks.backends import CloudTasksBackend
+from tests.tasks import add_numbers, heavy_task, simple_task
+
+HEAVY_HOST = "https://heavy-worker.example.com"
+REPORTS_HOST = "https://reports-worker.example.com"
+
+
+def make_tasks(routes):
+    return {
+        "default": {
+            "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+            "QUEUES": ["default", "reports"],
+            "OPTIONS": {
+                "CLOUD_TASKS_PROJECT": "test-project",
+                "CLOUD_TASKS_LOCATION": "us-central1",
+                "TASK_HANDLER_HOST": "https://test.example.com",
+                "OIDC_SERVICE_ACCOUNT_EMAIL": "tasks@test-project.iam.gserviceaccount.com",
+                "ROUTES": routes,
+            },
+        },
+    }
+
+
+ROUTES = {
+    "heavy": {
+        "TASK_HANDLER_HOST": HEAVY_HOST,
+        "TASKS": ["tests.tasks.simple_task"],
+    },
+    "reports": {
+        "TASK_HANDLER_HOST": REPORTS_HOST,
+        "TASK_HANDLER_PATH": "/tasks/",
+        "OIDC_AUDIENCE": "reports-audience",
+        "OIDC_SERVICE_ACCOUNT_EMAIL": "reports@test-project.iam.gserviceaccount.com",
+        "QUEUES": ["reports"],
+    },
+}
+
+
+def sent_request(mock_client_class):
+    return mock_client_class.return_value.create_task.call_args.kwargs["task"][
+        "http_request"
+    ]
+
+
+@patch("google.cloud.tasks_v2.CloudTasksClient")
+class TestRouting:
+    @pytest.fixture(autouse=True)
+    def routes(self):
+        with override_settings(TASKS=make_tasks(ROUTES)):
+            yield
+
+    def test_unrouted_task_uses_default_service(self, mock_client_class):
+        add_numbers.enqueue(1, 2)
+
+        http_request = sent_request(mock_client_class)
+        assert http_request["url"] == "https://test.example.com/cloudtasks/execute/"
+        assert http_request["oidc_token"]["audience"] == "https://test.example.com"
+
+    def test_routed_by_task_path(self, mock_client_class):
+        simple_task.enqueue(1)
+
+        http_request = sent_request(mock_client_class)
+        assert http_request["url"] == f"{HEAVY_HOST}/cloudtasks/execute/"
+        assert http_request["oidc_token"] == {
+            "service_account_email": "tasks@test-project.iam.gserviceaccount.com",
+            "audience": HEAVY_HOST,
+        }
+
+    def test_routed_by_queue(self, mock_client_class):
+        add_numbers.using(queue_name="reports").enqueue(1, 2)
+
+        http_request = sent_request(mock_client_class)
+        assert http_request["url"] == f"{REPORTS_HOST}/tasks/"
+        assert http_request["oidc_token"] == {
+            "service_account_email": "reports@test-project.iam.gserviceaccount.com",
+            "audience": "reports-audience",
+        }
+
+    def test_route_named_by_task_wins(self, mock_client_class):
+        heavy_task.using(queue_name="reports").enqueue(1)
+
+        assert sent_request(mock_client_class)["url"] == (
+            f"{HEAVY_HOST}/cloudtasks/execute/"
+        )
+
+    def test_task_path_wins_over_queue(self, mock_client_class):
+        simple_task.using(queue_name="reports").enqueue(1)
+
+        assert sent_request(mock_client_class)["url"] == (
+            f"{HEAVY_HOST}/cloudtasks/execute/"
+        )
+
+
+class TestRouteConfiguration:
+    def test_unknown_route_of_task(self):
+        with override_settings(TASKS=make_tasks({})):
+            with pytest.raises(ImproperlyConfigured, match="unknown route 'heavy'"):
+                task_backends["default"].task_router.resolve(heavy_task)
+
+    def test_unknown_keys(self):
+        routes = {"heavy": {"TASK_HANDLER_HOST": HEAVY_HOST, "QUEUE": ["reports"]}}
+
+        with pytest.raises(ImproperlyConfigured, match="Unknown keys"):
+            CloudTasksBackend("default", make_tasks(routes)["default"])
+
+    def test_host_required(self):
+        with pytest.raises(ImproperlyConfigured, match="requires TASK_HANDLER_HOST"):
+            CloudTasksBackend("default", make_tasks({"heavy": {}})["default"])
+
+    def test_app_engine_route(self):
+        routes = {
+            "batch": {
+                "APP_ENGINE_ROUTING": {"service": "batch", "version": ""},
+                "TASK_HANDLER_PATH": "/tasks/",
+            }
+        }
+
+        backend = CloudTasksBackend("default", make_tasks(routes)["default"])
+
+        route = backend.task_router.routes["batch"]
+        assert route.url == "/tasks/"
+        assert route.app_engine_routing == {"service": "batch"}
+        assert route.oidc_service_account_email is None
+
+    def test_http_route_keeps_oidc_with_app_engine_default(self):
+        tasks = make_tasks(ROUTES)
+        tasks["default"]["OPTIONS"]["APP_ENGINE_TARGET"] = True
+
+        backend = CloudTasksBackend("default", tasks["default"])
+
+        assert backend.task_router.default.app_engine_routing is not None
+        route = backend.task_router.routes["heavy"]
+        assert route.oidc_service_account_email == (
+            "tasks@test-project.iam.gserviceaccount.com"
+        )
+        assert route.oidc_audience == HEAVY_HOST
+
+    def test_task_in_two_routes(self):
+        routes = {
+            "a": {
+                "TASK_HANDLER_HOST": HEAVY_HOST,
+                "TASKS": ["tests.tasks.simple_task"],
+            },
+            "b": {
+                "TASK_HANDLER_HOST": REPORTS_HOST,
+                "TASKS": ["tests.tasks.simple_task"],
+            },
+        }
+
+        with pytest.raises(ImproperlyConfigured, match="both"):
+            CloudTasksBackend("default", make_tasks(routes)["default"])
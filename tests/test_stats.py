@@ -0,0 +1,160 @@
+"""Tests for stats.py and the cloudtasks_stats command"""
+
+import json
+from datetime import UTC, datetime, timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.management import CommandError, call_command
+from google.api_core import exceptions
+from google.cloud import tasks_v2, tasks_v2beta3
+
+from django_tasks_cloud_tasks.stats import format_table, get_queue_stats
+
+
+def make_client(tasks=()):
+    client = MagicMock()
+    client.queue_path.side_effect = lambda project, location, queue_name: (
+        f"projects/{project}/locations/{location}/queues/{queue_name}"
+    )
+    client.get_queue.return_value = tasks_v2.Queue(
+        state=tasks_v2.Queue.State.RUNNING,
+        rate_limits={"max_dispatches_per_second": 10.0, "max_concurrent_dispatches": 5},
+        retry_config={"max_attempts": 3},
+    )
+    client.list_tasks.return_value = iter(tasks)
+    return client
+
+
+def make_task(age, dispatch_count=0):
+    return tasks_v2.Task(
+        schedule_time=datetime.now(UTC) - timedelta(seconds=age),
+        dispatch_count=dispatch_count,
+    )
+
+
+@pytest.fixture
+def backend():
+    from django.tasks import task_backends
+
+    return task_backends["default"]
+
+
+class TestGetQueueStats:
+    def test_lists_tasks(self, backend):
+        client = make_client([make_task(30, 2), make_task(120), make_task(5, 1)])
+
+        (stats,) = get_queue_stats(backend, client=client)
+
+        assert stats.queue_name == "default"
+        assert stats.state == "RUNNING"
+        assert stats.max_dispatches_per_second == 10.0
+        assert stats.max_attempts == 3
+        assert stats.tasks_count == 3
+        assert not stats.truncated
+        assert stats.dispatch_attempts == 3
+        assert stats.retried_tasks == 2
+        assert stats.max_dispatch_count == 2
+        assert 119 < stats.backlog_seconds < 130
+        assert client.list_tasks.call_args.kwargs["request"]["page_size"] == 1000
+
+    def test_caps_listed_tasks(self, backend):
+        client = make_client([make_task(1)] * 5)
+
+        (stats,) = get_queue_stats(backend, client=client, max_tasks=3)
+
+        assert stats.tasks_count == 3
+        assert stats.truncated
+        assert format_table([stats]).splitlines()[1].split()[2] == ">=3"
+
+    def test_reads_queue_stats(self, backend):
+        client = make_client()
+        stats_client = MagicMock()
+        stats_client.get_queue.return_value = tasks_v2beta3.Queue(
+            stats={
+                "tasks_count": 1234,
+                "oldest_estimated_arrival_time": datetime.now(UTC)
+                - timedelta(minutes=5),
+                "effective_execution_rate": 7.5,
+            }
+        )
+
+        (stats,) = get_queue_stats(
+            backend, method="stats", client=client, stats_client=stats_client
+        )
+
+        assert stats.tasks_count == 1234
+        assert stats.effective_execution_rate == 7.5
+        assert 299 < stats.backlog_seconds < 310
+        assert stats_client.get_queue.call_args.kwargs["request"]["read_mask"] == (
+            "stats"
+        )
+        client.list_tasks.assert_not_called()
+
+    def test_reports_errors_per_queue(self, backend):
+        client = make_client()
+        client.get_queue.side_effect = exceptions.NotFound("queue")
+
+        (stats,) = get_queue_stats(backend, client=client)
+
+        assert "NotFound" in stats.error
+
+    def test_reads_every_location(self):
+        from django.test import override_settings
+
+        tasks = {
+            "default": {
+                "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+                "QUEUES": ["default"],
+                "OPTIONS": {
+                    "CLOUD_TASKS_PROJECT": "test-project",
+                    "CLOUD_TASKS_LOCATIONS": ["us-central1", "us-east1"],
+                    "TASK_HANDLER_HOST": "https://test.example.com",
+                },
+            },
+        }
+        client = make_client()
+
+        with override_settings(TASKS=tasks):
+            from django.tasks import task_backends
+
+            stats_list = get_queue_stats(task_backends["default"], client=client)
+
+        assert [(s.location, s.queue_name) for s in stats_list] == [
+            ("us-central1", "default"),
+            ("us-east1", "default"),
+        ]
+        assert format_table(stats_list).startswith("LOCATION")
+
+
+class TestStatsCommand:
+    def test_outputs_json(self):
+        client = make_client([make_task(60)])
+        out = StringIO()
+
+        with patch(
+            "django_tasks_cloud_tasks.backends.create_tasks_client",
+            return_value=client,
+        ):
+            call_command("cloudtasks_stats", "--json", stdout=out)
+
+        (stats,) = json.loads(out.getvalue())
+        assert stats["queue_name"] == "default"
+        assert stats["tasks_count"] == 1
+        assert stats["oldest_schedule_time"]
+
+    def test_outputs_table_and_fails_on_errors(self):
+        client = make_client()
+        client.get_queue.side_effect = exceptions.PermissionDenied("denied")
+        out = StringIO()
+
+        with patch(
+            "django_tasks_cloud_tasks.backends.create_tasks_client",
+            return_value=client,
+        ):
+            with pytest.raises(CommandError):
+                call_command("cloudtasks_stats", stdout=out)
+
+        assert out.getvalue().startswith("QUEUE")
+        assert "PermissionDenied" in out.getvalue()
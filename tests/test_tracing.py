@@ -0,0 +1,194 @@
+"""Tests for tracing.py"""
+
+import json
+import logging
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.test import RequestFactory, override_settings
+
+from django_tasks_cloud_tasks import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{SPAN_ID}-01"
+
+TASKS = {
+    "default": {
+        "BACKEND": "django_tasks_cloud_tasks.CloudTasksBackend",
+        "QUEUES": ["default"],
+        "OPTIONS": {
+            "CLOUD_TASKS_PROJECT": "test-project",
+            "CLOUD_TASKS_LOCATION": "us-central1",
+            "TASK_HANDLER_HOST": "https://test.example.com",
+        },
+    },
+}
+
+
+@pytest.fixture
+def without_otel():
+    with patch("django_tasks_cloud_tasks.tracing._get_otel", return_value=None):
+        yield
+
+
+@pytest.fixture
+def span_exporter():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    otel = (propagate, trace, provider.get_tracer(tracing.TRACER_NAME))
+    with patch("django_tasks_cloud_tasks.tracing._get_otel", return_value=otel):
+        yield exporter
+
+
+def make_request(headers=None):
+    from tests.tasks import simple_task
+
+    payload = {
+        "task_id": "trace-task-id",
+        "task_path": simple_task.module_path,
+        "args": [5],
+        "kwargs": {},
+        "queue_name": "default",
+        "backend": "default",
+        "enqueued_at": "2024-01-01T00:00:00+00:00",
+    }
+    return RequestFactory().post(
+        "/cloudtasks/execute/",
+        data=json.dumps(payload),
+        content_type="application/json",
+        headers=headers or {},
+    )
+
+
+class TestTraceInfo:
+    def test_parses_traceparent(self):
+        trace_info = tracing.TraceInfo.from_headers(
+            {"traceparent": TRACEPARENT, "tracestate": "vendor=value"}
+        )
+
+        assert trace_info.trace_id == TRACE_ID
+        assert trace_info.span_id == SPAN_ID
+        assert trace_info.sampled is True
+        assert trace_info.tracestate == "vendor=value"
+        assert trace_info.traceparent == TRACEPARENT
+
+    def test_falls_back_to_cloud_trace_context(self):
+        trace_info = tracing.TraceInfo.from_headers(
+            {"X-Cloud-Trace-Context": f"{TRACE_ID}/{int(SPAN_ID, 16)};o=1"}
+        )
+
+        assert trace_info.trace_id == TRACE_ID
+        assert trace_info.span_id == SPAN_ID
+        assert trace_info.cloud_trace_context == f"{TRACE_ID}/{int(SPAN_ID, 16)};o=1"
+
+    def test_invalid_headers_are_ignored(self):
+        assert tracing.TraceInfo.from_headers({"traceparent": "garbage"}) is None
+        assert (
+            tracing.TraceInfo.from_headers(
+                {"traceparent": f"00-{'0' * 32}-{SPAN_ID}-01"}
+            )
+            is None
+        )
+
+
+class TestWithoutOpenTelemetry:
+    def test_enqueue_inside_task_joins_its_trace(self, without_otel):
+        headers = {}
+
+        with tracing.continue_trace({"traceparent": TRACEPARENT}):
+            with tracing.span("cloudtasks.execute"):
+                tracing.inject_trace_headers(headers)
+
+        assert headers == {"traceparent": TRACEPARENT}
+        assert tracing.get_current_trace() is None
+
+    def test_log_filter_adds_cloud_logging_trace(self, without_otel):
+        record = logging.makeLogRecord({"msg": "message"})
+        log_filter = tracing.TraceLogFilter(project_id="my-project")
+
+        with tracing.continue_trace({"traceparent": TRACEPARENT}):
+            log_filter.filter(record)
+
+        assert record.trace == f"projects/my-project/traces/{TRACE_ID}"
+        assert record.span_id == SPAN_ID
+        assert record.trace_sampled is True
+
+    @pytest.mark.django_db
+    def test_task_runs_with_request_trace(self, without_otel):
+        from django_tasks_cloud_tasks.executor import execute_task_from_payload
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+
+        seen = []
+
+        def execute(*args):
+            seen.append(tracing.get_current_trace())
+            return execute_task_from_payload(*args)
+
+        with patch(
+            "django_tasks_cloud_tasks.handler.execute_task_from_payload",
+            side_effect=execute,
+        ):
+            response = ExecuteTaskView.as_view()(
+                make_request({"traceparent": TRACEPARENT})
+            )
+
+        assert response.status_code == 200
+        assert seen[0].trace_id == TRACE_ID
+
+
+class TestWithOpenTelemetry:
+    @pytest.mark.django_db
+    def test_view_continues_trace_with_spans(self, span_exporter):
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+
+        auth_handler = MagicMock(return_value=(True, None))
+        with patch(
+            "django_tasks_cloud_tasks.views.get_default_auth_handler",
+            return_value=auth_handler,
+        ):
+            response = ExecuteTaskView.as_view()(
+                make_request({"traceparent": TRACEPARENT})
+            )
+
+        assert response.status_code == 200
+        spans = {span.name: span for span in span_exporter.get_finished_spans()}
+        assert set(spans) == {
+            "cloudtasks.dispatch",
+            "cloudtasks.auth",
+            "cloudtasks.deserialize",
+            "cloudtasks.execute",
+        }
+        dispatch = spans["cloudtasks.dispatch"]
+        assert f"{dispatch.context.trace_id:032x}" == TRACE_ID
+        assert f"{dispatch.parent.span_id:016x}" == SPAN_ID
+        assert spans["cloudtasks.execute"].parent.span_id == dispatch.context.span_id
+        assert spans["cloudtasks.execute"].attributes["cloudtasks.task_id"] == (
+            "trace-task-id"
+        )
+
+    @pytest.mark.django_db
+    @override_settings(TASKS=TASKS)
+    @patch("google.cloud.tasks_v2.CloudTasksClient")
+    def test_enqueue_injects_traceparent(self, mock_client_class, span_exporter):
+        from tests.tasks import add_numbers
+
+        mock_client = MagicMock()
+        mock_client_class.return_value = mock_client
+
+        _, _, tracer = tracing._get_otel()
+        with tracer.start_as_current_span("request") as span:
+            add_numbers.enqueue(1, 2)
+
+        task_request = mock_client.create_task.call_args.kwargs["task"]
+        traceparent = task_request["http_request"]["headers"]["traceparent"]
+        assert traceparent.split("-")[1] == f"{span.get_span_context().trace_id:032x}"
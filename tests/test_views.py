@@ -157,7 +157,7 @@ class TestExecuteTaskView:
 
         # Mock the auth handler to reject the request
         with patch(
-            "django_tasks_cloud_tasks.auth.create_oidc_auth_handler"
+            "django_tasks_cloud_tasks.auth.get_oidc_auth_handler"
         ) as mock_create:
             mock_handler = MagicMock(
                 return_value=(False, "Missing or invalid Authorization header")
@@ -170,3 +170,35 @@ class TestExecuteTaskView:
             assert response.status_code == 401
             data = json.loads(response.content)
             assert data["error"] == "Unauthorized"
+
+    @override_settings(CLOUD_TASKS_HMAC_KEYS={"k1": "secret"})
+    def test_hmac_signature_required_when_keys_configured(self):
+        from django_tasks_cloud_tasks.auth import HMAC_SIGNATURE_HEADER, sign_payload
+        from django_tasks_cloud_tasks.views import ExecuteTaskView
+        from tests.tasks import simple_task
+
+        factory = RequestFactory()
+        body = json.dumps(
+            {
+                "task_id": "view-test-task-hmac",
+                "task_path": simple_task.module_path,
+                "args": [2],
+                "kwargs": {},
+                "queue_name": "default",
+                "backend": "default",
+            }
+        ).encode()
+        view = ExecuteTaskView.as_view()
+
+        unsigned = factory.post(
+            "/tasks/execute/", data=body, content_type="application/json"
+        )
+        assert view(unsigned).status_code == 401
+
+        signed = factory.post(
+            "/tasks/execute/",
+            data=body,
+            content_type="application/json",
+            headers={HMAC_SIGNATURE_HEADER: sign_payload(body, "k1", "secret")},
+        )
+        assert view(signed).status_code == 200
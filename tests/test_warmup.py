@@ -0,0 +1,88 @@
+"""Tests for warmup.py"""
+
+import json
+from unittest.mock import patch
+
+from django.test import RequestFactory, override_settings
+
+
+class TestWarmup:
+    def test_records_duration_for_each_stage(self):
+        from django_tasks_cloud_tasks.warmup import warmup
+
+        calls = []
+        stages = [
+            ("first", lambda: calls.append("first")),
+            ("second", lambda: calls.append("second")),
+        ]
+
+        results = warmup(stages)
+
+        assert calls == ["first", "second"]
+        assert [r["name"] for r in results] == ["first", "second"]
+        assert all(r["duration_ms"] >= 0 for r in results)
+        assert all("error" not in r for r in results)
+
+    def test_failing_stage_does_not_stop_others(self):
+        from django_tasks_cloud_tasks.warmup import warmup
+
+        def failing():
+            raise RuntimeError("metadata unreachable")
+
+        results = warmup([("failing", failing), ("next", lambda: None)])
+
+        assert results[0]["error"] == "metadata unreachable"
+        assert "error" not in results[1]
+
+    @override_settings(CLOUD_TASKS_WARMUP_TASK_MODULES=["tests.tasks"])
+    def test_default_stages_run_without_oidc_audience(self):
+        from django_tasks_cloud_tasks.warmup import warmup
+
+        with patch(
+            "django_tasks_cloud_tasks.detection._get_metadata", return_value=None
+        ):
+            with patch("django_tasks_cloud_tasks.auth.prefetch_oidc_certs") as mock:
+                results = warmup()
+
+        mock.assert_not_called()
+        assert [r["name"] for r in results] == [
+            "import_tasks_client",
+            "import_oidc",
+            "fetch_oidc_certs",
+            "detect_environment",
+            "import_task_modules",
+        ]
+        assert all("error" not in r for r in results)
+
+
+class TestWarmupView:
+    def test_returns_200_with_stage_timings(self):
+        from django_tasks_cloud_tasks.views import WarmupView
+
+        request = RequestFactory().get("/cloudtasks/warmup/")
+        with patch(
+            "django_tasks_cloud_tasks.warmup.warmup",
+            return_value=[{"name": "import_oidc", "duration_ms": 1.5}],
+        ):
+            response = WarmupView.as_view()(request)
+
+        assert response.status_code == 200
+        data = json.loads(response.content)
+        assert data["status"] == "ok"
+        assert data["total_ms"] == 1.5
+        assert data["stages"][0]["name"] == "import_oidc"
+
+    def test_returns_503_when_stage_failed(self):
+        from django_tasks_cloud_tasks.views import WarmupView
+
+        request = RequestFactory().get("/cloudtasks/warmup/")
+        with patch(
+            "django_tasks_cloud_tasks.warmup.warmup",
+            return_value=[
+                {"name": "fetch_oidc_certs", "duration_ms": 2.0, "error": "timeout"}
+            ],
+        ):
+            response = WarmupView.as_view()(request)
+
+        assert response.status_code == 503
+        assert json.loads(response.content)["status"] == "error"
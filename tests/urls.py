@@ -0,0 +1,7 @@
+"""URL configuration for testing."""
+
+from django.urls import include, path
+
+urlpatterns = [
+    path("cloudtasks/", include("django_tasks_cloud_tasks.urls")),
+]